@@ -1,7 +1,10 @@
 import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
 from typing import List, Optional, Any, Dict
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -13,16 +16,67 @@ from src.document_ingestion.data_ingestion import (
     ChatIngestor,
 )
 from src.document_analyzer.data_analysis import DocumentAnalyzer
+from model.models import AnalysisMode
 from src.document_compare.document_comparator import DocumentComparatorLLM
 from src.document_chat.retrieval import ConversationalRAG
+from src.document_chat.rerank import SEARCH_TYPES, SIMILARITY
+from src.document_ingestion.sharded_index import CollectionRetriever, get_collection
+from src.document_ingestion.jobs import QUEUED, ProgressReporter, get_ingestion_jobs
+from src.document_ingestion.sessions import (
+    ANALYSIS,
+    AREAS,
+    CHAT_INDEX,
+    COLLECTION,
+    COMPARE,
+    UPLOADS,
+    SessionPolicy,
+    default_roots,
+    get_session_catalog,
+    sweep_forever,
+)
+from utils.model_loader import get_model_registry
+from exception.custom_exception import IngestionQueueFullError, UploadTooLargeError
+from utils.vectorstore_cache import get_vectorstore_cache
+from src.document_chat.cache import get_chat_cache
+from utils.result_cache import get_result_cache
+from utils.concurrency import run_blocking, shutdown_executors
+from utils.embedding_cache import CachedEmbeddings
+from utils.metrics import CONTENT_TYPE, get_metrics
 
 FAISS_BASE = os.getenv("FAISS_BASE", "faiss_index")
 UPLOAD_BASE = os.getenv("UPLOAD_BASE", "data")
 FAISS_INDEX_NAME = os.getenv(
     "FAISS_INDEX_NAME", "index"
-)  # <--- keep consistent with save_local()
+)  # <--- keep consistent with save_store()
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse config and build pooled model clients once per worker
+    registry = get_model_registry()
+    registry.warm_up()
+    app.state.model_registry = registry
+    # Opens the job table and fails jobs orphaned by a previous process
+    get_ingestion_jobs()
+    catalog = get_session_catalog()
+    if catalog.created_new:
+        await run_blocking("io", catalog.backfill, default_roots())
+    sweeper = asyncio.create_task(
+        sweep_forever(
+            catalog,
+            SessionPolicy.from_config(registry.config),
+            busy=lambda: get_ingestion_jobs().active_sessions(),
+            on_delete=_on_session_delete,
+        )
+    )
+    yield
+    sweeper.cancel()
+    shutdown_executors()
+    await registry.aclose()
 
-app = FastAPI(title="Document Portal API", version="0.1")
+
+app = FastAPI(title="Document Portal API", version="0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,18 +102,50 @@ def health() -> Dict[str, str]:
     return {"status": "ok", "service": "document-portal"}
 
 
+@app.post("/admin/config/reload")
+def reload_config() -> Dict[str, Any]:
+    try:
+        config = get_model_registry().reload()
+        # Cached stores still hold the old embedding client: reload them on next use
+        dropped = get_vectorstore_cache().clear()
+        return {
+            "status": "reloaded",
+            "config_keys": list(config.keys()),
+            "vectorstores_dropped": dropped,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Config reload failed: {e}")
+
+
 # ---------- ANALYZE ----------
 @app.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)) -> Any:
+async def analyze_document(
+    file: UploadFile = File(...), mode: Optional[str] = Form(None)
+) -> Any:
     try:
+        if mode and mode not in {m.value for m in AnalysisMode}:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown analysis mode '{mode}'. Use one of: "
+                + ", ".join(m.value for m in AnalysisMode),
+            )
         dh = DocHandler()
-        saved_path = dh.save_pdf(FastAPIFileAdapter(file))
-        text = _read_pdf_via_handler(dh, saved_path)
+        saved_path = await run_blocking("io", dh.save_pdf, FastAPIFileAdapter(file))
+        await run_blocking("io", get_session_catalog().record, ANALYSIS, dh.session_id, dh.session_path)
+        text = await run_blocking("cpu", _read_pdf_via_handler, dh, saved_path)
         analyzer = DocumentAnalyzer()
-        result = analyzer.analyze_document(text)
-        return JSONResponse(content=result)
+        result = await analyzer.aanalyze_document(text, mode=mode)
+        return JSONResponse(
+            content={
+                **result,
+                "mode": analyzer.last_mode,
+                "cache_hit": analyzer.last_cache_hit,
+            }
+        )
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=e.error_message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
@@ -71,20 +157,78 @@ async def compare_documents(
 ) -> Any:
     try:
         dc = DocumentComparator()
-        ref_path, act_path = dc.save_uploaded_files(
-            FastAPIFileAdapter(reference), FastAPIFileAdapter(actual)
+        ref_path, act_path = await run_blocking(
+            "io",
+            dc.save_uploaded_files,
+            FastAPIFileAdapter(reference),
+            FastAPIFileAdapter(actual),
         )
-        _ = ref_path, act_path
-        combined_text = dc.combine_documents()
+        await run_blocking("io", get_session_catalog().record, COMPARE, dc.session_id, dc.session_path)
         comp = DocumentComparatorLLM()
-        df = comp.compare_documents(combined_text)
-        return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
+        cmp_cfg = get_model_registry().config.get("comparison", {}) or {}
+        if cmp_cfg.get("page_prefilter", True):
+            ref_pages = await run_blocking("cpu", dc.read_pages, ref_path)
+            act_pages = await run_blocking("cpu", dc.read_pages, act_path)
+            df = await comp.acompare_pages(ref_pages, act_pages)
+        else:
+            combined_text = await run_blocking("cpu", dc.combine_documents)
+            df = await comp.acompare_documents(combined_text)
+        return {
+            "rows": df.to_dict(orient="records"),
+            "session_id": dc.session_id,
+            "cache_hit": comp.last_cache_hit,
+            "diff": comp.last_diff_stats,
+        }
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=e.error_message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
 
 
+@app.post("/compare/stream")
+async def compare_documents_stream(
+    reference: UploadFile = File(...), actual: UploadFile = File(...)
+) -> Any:
+    """
+    NDJSON stream of the windowed page comparison: a `plan` line, then a
+    `rows` line per window as soon as it finishes, then `done`.
+    """
+    try:
+        dc = DocumentComparator()
+        ref_path, act_path = await run_blocking(
+            "io",
+            dc.save_uploaded_files,
+            FastAPIFileAdapter(reference),
+            FastAPIFileAdapter(actual),
+        )
+        await run_blocking("io", get_session_catalog().record, COMPARE, dc.session_id, dc.session_path)
+        ref_pages = await run_blocking("cpu", dc.read_pages, ref_path)
+        act_pages = await run_blocking("cpu", dc.read_pages, act_path)
+        comp = DocumentComparatorLLM()
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=e.error_message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
+
+    async def ndjson_stream():
+        yield _ndjson("session", {"session_id": dc.session_id})
+        try:
+            async for event in comp.astream_pages(ref_pages, act_pages):
+                yield _ndjson(event["event"], event["data"])
+        except Exception as e:
+            yield _ndjson("error", {"detail": f"Comparison failed: {e}"})
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ---------- CHAT: INDEX ----------
 @app.post("/chat/index")
 async def chat_build_index(
@@ -94,7 +238,14 @@ async def chat_build_index(
     chunk_size: int = Form(1000),
     chunk_overlap: int = Form(200),
     k: int = Form(5),
+    collection: bool = Form(False),
+    tenant_id: Optional[str] = Form(None),
+    wait: bool = Form(False),
 ) -> Any:
+    """
+    Save the uploads, then index them in a background job and return its id
+    (202; poll GET /chat/index/{job_id}). wait=true indexes inside the request.
+    """
     try:
         wrapped = [FastAPIFileAdapter(f) for f in files]
         ci = ChatIngestor(
@@ -103,22 +254,100 @@ async def chat_build_index(
             use_session_dirs=use_session_dirs,
             session_id=session_id or None,
         )
-        # NOTE: ensure your ChatIngestor saves with index_name="index" or FAISS_INDEX_NAME
-        # e.g., if it calls FAISS.save_local(dir, index_name=FAISS_INDEX_NAME)
-        ci.built_retriver(  # if your method name is actually build_retriever, fix it there as well
-            wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k
-        )
-        return {
+        # Upload temp files vanish with the request, so saving stays in it
+        await run_blocking("io", ci.save_files, wrapped)
+        if use_session_dirs:
+            await run_blocking("io", get_session_catalog().record, UPLOADS, ci.session_id, ci.temp_dir)
+        tenant = tenant_id or DEFAULT_TENANT
+
+        def work(reporter: ProgressReporter) -> Dict[str, Any]:
+            if collection:
+                # Shared sharded index: chunks are tagged with tenant + session
+                shared = get_collection(FAISS_BASE)
+                ci.ingest_to_collection(
+                    None,
+                    shared,
+                    tenant_id=tenant,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    reporter=reporter,
+                )
+                # Membership only: the shared directory's size is nobody's in particular
+                get_session_catalog().record(COLLECTION, ci.session_id, shared.root, nbytes=0)
+            else:
+                # NOTE: ensure your ChatIngestor saves with index_name="index" or FAISS_INDEX_NAME
+                # e.g., if it calls save_store(vs, dir, index_name=FAISS_INDEX_NAME)
+                retriever = ci.built_retriver(
+                    None,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    k=k,
+                    reporter=reporter,
+                )
+                # Warm the query path: first /chat/query reuses this vectorstore
+                get_vectorstore_cache().put(ci.faiss_dir, retriever.vectorstore)
+                if use_session_dirs:
+                    get_session_catalog().record(CHAT_INDEX, ci.session_id, ci.faiss_dir)
+            return {"ingest": ci.ingest_stats}
+
+        response: Dict[str, Any] = {
             "session_id": ci.session_id,
             "k": k,
             "use_session_dirs": use_session_dirs,
+            "files": [
+                {"name": f.original_name, "sha256": f.sha256, "bytes": f.size}
+                for f in ci.saved_files
+            ],
         }
+        if collection:
+            response.update(collection=True, tenant_id=tenant)
+
+        if wait:
+            result = await run_blocking("ingest", work, ProgressReporter())
+            return {**response, **result}
+
+        job_id = get_ingestion_jobs().submit(
+            "collection" if collection else "session",
+            ci.session_id,
+            work,
+            params={
+                "files": [f.original_name for f in ci.saved_files],
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "collection": collection,
+                "tenant_id": tenant if collection else None,
+            },
+        )
+        return JSONResponse(
+            status_code=202,
+            content={
+                **response,
+                "job_id": job_id,
+                "status": QUEUED,
+                "status_url": f"/chat/index/{job_id}",
+            },
+        )
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=e.error_message)
+    except IngestionQueueFullError as e:
+        raise HTTPException(
+            status_code=429, detail=e.error_message, headers={"Retry-After": "30"}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Indexing failed: {e}")
 
 
+@app.get("/chat/index/{job_id}")
+def chat_index_status(job_id: str) -> Dict[str, Any]:
+    """Job status, current stage, chunk counts and per-stage timings (seconds)."""
+    job = get_ingestion_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job
+
+
 # ---------- CHAT: QUERY ----------
 @app.post("/chat/query")
 async def chat_query(
@@ -126,31 +355,40 @@ async def chat_query(
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
+    collection: bool = Form(False),
+    tenant_id: Optional[str] = Form(None),
+    session_ids: Optional[str] = Form(None),
+    search_type: str = Form(SIMILARITY),
+    fetch_k: Optional[int] = Form(None),
+    lambda_mult: Optional[float] = Form(None),
+    score_threshold: Optional[float] = Form(None),
+    max_drop: Optional[float] = Form(None),
 ) -> Any:
     try:
-        if use_session_dirs and not session_id:
-            raise HTTPException(
-                status_code=400,
-                detail="session_id is required when use_session_dirs=True",
-            )
-
-        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
-        if not os.path.isdir(index_dir):
-            raise HTTPException(
-                status_code=404, detail=f"FAISS index not found at: {index_dir}"
-            )
-
-        rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(
-            index_dir, k=k, index_name=FAISS_INDEX_NAME
-        )  # build retriever + chain
-        response = rag.invoke(question, chat_history=[])
+        rag = await _build_rag(
+            session_id,
+            use_session_dirs,
+            k,
+            collection,
+            tenant_id,
+            session_ids,
+            search_type,
+            {
+                "fetch_k": fetch_k,
+                "lambda_mult": lambda_mult,
+                "score_threshold": score_threshold,
+                "max_drop": max_drop,
+            },
+        )
+        response = await rag.ainvoke(question, chat_history=[])
 
         return {
             "answer": response,
             "session_id": session_id,
             "k": k,
             "engine": "LCEL-RAG",
+            "retrieval": rag.last_retrieval,
+            "cache_hit": rag.last_answer_cached,
         }
     except HTTPException:
         raise
@@ -158,19 +396,265 @@ async def chat_query(
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
 
+# ---------- CHAT: STREAMING QUERY ----------
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    collection: bool = Form(False),
+    tenant_id: Optional[str] = Form(None),
+    session_ids: Optional[str] = Form(None),
+    search_type: str = Form(SIMILARITY),
+    fetch_k: Optional[int] = Form(None),
+    lambda_mult: Optional[float] = Form(None),
+    score_threshold: Optional[float] = Form(None),
+    max_drop: Optional[float] = Form(None),
+) -> Any:
+    """Server-sent events: `sources` first, then `token` events, then `done`."""
+    try:
+        rag = await _build_rag(
+            session_id,
+            use_session_dirs,
+            k,
+            collection,
+            tenant_id,
+            session_ids,
+            search_type,
+            {
+                "fetch_k": fetch_k,
+                "lambda_mult": lambda_mult,
+                "score_threshold": score_threshold,
+                "max_drop": max_drop,
+            },
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+    async def event_stream():
+        try:
+            async for event in rag.astream(question, chat_history=[]):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            yield _sse("error", {"detail": f"Query failed: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/results/cache/stats")
+def result_cache_stats() -> Dict[str, Any]:
+    cache = get_result_cache()
+    return {"enabled": cache is not None, **(cache.stats() if cache else {})}
+
+
+@app.get("/collections/stats")
+def collection_stats() -> Dict[str, Any]:
+    return get_collection(FAISS_BASE).stats()
+
+
+@app.get("/chat/cache/stats")
+def chat_cache_stats() -> Dict[str, Any]:
+    return {
+        "vectorstore_cache": get_vectorstore_cache().stats(),
+        "chat_cache": get_chat_cache().stats(),
+    }
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """Prometheus text format: stage / LLM histograms plus cache counters (this worker)."""
+    return Response(get_metrics().render(), media_type=CONTENT_TYPE)
+
+
+def _cache_metrics():
+    """Cache hit/miss counters read from the caches' own stats at scrape time."""
+    chat = get_chat_cache().stats()
+    caches = {
+        "vectorstore": get_vectorstore_cache().stats(),
+        "chat_answers": chat["answers"],
+        "chat_retrievals": chat["retrievals"],
+    }
+    result_cache = get_result_cache()
+    if result_cache is not None:
+        caches["results"] = result_cache.stats()
+    embeddings = get_model_registry().built_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        caches["embeddings"] = {"hits": embeddings.hits, "misses": embeddings.misses}
+
+    yield (
+        "document_portal_cache_hits_total", "counter", "Cache lookups served from the cache.",
+        [({"cache": name}, s["hits"]) for name, s in caches.items()],
+    )
+    yield (
+        "document_portal_cache_misses_total", "counter", "Cache lookups that missed.",
+        [({"cache": name}, s["misses"]) for name, s in caches.items()],
+    )
+    yield (
+        "document_portal_cache_entries", "gauge", "Entries currently cached.",
+        [({"cache": name}, s["entries"]) for name, s in caches.items() if "entries" in s],
+    )
+
+
+get_metrics().register_collector("caches", _cache_metrics)
+
+
+# ---------- ADMIN: SESSIONS ----------
+@app.get("/admin/sessions")
+def list_sessions(
+    limit: int = 100, offset: int = 0, area: Optional[str] = None, order: str = "last_access"
+) -> Dict[str, Any]:
+    """Sessions from the catalog (no filesystem walk), with totals per area."""
+    if area is not None and area not in AREAS:
+        raise HTTPException(status_code=400, detail=f"area must be one of: {', '.join(AREAS)}")
+    catalog = get_session_catalog()
+    return {
+        **catalog.totals(),
+        "items": catalog.list(limit=limit, offset=offset, area=area, order=order),
+    }
+
+
+@app.get("/admin/sessions/{session_id}")
+def get_session(session_id: str) -> Dict[str, Any]:
+    rows = get_session_catalog().get(session_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    return {"session_id": session_id, "areas": rows}
+
+
+@app.delete("/admin/sessions/{session_id}")
+async def purge_session(session_id: str) -> Dict[str, Any]:
+    catalog = get_session_catalog()
+    if not catalog.get(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    if session_id in get_ingestion_jobs().active_sessions():
+        raise HTTPException(status_code=409, detail="Session has an ingestion job in progress")
+    freed = await run_blocking("io", catalog.purge, session_id, _on_session_delete)
+    return {"session_id": session_id, "purged": True, "bytes_freed": freed}
+
+
+@app.post("/admin/sessions/sweep")
+async def sweep_sessions(dry_run: bool = False) -> Dict[str, Any]:
+    """Run the TTL / LRU / quota sweep now (dry_run only reports what it would evict)."""
+    catalog = get_session_catalog()
+    return await run_blocking(
+        "io",
+        lambda: catalog.sweep(
+            SessionPolicy.from_config(get_model_registry().config),
+            busy=get_ingestion_jobs().active_sessions(),
+            on_delete=_on_session_delete,
+            dry_run=dry_run,
+        ),
+    )
+
+
 # ---------- Helpers ----------
+def _on_session_delete(area: str, session_id: str, path: Path) -> None:
+    # Evicted indexes must not keep answering from the in-memory caches
+    if area == CHAT_INDEX:
+        get_vectorstore_cache().invalidate(path)
+        get_chat_cache().invalidate(path)
+    elif area == COLLECTION:
+        # The collection directory is shared: only this session's chunks go
+        get_collection(FAISS_BASE).remove_session(session_id)
+
+
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + chunked .read() (and .getbuffer()) API"""
 
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+        self.size = uf.size
+
+    def seek(self, offset: int = 0) -> None:
+        self._uf.file.seek(offset)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._uf.file.read(size)
 
     def getbuffer(self) -> bytes:
         self._uf.file.seek(0)
         return self._uf.file.read()
 
 
+def _resolve_index_dir(session_id: Optional[str], use_session_dirs: bool) -> str:
+    if use_session_dirs and not session_id:
+        raise HTTPException(
+            status_code=400,
+            detail="session_id is required when use_session_dirs=True",
+        )
+
+    index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
+    if not os.path.isdir(index_dir):
+        raise HTTPException(
+            status_code=404, detail=f"FAISS index not found at: {index_dir}"
+        )
+    return index_dir
+
+
+async def _build_rag(
+    session_id: Optional[str],
+    use_session_dirs: bool,
+    k: int,
+    collection: bool,
+    tenant_id: Optional[str],
+    session_ids: Optional[str],
+    search_type: str = SIMILARITY,
+    rerank_kwargs: Optional[Dict[str, Any]] = None,
+) -> ConversationalRAG:
+    """
+    RAG over the session's own index, or over the shared collection filtered
+    to tenant_id and session_ids (comma-separated; all sessions when empty).
+    search_type similarity | mmr | threshold applies to session indexes.
+    """
+    if search_type not in SEARCH_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"search_type must be one of: {', '.join(SEARCH_TYPES)}",
+        )
+    if collection:
+        selected = [s.strip() for s in (session_ids or "").split(",") if s.strip()]
+        for sid in selected:
+            await run_blocking("io", get_session_catalog().touch, sid)
+        retriever = CollectionRetriever(
+            collection=get_collection(FAISS_BASE),
+            k=k,
+            tenant_id=tenant_id or DEFAULT_TENANT,
+            session_ids=selected or None,
+        )
+        return ConversationalRAG(session_id=session_id, retriever=retriever)
+
+    index_dir = _resolve_index_dir(session_id, use_session_dirs)
+    if use_session_dirs:
+        await run_blocking("io", get_session_catalog().touch, session_id)
+    rag = ConversationalRAG(session_id=session_id)
+    await run_blocking(
+        "io",
+        rag.load_retriever_from_faiss,
+        index_dir,
+        k=k,
+        index_name=FAISS_INDEX_NAME,
+        search_type=search_type,
+        search_kwargs={"k": k, **(rerank_kwargs or {})},
+    )  # build retriever + chain
+    return rag
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _ndjson(event: str, data: Any) -> str:
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
+
+
 def _read_pdf_via_handler(handler: DocHandler, path: str) -> str:
     if hasattr(handler, "read_pdf"):
         return handler.read_pdf(path)  # type: ignore
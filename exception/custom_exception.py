@@ -60,6 +60,14 @@ class DocumentPortalException(Exception):
         return f"DocumentPortalException(file={self.file_name!r}, line={self.lineno}, message={self.error_message!r})"
 
 
+class UploadTooLargeError(DocumentPortalException):
+    """Raised when an upload exceeds the per-file or per-request size limit."""
+
+
+class IngestionQueueFullError(DocumentPortalException):
+    """Raised when the background ingestion queue has no room for another job."""
+
+
 if __name__ == "__main__":
     # Demo-1: generic exception -> wrap
     try:
@@ -1,52 +1,228 @@
 import os
+import sys
+import atexit
+import queue
+import random
 import logging
-from datetime import datetime
+import logging.handlers
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, TextIO
+
 import structlog
 
-class CustomLogger:
-    def __init__(self, log_dir="logs"):
-        ## Ensure logs directory exists
-        self.logs_dir = os.path.join(os.getcwd(), log_dir)
-        os.makedirs(self.logs_dir, exist_ok=True)
+# Process-wide logging state: configured once, re-armed in forked workers
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"pid": None, "log_file": None, "listener": None}
 
-        ## Create timestamped log file name
-        log_file = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-        self.log_file_path = os.path.join(self.logs_dir, log_file)
+_ALWAYS_KEPT = {"warning", "warn", "error", "exception", "critical", "fatal"}
 
-    def get_logger(self, name=__file__):
-        logger_name = os.path.basename(name)
 
-        # Configure logging for console + file (both JSON)
-        file_handler = logging.FileHandler(self.log_file_path)
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(logging.Formatter("%(message)s"))  # Raw JSON lines
+def _settings() -> Dict[str, Any]:
+    """The logging section of config/config.yaml; LOG_LEVEL overrides its level."""
+    try:
+        from utils.config_loader import load_config
 
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        cfg = dict(load_config().get("logging", {}) or {})
+    except Exception:
+        cfg = {}
+    if os.getenv("LOG_LEVEL"):
+        cfg["level"] = os.environ["LOG_LEVEL"]
+    return cfg
 
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(message)s",  # Structlog will handle JSON rendering
-            handlers=[console_handler, file_handler]
-        )
 
-        # Configure structlog for JSON structured logging
+def _level(name: Any) -> int:
+    return name if isinstance(name, int) else logging.getLevelName(str(name).upper())
+
+
+class EventSampler:
+    """
+    Keep only a fraction of chosen hot-path events, e.g. {"Retrieval strategy": 0.1}.
+    Warnings and errors are never sampled; kept events carry sample_rate.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = {event: float(rate) for event, rate in (rates or {}).items()}
+
+    def __call__(self, logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        rate = self.rates.get(event_dict.get("event"))  # type: ignore[arg-type]
+        if rate is None or rate >= 1.0 or method_name in _ALWAYS_KEPT:
+            return event_dict
+        if random.random() >= rate:
+            raise structlog.DropEvent
+        event_dict["sample_rate"] = rate
+        return event_dict
+
+
+def _timestamp(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # Stamped from the record's creation time, so rendering later keeps it exact
+    record = event_dict.get("_record")
+    created = record.created if record is not None else datetime.now().timestamp()
+    event_dict["timestamp"] = (
+        datetime.fromtimestamp(created, timezone.utc).isoformat().replace("+00:00", "Z")
+    )
+    return event_dict
+
+
+def _json_formatter() -> logging.Formatter:
+    """Renders structlog event dicts (and plain stdlib records) as JSON lines."""
+    return structlog.stdlib.ProcessorFormatter(
+        processors=[
+            _timestamp,
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.add_log_level,
+            structlog.processors.EventRenamer(to="event"),
+            structlog.processors.JSONRenderer(),
+        ],
+    )
+
+
+def _handlers(log_file: str, stream: Optional[TextIO] = None) -> List[logging.Handler]:
+    formatter = _json_formatter()
+    handlers: List[logging.Handler] = [
+        logging.StreamHandler(stream or sys.stderr),
+        logging.FileHandler(log_file, delay=True),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Hand the record over as is: JSON rendering happens on the listener thread
+        return record
+
+
+def configure_logging(log_dir: str = "logs", stream: Optional[TextIO] = None) -> str:
+    """
+    Configure stdlib logging + structlog once per process and return the
+    log file path. Records are queued by the calling thread and rendered /
+    written by a QueueListener thread; disabled levels are dropped before
+    any processing. Settings come from the logging section of config.
+    """
+    if _state["pid"] == os.getpid():
+        return _state["log_file"]
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return _state["log_file"]
+        cfg = _settings()
+        level = _level(cfg.get("level", "INFO"))
+
+        log_file = _state["log_file"]
+        if log_file is None:
+            logs_dir = os.path.join(os.getcwd(), log_dir)
+            os.makedirs(logs_dir, exist_ok=True)
+            log_file = os.path.join(logs_dir, f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log")
+        handlers = _handlers(log_file, stream)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(level)
+        if cfg.get("queue", True):
+            records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            root.addHandler(_QueueHandler(records))
+            listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+            listener.start()
+            _state["listener"] = listener
+            atexit.register(listener.stop)  # drain whatever is still queued
+        else:
+            for handler in handlers:
+                root.addHandler(handler)
+
+        overrides = {
+            name: _level(name_level) for name, name_level in (cfg.get("levels", {}) or {}).items()
+        }
+        for name, name_level in overrides.items():
+            logging.getLogger(name).setLevel(name_level)
+
+        # The bound logger drops events below its level before any processor runs, so
+        # with overrides it admits the lowest configured level and filter_by_level
+        # applies each logger's own (or the root) level
+        bound_level = min([level, *overrides.values()])
+        processors: List[Any] = []
+        if overrides:
+            processors.append(structlog.stdlib.filter_by_level)
+        processors += [
+            EventSampler(cfg.get("sample", {}) or {}),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ]
         structlog.configure(
-            processors=[
-                structlog.processors.TimeStamper(fmt="iso", utc=True, key="timestamp"),
-                structlog.processors.add_log_level,
-                structlog.processors.EventRenamer(to="event"),
-                structlog.processors.JSONRenderer()
-            ],
+            processors=processors,
             logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.make_filtering_bound_logger(bound_level),
             cache_logger_on_first_use=True,
         )
+        _state.update(pid=os.getpid(), log_file=log_file)
+        return log_file
+
+
+class CustomLogger:
+    """
+    Thin accessor kept for the existing call sites: constructing it is
+    cheap after the first time, and every instance shares one log file.
+    """
+
+    def __init__(self, log_dir="logs"):
+        self.log_file_path = configure_logging(log_dir)
+        self.logs_dir = os.path.dirname(self.log_file_path)
+
+    def get_logger(self, name=__file__):
+        return structlog.get_logger(os.path.basename(name))
+
+
+if __name__ == "__main__":
+    # Per-call overhead on the calling thread, old synchronous setup vs queued:
+    #   python -m logger.custom_logger [n_calls]
+    import tempfile
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    tmp = tempfile.mkdtemp()
+    devnull = open(os.devnull, "w")
+    fields = {"session_id": "session_20260101_000000_abcd1234", "chunks": 4, "retrieval_ms": 3.2}
+
+    def per_call_us(call, *args, **kwargs) -> float:
+        started = time.perf_counter()
+        for _ in range(n):
+            call(*args, **kwargs)
+        return (time.perf_counter() - started) * 1e6 / n
+
+    # Before: JSON rendered and written to console + file on the calling thread
+    legacy_std = logging.getLogger("bench.legacy")
+    legacy_std.propagate = False
+    legacy_std.setLevel(logging.INFO)
+    for handler in (logging.StreamHandler(devnull), logging.FileHandler(os.path.join(tmp, "legacy.log"))):
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        legacy_std.addHandler(handler)
+    legacy = structlog.wrap_logger(
+        legacy_std,
+        processors=[
+            structlog.processors.TimeStamper(fmt="iso", utc=True, key="timestamp"),
+            structlog.processors.add_log_level,
+            structlog.processors.EventRenamer(to="event"),
+            structlog.processors.JSONRenderer(),
+        ],
+    )
+    print(f"sync (before):     {per_call_us(legacy.info, 'Bench event', **fields):6.2f} us/call")
 
-        return structlog.get_logger(logger_name)
-    
+    # After: queue handler on the calling thread, rendering + I/O on the listener
+    configure_logging(tmp, stream=devnull)
+    log = CustomLogger().get_logger("bench")
+    print(f"queued (after):    {per_call_us(log.info, 'Bench event', **fields):6.2f} us/call")
+    started = time.perf_counter()
+    _state["listener"].stop()
+    print(f"  listener drain:  {(time.perf_counter() - started) * 1000:6.1f} ms for {n} records")
+    _state["listener"].start()
+    print(f"filtered (debug):  {per_call_us(log.debug, 'Bench event', **fields):6.2f} us/call")
 
-if (__name__ == '__main__'):
-    logger = CustomLogger().get_logger(__file__)
-    logger.info("User uploaded a file", user_id=123, filename="report.pdf")
-    logger.error("Failed to process PDF", error="File not found", user_id=123, filename="report.pdf")
\ No newline at end of file
+    structlog.configure(
+        processors=[
+            EventSampler({"Bench event": 0.1}),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ]
+    )
+    sampled = structlog.get_logger("bench.sampled")
+    print(f"sampled at 0.1:    {per_call_us(sampled.info, 'Bench event', **fields):6.2f} us/call")
+    print(f"CustomLogger():    {per_call_us(CustomLogger):6.2f} us/construction")
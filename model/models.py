@@ -17,6 +17,12 @@ class MetaData(BaseModel):
     SentimentTone: str
 
 
+class AnalysisMode(str, Enum):
+    SINGLE = "single"
+    MAP_REDUCE = "map_reduce"
+    AUTO = "auto"
+
+
 class ChangeFormat(BaseModel):
     Page: str
     Changes: str
@@ -28,6 +34,9 @@ class SummaryResponse(RootModel[list[ChangeFormat]]):
 
 class PromptType(str, Enum):
     DOCUMENT_ANALYSIS = "document_analysis"
+    DOCUMENT_SECTION_SUMMARY = "document_section_summary"
+    DOCUMENT_ANALYSIS_REDUCE = "document_analysis_reduce"
     DOCUMENT_COMPARISON = "document_comparison"
+    DOCUMENT_DIFF_COMPARISON = "document_diff_comparison"
     CONTEXTUALIZE_QUESTION = "contextualize_question"
     CONTEXT_QA = "context_qa"
@@ -17,6 +17,34 @@ Analyze this document:
 """
 )
 
+# Map step of map-reduce analysis: condense one section of a long document
+document_section_summary_prompt = PromptTemplate.from_template(
+    """
+You are summarizing one section of a longer document ({section_label}).
+Write concise bullet-point notes covering the key points of this section.
+Also note any title, author, publisher, dates, language or tone cues you see.
+Do not add information that is not in the text.
+
+Section:
+{section_text}
+"""
+)
+
+# Reduce step of map-reduce analysis: merge section notes into the MetaData schema
+document_analysis_reduce_prompt = PromptTemplate.from_template(
+    """
+You are a highly capable assistant trained to analyze and summarize documents.
+Below are notes taken from consecutive sections of one document ({page_count} pages).
+Combine them into a single analysis of the whole document.
+Return ONLY valid JSON matching the exact schema below.
+
+{format_instructions}
+
+Section notes:
+{section_summaries}
+"""
+)
+
 document_comparison_prompt = PromptTemplate.from_template(
     """
 You will be provided with content from two PDFs. Your tasks are as follows:
@@ -36,6 +64,27 @@ Your response should follow this format:
 """
 )
 
+# Comparison over pre-computed page diffs: only changed pages are sent
+document_diff_comparison_prompt = PromptTemplate.from_template(
+    """
+You will be given line-level diffs between a reference PDF and an actual PDF.
+Only pages that changed are included; all other pages are identical.
+Lines starting with '-' were removed from the reference, lines starting with '+' were added in the actual document.
+
+1. For every page listed, describe the changes in plain language
+2. Use the page label exactly as given in the "Page:" line as the page number
+3. If a page's diff is only formatting, mention as 'NO CHANGE'
+
+Changed pages:
+
+{page_diffs}
+
+Your response should follow this format:
+
+{format_instruction}
+"""
+)
+
 # Prompt for contextual question rewriting
 contextualize_question_prompt = ChatPromptTemplate.from_messages(
     [
@@ -71,7 +120,10 @@ context_qa_prompt = ChatPromptTemplate.from_messages(
 # Central dictionary to register prompts
 PROMPT_REGISTRY = {
     "document_analysis": document_analysis_prompt,
+    "document_section_summary": document_section_summary_prompt,
+    "document_analysis_reduce": document_analysis_reduce_prompt,
     "document_comparison": document_comparison_prompt,
+    "document_diff_comparison": document_diff_comparison_prompt,
     "contextualize_question": contextualize_question_prompt,
     "context_qa": context_qa_prompt,
 }
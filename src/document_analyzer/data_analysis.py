@@ -1,24 +1,109 @@
+import re
 import sys
+import time
+from typing import Dict, List, Optional, Tuple
 from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
-from model.models import MetaData
-from langchain_core.output_parsers import JsonOutputParser
+from model.models import AnalysisMode, MetaData, PromptType
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain.output_parsers import OutputFixingParser
 from prompt.prompt_library import PROMPT_REGISTRY
+from utils.llm_utils import count_tokens, truncate_tokens
+from utils.result_cache import get_result_cache, prompt_version, result_key
+from utils.concurrency import run_blocking
+from utils.metrics import llm_call
+
+# Page separators written by DocHandler.read_pdf ("--- Page N ---")
+_PAGE_MARKER = re.compile(r"^\s*---\s*Page\s+(\d+)\s*---\s*$", re.MULTILINE)
+
+
+def _split_pages(text: str) -> List[Tuple[str, str]]:
+    """(page label, page text) pairs; the whole text is one page if unmarked."""
+    parts = _PAGE_MARKER.split(text)
+    pages = []
+    if parts[0].strip():
+        pages.append(("1" if len(parts) == 1 else "preamble", parts[0]))
+    for i in range(1, len(parts) - 1, 2):
+        if parts[i + 1].strip():
+            pages.append((parts[i], parts[i + 1]))
+    return pages
+
+
+def split_sections(text: str, max_tokens: int) -> List[Dict[str, str]]:
+    """
+    Pack consecutive pages into sections of at most max_tokens tokens.
+    A single page above the budget is cut into character windows.
+    """
+    sections: List[Dict[str, str]] = []
+    labels: List[str] = []
+    parts: List[str] = []
+    used = 0
+
+    def flush():
+        nonlocal labels, parts, used
+        if parts:
+            label = labels[0] if len(labels) == 1 else f"{labels[0]}-{labels[-1]}"
+            sections.append({"label": f"pages {label}", "text": "\n".join(parts)})
+        labels, parts, used = [], [], 0
+
+    for label, page in _split_pages(text):
+        n = count_tokens(page)
+        if n > max_tokens:
+            flush()
+            window = max(1, len(page) * max_tokens // n)
+            pieces = range(0, len(page), window)
+            for j, start in enumerate(pieces, 1):
+                sections.append(
+                    {
+                        "label": f"page {label}, part {j} of {len(pieces)}",
+                        "text": page[start : start + window],
+                    }
+                )
+            continue
+        if used + n > max_tokens:
+            flush()
+        labels.append(label)
+        parts.append(page)
+        used += n
+    flush()
+    return sections
+
+
+def _pack(texts: List[str], max_tokens: int) -> List[List[str]]:
+    """Greedy grouping of consecutive texts under a token budget."""
+    groups: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for t in texts:
+        n = count_tokens(t)
+        if current and used + n > max_tokens:
+            groups.append(current)
+            current, used = [], 0
+        current.append(t)
+        used += n
+    if current:
+        groups.append(current)
+    return groups
 
 
 class DocumentAnalyzer:
     """
     Analyzes documents using a pre-trained model.
     Automatically logs all actions and supports session-based organization.
+
+    Modes (see AnalysisMode):
+        single:     one prompt over the first max_section_tokens of the document
+        map_reduce: summarize token-budgeted sections concurrently, then
+                    reduce the section notes into the MetaData schema
+        auto:       map_reduce when the document does not fit one section
     """
 
     def __init__(self):
         self.log = CustomLogger().get_logger(__name__)
         try:
             self.loader = ModelLoader()
-            self.llm = self.loader.load_llm()
+            self.llm = llm_call(self.loader.load_llm(), "analyze")
 
             # Prepare parsers
             self.parser = JsonOutputParser(pydantic_object=MetaData)
@@ -27,6 +112,18 @@ class DocumentAnalyzer:
             )
 
             self.prompt = PROMPT_REGISTRY.get("document_analysis", "")
+            self.map_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_SECTION_SUMMARY.value]
+            self.reduce_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_REDUCE.value]
+            self.map_chain = self.map_prompt | self.llm | StrOutputParser()
+
+            cfg = self.loader.config.get("analysis", {}) or {}
+            self.default_mode = cfg.get("mode", AnalysisMode.AUTO.value)
+            self.max_section_tokens = cfg.get("max_section_tokens", 3000)
+            self.max_reduce_tokens = cfg.get("max_reduce_tokens", 12000)
+            self.max_concurrency = cfg.get("max_concurrency", 8)
+
+            self.last_cache_hit = False
+            self.last_mode: Optional[str] = None
 
             self.log.info("DocumentAnalyzer initialized successfully")
 
@@ -36,25 +133,191 @@ class DocumentAnalyzer:
                 "Error in DocumentAnalyzer initialization", sys
             )
 
-    def analyze_document(self, document_text: str) -> dict:
+    def _inputs(self, document_text: str) -> dict:
+        refined_text = truncate_tokens(document_text, self.max_section_tokens)
+        return {
+            "format_instructions": self.parser.get_format_instructions(),
+            "document_text": refined_text,
+        }
+
+    def _cache_key(self, document_text: str, mode: str) -> str:
+        if mode == AnalysisMode.SINGLE.value:
+            return result_key(
+                "analysis",
+                document_text,
+                self.prompt,
+                self.loader.registry.llm_config(),
+                extra="\x00".join(
+                    [self.parser.get_format_instructions(), str(self.max_section_tokens)]
+                ),
+            )
+        return result_key(
+            f"analysis:{mode}",
+            document_text,
+            self.reduce_prompt,
+            self.loader.registry.llm_config(),
+            extra="\x00".join(
+                [
+                    self.parser.get_format_instructions(),
+                    prompt_version(self.map_prompt),
+                    str(self.max_section_tokens),
+                    str(self.max_reduce_tokens),
+                ]
+            ),
+        )
+
+    def _resolve_mode(
+        self, document_text: str, mode: Optional[str]
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """Validated mode plus the sections (empty for single mode)."""
+        mode = AnalysisMode(mode or self.default_mode).value
+        if mode == AnalysisMode.SINGLE.value:
+            return mode, []
+        sections = split_sections(document_text, self.max_section_tokens)
+        if mode == AnalysisMode.AUTO.value:
+            mode = (
+                AnalysisMode.MAP_REDUCE.value
+                if len(sections) > 1
+                else AnalysisMode.SINGLE.value
+            )
+        return mode, sections
+
+    # ---------- Map-reduce ----------
+
+    def _map_inputs(self, sections: List[Dict[str, str]]) -> List[dict]:
+        return [
+            {"section_label": s["label"], "section_text": s["text"]} for s in sections
+        ]
+
+    def _collapse_inputs(self, summaries: List[str]) -> Optional[List[dict]]:
+        """
+        Inputs for one collapse round when the notes exceed the reduce budget,
+        or None once they fit (or cannot be packed any tighter).
+        """
+        if len(summaries) < 2 or count_tokens("\n\n".join(summaries)) <= self.max_reduce_tokens:
+            return None
+        groups = _pack(summaries, self.max_section_tokens)
+        if len(groups) == len(summaries):
+            return None
+        return [
+            {
+                "section_label": f"notes part {i} of {len(groups)}",
+                "section_text": "\n\n".join(group),
+            }
+            for i, group in enumerate(groups, 1)
+        ]
+
+    def _reduce_inputs(self, summaries: List[str], page_count: int) -> dict:
+        return {
+            "format_instructions": self.parser.get_format_instructions(),
+            "section_summaries": "\n\n".join(summaries),
+            "page_count": page_count,
+        }
+
+    def _map_reduce(self, sections: List[Dict[str, str]], page_count: int) -> dict:
+        batch_config = {"max_concurrency": self.max_concurrency}
+        summaries = self.map_chain.batch(self._map_inputs(sections), config=batch_config)
+        while (inputs := self._collapse_inputs(summaries)) is not None:
+            summaries = self.map_chain.batch(inputs, config=batch_config)
+        chain = self.reduce_prompt | self.llm | self.fixing_parser
+        return chain.invoke(self._reduce_inputs(summaries, page_count))
+
+    async def _amap_reduce(self, sections: List[Dict[str, str]], page_count: int) -> dict:
+        batch_config = {"max_concurrency": self.max_concurrency}
+        summaries = await self.map_chain.abatch(
+            self._map_inputs(sections), config=batch_config
+        )
+        while (inputs := self._collapse_inputs(summaries)) is not None:
+            summaries = await self.map_chain.abatch(inputs, config=batch_config)
+        chain = self.reduce_prompt | self.llm | self.fixing_parser
+        return await chain.ainvoke(self._reduce_inputs(summaries, page_count))
+
+    # ---------- Public API ----------
+
+    def analyze_document(self, document_text: str, mode: Optional[str] = None) -> dict:
         """
         Analyze a document's text and extract structured metadata & summary.
+        mode: "single", "map_reduce" or "auto" (default: analysis.mode in config).
         """
         try:
-            refined_text = document_text[:200]
-            chain = self.prompt | self.llm | self.fixing_parser
+            mode, sections = self._resolve_mode(document_text, mode)
+            self.last_mode = mode
+
+            cache = get_result_cache()
+            key = self._cache_key(document_text, mode)
+            cached = cache.get(key) if cache else None
+            self.last_cache_hit = cached is not None
+            if cached is not None:
+                self.log.info("Metadata served from result cache", mode=mode)
+                return cached
+
+            started = time.perf_counter()
+            if mode == AnalysisMode.MAP_REDUCE.value:
+                response = self._map_reduce(sections, len(_split_pages(document_text)))
+            else:
+                chain = self.prompt | self.llm | self.fixing_parser
 
-            self.log.info("Meta-data analysis chain initialized")
+                self.log.info("Meta-data analysis chain initialized")
 
-            response = chain.invoke(
-                {
-                    "format_instructions": self.parser.get_format_instructions(),
-                    "document_text": refined_text,
-                }
+                response = chain.invoke(self._inputs(document_text))
+
+            self.log.info(
+                "Metadata extraction successful",
+                keys=list(response.keys()),
+                mode=mode,
+                sections=len(sections),
+                seconds=round(time.perf_counter() - started, 3),
             )
 
-            self.log.info("Metadata extraction successful", keys=list(response.keys()))
+            if cache:
+                cache.put(key, "analysis", response)
+            return response
+
+        except Exception as e:
+            self.log.error("Metadata analysis failed", error=str(e))
+            raise DocumentPortalException("Metadata extraction failed") from e
+
+    async def aanalyze_document(self, document_text: str, mode: Optional[str] = None) -> dict:
+        """
+        Async variant of analyze_document built on ainvoke / abatch.
+        """
+        try:
+            # Token counting over long documents is CPU work; keep it off the loop
+            mode, sections = await run_blocking(
+                "cpu", self._resolve_mode, document_text, mode
+            )
+            self.last_mode = mode
+
+            cache = get_result_cache()
+            key = self._cache_key(document_text, mode)
+            cached = await run_blocking("io", cache.get, key) if cache else None
+            self.last_cache_hit = cached is not None
+            if cached is not None:
+                self.log.info("Metadata served from result cache", mode=mode)
+                return cached
+
+            started = time.perf_counter()
+            if mode == AnalysisMode.MAP_REDUCE.value:
+                response = await self._amap_reduce(
+                    sections, len(_split_pages(document_text))
+                )
+            else:
+                chain = self.prompt | self.llm | self.fixing_parser
+
+                self.log.info("Meta-data analysis chain initialized")
+
+                response = await chain.ainvoke(self._inputs(document_text))
+
+            self.log.info(
+                "Metadata extraction successful",
+                keys=list(response.keys()),
+                mode=mode,
+                sections=len(sections),
+                seconds=round(time.perf_counter() - started, 3),
+            )
 
+            if cache:
+                await run_blocking("io", cache.put, key, "analysis", response)
             return response
 
         except Exception as e:
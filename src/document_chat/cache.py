@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.model_loader import get_model_registry
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+def index_key(index_dir: str | Path) -> str:
+    return str(Path(index_dir).resolve())
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: Optional[float],
+        on_evict: Optional[Callable[[Hashable], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, count: bool = True) -> Any:
+        """count=False leaves hits/misses alone, for lookups that record() the outcome."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] >= time.monotonic():
+                self._data.move_to_end(key)
+                value = item[0]
+            else:
+                if item is not None:
+                    self._drop(key)
+                value = None
+            if count:
+                self.record(value is not None)
+            return value
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def drop_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                self._drop(k)
+            return len(keys)
+
+    def _drop(self, key: Hashable):
+        self._data.pop(key, None)
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class ChatCache:
+    """
+    Two-tier cache for ConversationalRAG, scoped by index dir + index version.
+
+    Tier 1 (answers): normalized question -> final answer + sources, for
+    first-turn questions (no chat history).
+    Tier 2 (retrieval): query embedding -> retrieved document ids. Exact
+    query matches always hit; with similarity_threshold set, a stored query
+    whose embedding has cosine similarity >= threshold also hits.
+
+    Because keys include the index version, any change to the index makes
+    old entries unreachable; invalidate() also frees them eagerly.
+    """
+
+    def __init__(
+        self,
+        answer_max_entries: int = 2048,
+        answer_ttl: Optional[float] = 3600,
+        retrieval_max_entries: int = 4096,
+        retrieval_ttl: Optional[float] = 3600,
+        similarity_threshold: Optional[float] = None,
+    ):
+        self.answers = TTLCache(answer_max_entries, answer_ttl)
+        self.retrievals = TTLCache(
+            retrieval_max_entries, retrieval_ttl, on_evict=self._forget_vector
+        )
+        self.similarity_threshold = similarity_threshold
+        # scope -> {query hash: unit-norm embedding}, for near-duplicate lookup
+        self._vectors: Dict[Tuple, Dict[str, np.ndarray]] = {}
+        self._lock = threading.RLock()
+        self.similar_hits = 0
+
+    @classmethod
+    def from_config(cls) -> "ChatCache":
+        cfg = get_model_registry().config.get("chat_cache", {}) or {}
+        return cls(
+            answer_max_entries=cfg.get("answer_max_entries", 2048),
+            answer_ttl=cfg.get("answer_ttl_seconds", 3600),
+            retrieval_max_entries=cfg.get("retrieval_max_entries", 4096),
+            retrieval_ttl=cfg.get("retrieval_ttl_seconds", 3600),
+            similarity_threshold=cfg.get("similarity_threshold"),
+        )
+
+    # ---------- Tier 1: answers ----------
+
+    def get_answer(
+        self,
+        index_dir: str,
+        version: Tuple,
+        session_id: Optional[str],
+        question: str,
+        params: Tuple = (),
+    ):
+        """params: retrieval settings, so a different search_type never reuses an answer."""
+        return self.answers.get(
+            (index_key(index_dir), version, session_id, normalize_question(question), params)
+        )
+
+    def put_answer(
+        self,
+        index_dir: str,
+        version: Tuple,
+        session_id: Optional[str],
+        question: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        params: Tuple = (),
+    ):
+        self.answers.put(
+            (index_key(index_dir), version, session_id, normalize_question(question), params),
+            {"answer": answer, "sources": sources},
+        )
+
+    # ---------- Tier 2: retrieval ----------
+
+    @staticmethod
+    def _qhash(query: str) -> str:
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def _forget_vector(self, key: Hashable):
+        scope, qhash = key[:-1], key[-1]  # type: ignore[index]
+        with self._lock:
+            vectors = self._vectors.get(scope)
+            if vectors is not None:
+                vectors.pop(qhash, None)
+                if not vectors:
+                    self._vectors.pop(scope, None)
+
+    def get_retrieval(
+        self, index_dir: str, version: Tuple, params: Tuple, query: str, embedding: List[float]
+    ) -> Optional[List[str]]:
+        scope = (index_key(index_dir), version, params)
+        # One lookup counts once, whether it hits exactly, by similarity or not at all
+        ids = self.retrievals.get(scope + (self._qhash(query),), count=False)
+        if ids is None and self.similarity_threshold:
+            ids = self._similar_retrieval(scope, embedding)
+            if ids is not None:
+                self.similar_hits += 1
+        self.retrievals.record(ids is not None)
+        return ids
+
+    def _similar_retrieval(self, scope: Tuple, embedding: List[float]) -> Optional[List[str]]:
+        with self._lock:
+            vectors = self._vectors.get(scope)
+            if not vectors:
+                return None
+            qhashes = list(vectors.keys())
+            matrix = np.stack([vectors[h] for h in qhashes])
+        q = np.asarray(embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        sims = matrix @ q
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity_threshold:
+            return None
+        return self.retrievals.get(scope + (qhashes[best],), count=False)
+
+    def put_retrieval(
+        self,
+        index_dir: str,
+        version: Tuple,
+        params: Tuple,
+        query: str,
+        embedding: List[float],
+        ids: List[str],
+    ):
+        scope = (index_key(index_dir), version, params)
+        qhash = self._qhash(query)
+        if self.similarity_threshold:
+            vec = np.asarray(embedding, dtype=np.float32)
+            vec /= np.linalg.norm(vec) or 1.0
+            with self._lock:
+                self._vectors.setdefault(scope, {})[qhash] = vec
+        self.retrievals.put(scope + (qhash,), list(ids))
+
+    # ---------- Invalidation ----------
+
+    def invalidate(self, index_dir: str | Path) -> int:
+        """Drop every cached answer and retrieval for an index (called on index changes)."""
+        key = index_key(index_dir)
+        dropped = self.answers.drop_where(lambda k: k[0] == key)  # type: ignore[index]
+        dropped += self.retrievals.drop_where(lambda k: k[0] == key)  # type: ignore[index]
+        if dropped:
+            log.info("Chat cache invalidated", index_dir=key, dropped=dropped)
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        retrieval = self.retrievals.stats()
+        retrieval["similar_hits"] = self.similar_hits
+        return {"answers": self.answers.stats(), "retrievals": retrieval}
+
+
+_cache: Optional[ChatCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_chat_cache() -> ChatCache:
+    """Return the process-wide ChatCache configured from the chat_cache config section."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChatCache.from_config()
+    return _cache
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+import faiss
+import numpy as np
+
+from utils.index_factory import reconstruct_positions
+
+SIMILARITY = "similarity"
+MMR = "mmr"
+THRESHOLD = "threshold"
+SEARCH_TYPES = (SIMILARITY, MMR, THRESHOLD)
+
+
+@dataclass
+class RerankSettings:
+    """
+    Defaults for the retrieval post-processors, from retriever.rerank in
+    config; per-request values arrive through search_kwargs.
+
+    mmr:       pick k of fetch_k candidates trading relevance against
+               redundancy (lambda_mult=1 is plain relevance order)
+    threshold: keep up to k candidates whose cosine similarity is at least
+               score_threshold and within max_drop of the best candidate
+    """
+
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    score_threshold: float = 0.0
+    max_drop: float = 0.15
+    min_k: int = 1
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RerankSettings":
+        cfg = (config.get("retriever", {}) or {}).get("rerank", {}) or {}
+        return cls(
+            fetch_k=int(cfg.get("fetch_k", 20)),
+            lambda_mult=float(cfg.get("lambda_mult", 0.5)),
+            score_threshold=float(cfg.get("score_threshold", 0.0)),
+            max_drop=float(cfg.get("max_drop", 0.15)),
+            min_k=int(cfg.get("min_k", 1)),
+        )
+
+    def resolve(self, search_type: str, search_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """search_kwargs with this search type's missing knobs filled from the defaults."""
+        if search_type == MMR:
+            defaults = {"fetch_k": self.fetch_k, "lambda_mult": self.lambda_mult}
+        elif search_type == THRESHOLD:
+            defaults = {
+                "fetch_k": self.fetch_k,
+                "score_threshold": self.score_threshold,
+                "max_drop": self.max_drop,
+                "min_k": self.min_k,
+            }
+        else:
+            defaults = {}
+        return {**defaults, **{k: v for k, v in search_kwargs.items() if v is not None}}
+
+
+def candidate_vectors(index: faiss.Index, positions: Sequence[int]) -> np.ndarray:
+    """Stored vectors for FAISS positions (any index type, base + segments)."""
+    return reconstruct_positions(index, positions)
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_scores(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    return _unit(vectors) @ _unit(np.asarray(query, dtype=np.float32))
+
+
+def mmr_select(
+    query: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Maximal marginal relevance over candidate vectors; returns row indices
+    in pick order. The candidate-candidate similarity matrix is computed
+    once, and each pick only updates the running max-similarity vector.
+    """
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+    unit = _unit(np.asarray(vectors, dtype=np.float32))
+    relevance = unit @ _unit(np.asarray(query, dtype=np.float32))
+    pairwise = unit @ unit.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = pairwise[first].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[first] = True
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[taken] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        taken[pick] = True
+        np.maximum(redundancy, pairwise[pick], out=redundancy)
+    return selected
+
+
+def adaptive_cut(
+    scores: np.ndarray,
+    k: int,
+    score_threshold: float = 0.0,
+    max_drop: float = 0.15,
+    min_k: int = 1,
+) -> List[int]:
+    """
+    Row indices (in ranked order) worth sending to the LLM: at most k,
+    similarity >= score_threshold and within max_drop of the best score,
+    but never fewer than min_k.
+    """
+    if len(scores) == 0:
+        return []
+    floor = max(score_threshold, float(np.max(scores)) - max_drop)
+    keep = [i for i in range(len(scores)) if scores[i] >= floor][:k]
+    if len(keep) < min_k:
+        keep = sorted(np.argsort(-scores, kind="stable")[: min(min_k, k)].tolist())
+    return keep
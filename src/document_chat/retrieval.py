@@ -1,14 +1,37 @@
 import sys
 import os
+import json
+import time
 from operator import itemgetter
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 
+import numpy as np
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
+from utils.vectorstore_cache import get_vectorstore_cache, index_version
+from src.document_chat.cache import get_chat_cache
+from utils.index_factory import IndexSettings, tune_index
+from utils.faiss_store import load_store
+from utils.bm25_index import BM25Index, HybridSettings, load_bm25, rrf_fuse
+from utils.concurrency import run_blocking
+from utils.metrics import llm_call, observe_stage, timed
+from src.document_chat.rerank import (
+    MMR,
+    SEARCH_TYPES,
+    SIMILARITY,
+    THRESHOLD,
+    RerankSettings,
+    adaptive_cut,
+    candidate_vectors,
+    cosine_scores,
+    mmr_select,
+)
 from exception.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from prompt.prompt_library import PROMPT_REGISTRY
@@ -42,10 +65,28 @@ class ConversationalRAG:
             # Lazy pieces
             self.retriever = retriever
             self.chain = None
+            self.retrieve_chain = None
+            self.answer_chain = None
+            self.last_retrieval: Dict[str, Any] = {}
+            self.last_docs: List[Document] = []
+            self.last_answer_cached = False
+
+            # Set by load_retriever_from_faiss; enable the chat cache tiers
+            self.vectorstore: Optional[FAISS] = None
+            self.embeddings = None
+            self.index_path: Optional[str] = None
+            self.index_version: Optional[tuple] = None
+            self.search_type = "similarity"
+            self.search_kwargs: Dict[str, Any] = {}
+            self.bm25: Optional[BM25Index] = None
+            self.hybrid: Optional[HybridSettings] = None
+            self.rewrite_similarity = (
+                ModelLoader().config.get("retriever", {}) or {}
+            ).get("rewrite_similarity", 0.8)
             if self.retriever is not None:
                 self._build_lcel_chain()
 
-            self.log.info("ConversationalRAG initialized", session_id=self.session_id)
+            self.log.debug("ConversationalRAG initialized", session_id=self.session_id)
         except Exception as e:
             self.log.error("Failed to initialize ConversationalRAG", error=str(e))
             raise DocumentPortalException(
@@ -63,7 +104,8 @@ class ConversationalRAG:
         search_kwargs: Optional[Dict[str, Any]] = None,
     ):
         """
-        Load FAISS vectorstore from disk and build retriever + LCEL chain.
+        Load FAISS vectorstore (from the in-process cache, or disk on a miss)
+        and build retriever + LCEL chain.
         """
         try:
             if not os.path.isdir(index_path):
@@ -71,20 +113,49 @@ class ConversationalRAG:
                     f"FAISS index directory not found: {index_path}"
                 )
 
-            embeddings = ModelLoader().load_embeddings()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,  # ok if you trust the index
-            )
+            loader = ModelLoader()
+            embeddings = loader.load_embeddings()
+            index_settings = IndexSettings.from_config(loader.config)
+            faiss_cfg = loader.config.get("faiss_db", {}) or {}
+
+            def load() -> FAISS:
+                # Memory-mapped index; chunk text is read from SQLite per hit
+                vs = load_store(
+                    index_path,
+                    embeddings,
+                    index_name=index_name,
+                    mmap=faiss_cfg.get("mmap", True),
+                    allow_legacy_pickle=faiss_cfg.get("allow_legacy_pickle", False),
+                )
+                tune_index(vs.index, index_settings)
+                return vs
 
-            if search_kwargs is None:
-                search_kwargs = {"k": k}
+            vectorstore = get_vectorstore_cache().get(index_path, load, index_name=index_name)
 
-            self.retriever = vectorstore.as_retriever(
-                search_type=search_type, search_kwargs=search_kwargs
+            # Fill mmr / threshold knobs the caller left out from retriever.rerank
+            search_kwargs = RerankSettings.from_config(loader.config).resolve(
+                search_type, {"k": k, **(search_kwargs or {})}
             )
+
+            self.vectorstore = vectorstore
+            self.embeddings = embeddings
+            self.index_path = index_path
+            self.index_version = index_version(index_path, index_name)
+            self.search_type = search_type
+            self.search_kwargs = search_kwargs
+            self.hybrid = HybridSettings.from_config(loader.config)
+            # Lexical side of hybrid search; None for stores built without one
+            self.bm25 = load_bm25(index_path, index_name) if self.hybrid.enabled else None
+
+            # Fallback retriever; the search types in SEARCH_TYPES run through _search
+            if search_type == THRESHOLD:
+                self.retriever = vectorstore.as_retriever(
+                    search_type=SIMILARITY, search_kwargs={"k": search_kwargs["k"]}
+                )
+            else:
+                self.retriever = vectorstore.as_retriever(
+                    search_type=search_type, search_kwargs=search_kwargs
+                )
             self._build_lcel_chain()
 
             self.log.info(
@@ -92,6 +163,8 @@ class ConversationalRAG:
                 index_path=index_path,
                 index_name=index_name,
                 k=k,
+                search_type=search_type,
+                hybrid=self.bm25 is not None,
                 session_id=self.session_id,
             )
             return self.retriever
@@ -111,26 +184,132 @@ class ConversationalRAG:
                     sys,
                 )
             chat_history = chat_history or []
+            cached = self._cached_answer(user_input, chat_history)
+            if cached is not None:
+                return cached["answer"]
             payload = {"input": user_input, "chat_history": chat_history}
             answer = self.chain.invoke(payload)
             if not answer:
                 self.log.warning(
                     "No answer generated",
-                    user_input=user_input,
+                    question_chars=len(user_input),
                     session_id=self.session_id,
                 )
                 return "no answer generated."
             self.log.info(
                 "Chain invoked successfully",
                 session_id=self.session_id,
-                user_input=user_input,
-                answer_preview=str(answer)[:150],
+                question_chars=len(user_input),
+                answer_chars=len(str(answer)),
             )
+            self._store_answer(user_input, chat_history, answer)
             return answer
         except Exception as e:
             self.log.error("Failed to invoke ConversationalRAG", error=str(e))
             raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
 
+    async def ainvoke(
+        self, user_input: str, chat_history: Optional[List[BaseMessage]] = None
+    ) -> str:
+        """Invoke the LCEL pipeline without blocking the event loop."""
+        try:
+            if self.chain is None:
+                raise DocumentPortalException(
+                    "RAG chain not initialized. Call load_retriever_from_faiss() before ainvoke().",
+                    sys,
+                )
+            chat_history = chat_history or []
+            cached = self._cached_answer(user_input, chat_history)
+            if cached is not None:
+                return cached["answer"]
+            payload = {"input": user_input, "chat_history": chat_history}
+            answer = await self.chain.ainvoke(payload)
+            if not answer:
+                self.log.warning(
+                    "No answer generated",
+                    question_chars=len(user_input),
+                    session_id=self.session_id,
+                )
+                return "no answer generated."
+            self.log.info(
+                "Chain invoked successfully",
+                session_id=self.session_id,
+                question_chars=len(user_input),
+                answer_chars=len(str(answer)),
+            )
+            self._store_answer(user_input, chat_history, answer)
+            return answer
+        except Exception as e:
+            self.log.error("Failed to invoke ConversationalRAG", error=str(e))
+            raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
+
+    async def astream(
+        self, user_input: str, chat_history: Optional[List[BaseMessage]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the answer: one "sources" event with retrieved chunk metadata,
+        then "token" events as the LLM produces them, then "done".
+        """
+        if self.retrieve_chain is None or self.answer_chain is None:
+            raise DocumentPortalException(
+                "RAG chain not initialized. Call load_retriever_from_faiss() before astream().",
+                sys,
+            )
+        chat_history = chat_history or []
+        started = time.perf_counter()
+        payload = {"input": user_input, "chat_history": chat_history}
+
+        cached = self._cached_answer(user_input, chat_history)
+        if cached is not None:
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "token", "data": cached["answer"]}
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            yield {
+                "event": "done",
+                "data": {"ttft_ms": elapsed, "total_ms": elapsed, "cache_hit": True},
+            }
+            return
+
+        docs = await self.retrieve_chain.ainvoke(payload)
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        yield {
+            "event": "sources",
+            "data": [dict(getattr(d, "metadata", {}) or {}) for d in docs],
+        }
+
+        ttft_ms: Optional[float] = None
+        parts: List[str] = []
+        async for token in self.answer_chain.astream(
+            {
+                "context": self._format_docs(docs),
+                "input": user_input,
+                "chat_history": chat_history,
+            }
+        ):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            parts.append(token)
+            yield {"event": "token", "data": token}
+
+        total_ms = (time.perf_counter() - started) * 1000
+        self._store_answer(user_input, chat_history, "".join(parts))
+        self.log.info(
+            "Streaming answer complete",
+            session_id=self.session_id,
+            retrieval_ms=round(retrieval_ms, 1),
+            ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None,
+            total_ms=round(total_ms, 1),
+            answer_chars=sum(len(p) for p in parts),
+        )
+        yield {
+            "event": "done",
+            "data": {
+                "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                "total_ms": round(total_ms, 1),
+                "cache_hit": False,
+            },
+        }
+
     # ---------- Internals ----------
 
     def _load_llm(self):
@@ -138,12 +317,239 @@ class ConversationalRAG:
             llm = ModelLoader().load_llm()
             if not llm:
                 raise ValueError("LLM could not be loaded")
-            self.log.info("LLM loaded successfully", session_id=self.session_id)
+            self.log.debug("LLM loaded successfully", session_id=self.session_id)
             return llm
         except Exception as e:
             self.log.error("Failed to load LLM", error=str(e))
             raise DocumentPortalException("LLM loading error in ConversationalRAG", sys)
 
+    def _cached_answer(self, user_input: str, chat_history: List[BaseMessage]):
+        """Tier-1 lookup; only first-turn questions are answer-cacheable."""
+        self.last_answer_cached = False
+        if chat_history or self.index_path is None:
+            return None
+        hit = get_chat_cache().get_answer(
+            self.index_path, self.index_version, self.session_id, user_input, self._search_params()
+        )
+        if hit is not None:
+            self.last_answer_cached = True
+            self.log.info("Answer cache hit", session_id=self.session_id)
+        return hit
+
+    def _store_answer(self, user_input: str, chat_history: List[BaseMessage], answer: str):
+        if chat_history or self.index_path is None or not answer:
+            return
+        get_chat_cache().put_answer(
+            self.index_path,
+            self.index_version,
+            self.session_id,
+            user_input,
+            answer,
+            [dict(d.metadata or {}) for d in self.last_docs],
+            self._search_params(),
+        )
+
+    def _search_params(self) -> tuple:
+        hybrid = vars(self.hybrid) if self.bm25 is not None else None
+        return (
+            self.search_type,
+            json.dumps(self.search_kwargs, sort_keys=True, default=str),
+            json.dumps(hybrid, sort_keys=True),
+        )
+
+    def _fast_path(self) -> bool:
+        """Searches this class runs itself (cached, hybrid, re-ranked)."""
+        return self.vectorstore is not None and self.search_type in SEARCH_TYPES
+
+    def _rank(self, query: str, embedding: List[float]) -> List[str]:
+        """
+        Docstore ids for a query: FAISS candidates (fused with BM25 rows when
+        hybrid search is on), then MMR / adaptive-k selection down to k.
+        """
+        started = time.perf_counter()
+        vs: FAISS = self.vectorstore  # type: ignore[assignment]
+        kwargs = self.search_kwargs
+        k = kwargs.get("k", 4)
+        rerank = self.search_type != SIMILARITY
+        depth = max(k, kwargs.get("fetch_k", k) if rerank else k)
+        if self.bm25 is not None:
+            depth = max(depth, self.hybrid.candidates)  # type: ignore[union-attr]
+
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        _, found = vs.index.search(query_vec.reshape(1, -1), depth)
+        positions = [int(p) for p in found[0] if p >= 0]
+
+        lexical = 0
+        if self.bm25 is not None:
+            hybrid: HybridSettings = self.hybrid  # type: ignore[assignment]
+            # BM25 rows are FAISS positions; rows past the loaded index are skipped
+            rows = [r for r, _ in self.bm25.search(query, hybrid.candidates) if r < vs.index.ntotal]
+            lexical = len(rows)
+            positions = rrf_fuse(
+                [positions, rows],
+                [1.0 - hybrid.lexical_weight, hybrid.lexical_weight],
+                hybrid.rrf_k,
+            )[:depth]
+
+        if self.search_type == MMR:
+            vectors = candidate_vectors(vs.index, positions)
+            picks = mmr_select(query_vec, vectors, k, kwargs["lambda_mult"])
+            positions = [positions[i] for i in picks]
+        elif self.search_type == THRESHOLD:
+            scores = cosine_scores(query_vec, candidate_vectors(vs.index, positions))
+            picks = adaptive_cut(
+                scores,
+                k,
+                score_threshold=kwargs["score_threshold"],
+                max_drop=kwargs["max_drop"],
+                min_k=kwargs["min_k"],
+            )
+            positions = [positions[i] for i in picks]
+        else:
+            positions = positions[:k]
+
+        ids = [vs.index_to_docstore_id[p] for p in positions]
+        elapsed = time.perf_counter() - started
+        observe_stage("vector_search", elapsed)
+        self.log.debug(
+            "Candidates ranked",
+            search_type=self.search_type,
+            candidates=depth,
+            lexical_hits=lexical,
+            selected=len(ids),
+            rank_ms=round(elapsed * 1000, 2),
+        )
+        return ids
+
+    def _docs_from_ids(self, ids: List[str]) -> Optional[List[Document]]:
+        docs = [self.vectorstore.docstore.search(i) for i in ids]  # type: ignore[union-attr]
+        if all(isinstance(d, Document) for d in docs):
+            return docs  # type: ignore[return-value]
+        return None
+
+    def _fetch_docs(self, ids: List[str]) -> List[Document]:
+        docs = [self.vectorstore.docstore.search(i) for i in ids]  # type: ignore[union-attr]
+        return [d for d in docs if isinstance(d, Document)]
+
+    def _search(self, query: str) -> List[Document]:
+        """Vector (or hybrid vector + BM25) search, re-ranked per search_type, through the tier-2 retrieval cache."""
+        if not self._fast_path():
+            return self.retriever.invoke(query)  # type: ignore[union-attr]
+        cache = get_chat_cache()
+        with timed("embed_query"):
+            embedding = self.embeddings.embed_query(query)  # type: ignore[union-attr]
+        ids = cache.get_retrieval(
+            self.index_path, self.index_version, self._search_params(), query, embedding  # type: ignore[arg-type]
+        )
+        if ids is not None:
+            docs = self._docs_from_ids(ids)
+            if docs is not None:
+                return docs
+        ids = self._rank(query, embedding)
+        cache.put_retrieval(
+            self.index_path, self.index_version, self._search_params(), query, embedding,  # type: ignore[arg-type]
+            ids,
+        )
+        return self._fetch_docs(ids)
+
+    async def _asearch(self, query: str) -> List[Document]:
+        if not self._fast_path():
+            return await self.retriever.ainvoke(query)  # type: ignore[union-attr]
+        cache = get_chat_cache()
+        with timed("embed_query"):
+            embedding = await self.embeddings.aembed_query(query)  # type: ignore[union-attr]
+        ids = cache.get_retrieval(
+            self.index_path, self.index_version, self._search_params(), query, embedding  # type: ignore[arg-type]
+        )
+        if ids is not None:
+            docs = self._docs_from_ids(ids)
+            if docs is not None:
+                return docs
+        ids = await run_blocking("cpu", self._rank, query, embedding)
+        cache.put_retrieval(
+            self.index_path, self.index_version, self._search_params(), query, embedding,  # type: ignore[arg-type]
+            ids,
+        )
+        return self._fetch_docs(ids)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(str(text).lower().split()).rstrip("?.! ")
+
+    @classmethod
+    def _similarity(cls, question: str, rewritten: str) -> float:
+        """Share of the rewritten question's words that the raw question already has."""
+        words = set(cls._normalize(rewritten).split())
+        if not words:
+            return 1.0
+        return len(words & set(cls._normalize(question).split())) / len(words)
+
+    def _needs_rewritten_search(self, question: str, rewritten: str):
+        """
+        Decided before any second search: a rewrite that only restates the
+        question keeps the speculative hits; anything else is searched and used.
+        """
+        if self._normalize(rewritten) == self._normalize(question):
+            return False, "speculative_same_query", None
+        similarity = self._similarity(question, rewritten)
+        if similarity >= self.rewrite_similarity:
+            return False, "speculative_hit", similarity
+        return True, "rewritten", similarity
+
+    def _log_retrieval(
+        self, strategy: str, started: float, docs: List[Document], rewrite_ms=None, similarity=None
+    ):
+        elapsed = time.perf_counter() - started
+        observe_stage("retrieval", elapsed)
+        self.last_retrieval = {
+            "strategy": strategy,
+            "search_type": self.search_type,
+            "chunks": len(docs),
+            "retrieval_ms": round(elapsed * 1000, 1),
+            "rewrite_ms": None if rewrite_ms is None else round(rewrite_ms, 1),
+            "similarity": None if similarity is None else round(similarity, 3),
+        }
+        self.log.info(
+            "Retrieval strategy", session_id=self.session_id, **self.last_retrieval
+        )
+
+    def _retrieve(self, payload: Dict[str, Any]) -> List[Document]:
+        started = time.perf_counter()
+        question = payload["input"]
+        if not payload.get("chat_history"):
+            # First turn: nothing to contextualize, skip the rewrite LLM call
+            docs = self._search(question)
+            self._log_retrieval("direct", started, docs)
+            self.last_docs = docs
+            return docs
+
+        out = self._speculate.invoke(payload)
+        rewrite_ms = (time.perf_counter() - started) * 1000
+        rewritten = out["rewritten"]
+        needed, strategy, similarity = self._needs_rewritten_search(question, rewritten)
+        docs = self._search(rewritten) if needed else out["speculative"]
+        self._log_retrieval(strategy, started, docs, rewrite_ms, similarity)
+        self.last_docs = docs
+        return docs
+
+    async def _aretrieve(self, payload: Dict[str, Any]) -> List[Document]:
+        started = time.perf_counter()
+        question = payload["input"]
+        if not payload.get("chat_history"):
+            docs = await self._asearch(question)
+            self._log_retrieval("direct", started, docs)
+            self.last_docs = docs
+            return docs
+
+        out = await self._speculate.ainvoke(payload)
+        rewrite_ms = (time.perf_counter() - started) * 1000
+        rewritten = out["rewritten"]
+        needed, strategy, similarity = self._needs_rewritten_search(question, rewritten)
+        docs = await self._asearch(rewritten) if needed else out["speculative"]
+        self._log_retrieval(strategy, started, docs, rewrite_ms, similarity)
+        self.last_docs = docs
+        return docs
+
     @staticmethod
     def _format_docs(docs) -> str:
         return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
@@ -156,32 +562,35 @@ class ConversationalRAG:
                 )
 
             # 1) Rewrite user question with chat history context
-            question_rewriter = (
+            self.question_rewriter = (
                 {
                     "input": itemgetter("input"),
                     "chat_history": itemgetter("chat_history"),
                 }
                 | self.contextualize_prompt
-                | self.llm
+                | llm_call(self.llm, "rewrite")
                 | StrOutputParser()
             )
+            # Rewrite and speculative retrieval on the raw question run in parallel
+            self._speculate = RunnableParallel(
+                rewritten=self.question_rewriter,
+                speculative=itemgetter("input")
+                | RunnableLambda(self._search, afunc=self._asearch),
+            )
 
-            # 2) Retrieve docs for rewritten question
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            # 2) Retrieve docs: direct when there is no history, else speculative
+            self.retrieve_chain = RunnableLambda(self._retrieve, afunc=self._aretrieve)
+            retrieve_docs = self.retrieve_chain | self._format_docs
 
             # 3) Answer using retrieved context + original input + chat history
-            self.chain = (
-                {
-                    "context": retrieve_docs,
-                    "input": itemgetter("input"),
-                    "chat_history": itemgetter("chat_history"),
-                }
-                | self.qa_prompt
-                | self.llm
-                | StrOutputParser()
-            )
+            self.answer_chain = self.qa_prompt | llm_call(self.llm, "answer") | StrOutputParser()
+            self.chain = {
+                "context": retrieve_docs,
+                "input": itemgetter("input"),
+                "chat_history": itemgetter("chat_history"),
+            } | self.answer_chain
 
-            self.log.info("LCEL graph built successfully", session_id=self.session_id)
+            self.log.debug("LCEL graph built successfully", session_id=self.session_id)
         except Exception as e:
             self.log.error(
                 "Failed to build LCEL chain", error=str(e), session_id=self.session_id
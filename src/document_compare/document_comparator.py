@@ -1,20 +1,26 @@
+import asyncio
 import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import pandas as pd
-from dotenv import load_dotenv
 from logger.custom_logger import CustomLogger
 from utils.model_loader import ModelLoader
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
-from model.models import SummaryResponse
+from model.models import ChangeFormat, PromptType, SummaryResponse
 from prompt.prompt_library import PROMPT_REGISTRY
 from exception.custom_exception import DocumentPortalException
+from utils.result_cache import get_result_cache, result_key
+from utils.concurrency import run_blocking
+from utils.metrics import llm_call
+from src.document_compare.page_diff import EQUAL, PagePair, align_pages, render_changed_pages
 
 
 class DocumentComparatorLLM:
     def __init__(self):
-        load_dotenv()
         self.logger = CustomLogger().get_logger(name=__name__)
-        self.llm = ModelLoader().load_llm()
+        self.loader = ModelLoader()
+        self.llm = llm_call(self.loader.load_llm(), "compare")
         self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
         self.fixing_parser = OutputFixingParser.from_llm(
             parser=self.parser, llm=self.llm
@@ -22,6 +28,27 @@ class DocumentComparatorLLM:
         self.prompt = PROMPT_REGISTRY.get("document_comparison", "")
 
         self.chain = self.prompt | self.llm | self.parser
+        self.diff_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_DIFF_COMPARISON.value]
+        self.diff_chain = self.diff_prompt | self.llm | self.parser
+
+        cfg = self.loader.config.get("comparison", {}) or {}
+        self.diff_context_lines = cfg.get("diff_context_lines", 2)
+        self.max_diff_chars = cfg.get("max_diff_chars_per_page", 6000)
+        self.window_pages = cfg.get("window_pages", 20)
+        self.window_chars = cfg.get("window_chars", 40000)
+        self.max_concurrency = cfg.get("max_concurrency", 4)
+
+        self.last_cache_hit = False
+        self.last_diff_stats: dict = {}
+
+    def _cache_key(self, text: str, kind: str = "comparison", prompt=None) -> str:
+        return result_key(
+            kind,
+            text,
+            prompt if prompt is not None else self.prompt,
+            self.loader.registry.llm_config(),
+            extra=self.parser.get_format_instructions(),
+        )
 
     def compare_documents(self, combined_docs: str) -> pd.DataFrame:
         """
@@ -33,11 +60,53 @@ class DocumentComparatorLLM:
                 "format_instruction": self.parser.get_format_instructions(),
             }
 
+            cache = get_result_cache()
+            key = self._cache_key(combined_docs)
+            cached = cache.get(key) if cache else None
+            self.last_cache_hit = cached is not None
+            if cached is not None:
+                self.logger.info("Comparison served from result cache")
+                return self._format_response(cached)
+
             self.logger.info("Invoking document comparison LLM chain")
             response = self.chain.invoke(inputs)
             self.logger.info(
                 "Chain invoked successfully", response_preview=str(response)[:200]
             )
+            if cache:
+                cache.put(key, "comparison", response)
+            return self._format_response(response)
+        except Exception as e:
+            self.logger.error(f"Error in compare documents: {e}")
+            raise DocumentPortalException(
+                "An error occured while comparing documents.", sys
+            )
+
+    async def acompare_documents(self, combined_docs: str) -> pd.DataFrame:
+        """
+        Async variant of compare_documents built on ainvoke.
+        """
+        try:
+            inputs = {
+                "combined_docs": combined_docs,
+                "format_instruction": self.parser.get_format_instructions(),
+            }
+
+            cache = get_result_cache()
+            key = self._cache_key(combined_docs)
+            cached = await run_blocking("io", cache.get, key) if cache else None
+            self.last_cache_hit = cached is not None
+            if cached is not None:
+                self.logger.info("Comparison served from result cache")
+                return self._format_response(cached)
+
+            self.logger.info("Invoking document comparison LLM chain")
+            response = await self.chain.ainvoke(inputs)
+            self.logger.info(
+                "Chain invoked successfully", response_preview=str(response)[:200]
+            )
+            if cache:
+                await run_blocking("io", cache.put, key, "comparison", response)
             return self._format_response(response)
         except Exception as e:
             self.logger.error(f"Error in compare documents: {e}")
@@ -45,6 +114,210 @@ class DocumentComparatorLLM:
                 "An error occured while comparing documents.", sys
             )
 
+    # ---------- Page-diff pre-filter ----------
+
+    def _align(self, ref_pages: List[str], act_pages: List[str]) -> List[PagePair]:
+        pairs = align_pages(
+            ref_pages, act_pages, self.diff_context_lines, self.max_diff_chars
+        )
+        changed = sum(1 for p in pairs if p.status != EQUAL)
+        self.last_diff_stats = {
+            "reference_pages": len(ref_pages),
+            "actual_pages": len(act_pages),
+            "aligned_pages": len(pairs),
+            "changed_pages": changed,
+        }
+        return pairs
+
+    def _windows(self, pairs: List[PagePair]) -> List[List[PagePair]]:
+        """
+        Split aligned pairs into contiguous windows, each holding at most
+        window_pages changed pages and window_chars of diff text. Unchanged
+        pages ride along in whichever window they fall in.
+        """
+        windows: List[List[PagePair]] = []
+        current: List[PagePair] = []
+        pages = chars = 0
+        for p in pairs:
+            if p.status != EQUAL:
+                size = len(p.diff)
+                if pages and (pages >= self.window_pages or chars + size > self.window_chars):
+                    windows.append(current)
+                    current, pages, chars = [], 0, 0
+                pages += 1
+                chars += size
+            current.append(p)
+        if current:
+            windows.append(current)
+        self.last_diff_stats["windows"] = len(windows)
+        return windows
+
+    def _window_rows(self, pairs: List[PagePair], response: Optional[list]) -> List[dict]:
+        """
+        One row per aligned page, in page order: unchanged pages are
+        'NO CHANGE' rows; changed pages take the LLM's summary, falling back
+        to the raw line diff if the LLM skipped that page. Summaries for
+        pages outside the window are logged and dropped.
+        """
+        summaries = {}
+        for item in response or []:
+            if isinstance(item, dict) and "Page" in item:
+                summaries[str(item["Page"]).strip()] = str(item.get("Changes", ""))
+        rows = []
+        for p in pairs:
+            if p.status == EQUAL:
+                rows.append(ChangeFormat(Page=p.label, Changes="NO CHANGE").model_dump())
+                continue
+            changes = summaries.pop(p.label, None)
+            if changes is None:
+                changes = summaries.pop(str(p.act_page or p.ref_page), None)
+            rows.append(ChangeFormat(Page=p.label, Changes=changes or p.diff).model_dump())
+        if summaries:
+            # Pages the LLM made up or mislabelled: not part of this window
+            self.logger.warning("Unmatched LLM page summaries dropped", pages=list(summaries))
+        return rows
+
+    def _diff_inputs(self, page_diffs: str) -> dict:
+        return {
+            "page_diffs": page_diffs,
+            "format_instruction": self.parser.get_format_instructions(),
+        }
+
+    def compare_pages(self, ref_pages: List[str], act_pages: List[str]) -> pd.DataFrame:
+        """
+        Compare two documents page by page: identical pages are resolved
+        locally and the diffs of changed pages are compared in windows,
+        concurrently (comparison.max_concurrency), then merged in page order.
+        """
+        try:
+            started = time.perf_counter()
+            windows = self._windows(self._align(ref_pages, act_pages))
+            diffs = [render_changed_pages(w) for w in windows]
+            cache = get_result_cache()
+            keys = [
+                self._cache_key(d, "comparison:diff", self.diff_prompt) if d else None
+                for d in diffs
+            ]
+            responses: List[Optional[list]] = [
+                cache.get(k) if (cache and k) else None for k in keys
+            ]
+            todo = [i for i, d in enumerate(diffs) if d and responses[i] is None]
+            if todo:
+                self.logger.info(
+                    "Invoking page-diff comparison LLM chain",
+                    llm_windows=len(todo),
+                    **self.last_diff_stats,
+                )
+                fresh = self.diff_chain.batch(
+                    [self._diff_inputs(diffs[i]) for i in todo],
+                    config={"max_concurrency": self.max_concurrency},
+                )
+                for i, response in zip(todo, fresh):
+                    responses[i] = response
+                    if cache:
+                        cache.put(keys[i], "comparison", response)  # type: ignore[arg-type]
+            self.last_cache_hit = any(diffs) and not todo
+            rows = [
+                row for w, r in zip(windows, responses) for row in self._window_rows(w, r)
+            ]
+            self.logger.info(
+                "Page-diff comparison complete",
+                cache_hit=self.last_cache_hit,
+                seconds=round(time.perf_counter() - started, 3),
+            )
+            return self._format_response(rows)
+        except Exception as e:
+            self.logger.error(f"Error in compare pages: {e}")
+            raise DocumentPortalException(
+                "An error occured while comparing documents.", sys
+            )
+
+    async def _acompare_window(self, pairs: List[PagePair]) -> Tuple[List[dict], bool]:
+        page_diffs = render_changed_pages(pairs)
+        if not page_diffs:
+            return self._window_rows(pairs, []), False
+        cache = get_result_cache()
+        key = self._cache_key(page_diffs, "comparison:diff", self.diff_prompt)
+        response = await run_blocking("io", cache.get, key) if cache else None
+        cache_hit = response is not None
+        if response is None:
+            response = await self.diff_chain.ainvoke(self._diff_inputs(page_diffs))
+            if cache:
+                await run_blocking("io", cache.put, key, "comparison", response)
+        return self._window_rows(pairs, response), cache_hit
+
+    async def astream_pages(
+        self, ref_pages: List[str], act_pages: List[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Windowed page comparison as events: one "plan" event with the
+        alignment stats, then a "rows" event per window as soon as that
+        window finishes (windows complete out of order; each carries its index).
+        """
+        started = time.perf_counter()
+        pairs = await run_blocking("cpu", self._align, ref_pages, act_pages)
+        windows = self._windows(pairs)
+        yield {"event": "plan", "data": dict(self.last_diff_stats)}
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(index: int, window: List[PagePair]):
+            async with semaphore:
+                rows, cache_hit = await self._acompare_window(window)
+            return index, window, rows, cache_hit
+
+        tasks = [asyncio.create_task(run(i, w)) for i, w in enumerate(windows)]
+        llm_windows = hits = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, window, rows, cache_hit = await next_done
+                changed = sum(1 for p in window if p.status != EQUAL)
+                llm_windows += bool(changed)
+                hits += cache_hit
+                yield {
+                    "event": "rows",
+                    "data": {
+                        "window": index,
+                        "changed_pages": changed,
+                        "cache_hit": cache_hit,
+                        "rows": rows,
+                    },
+                }
+        finally:
+            for t in tasks:
+                t.cancel()
+
+        self.last_cache_hit = bool(llm_windows) and hits == llm_windows
+        total_ms = (time.perf_counter() - started) * 1000
+        self.logger.info(
+            "Page-diff comparison complete",
+            cache_hit=self.last_cache_hit,
+            total_ms=round(total_ms, 1),
+            **self.last_diff_stats,
+        )
+        yield {
+            "event": "done",
+            "data": {"total_ms": round(total_ms, 1), "cache_hit": self.last_cache_hit},
+        }
+
+    async def acompare_pages(self, ref_pages: List[str], act_pages: List[str]) -> pd.DataFrame:
+        """
+        Async variant of compare_pages: runs astream_pages and merges the
+        windows back into page order.
+        """
+        try:
+            by_window: Dict[int, List[dict]] = {}
+            async for event in self.astream_pages(ref_pages, act_pages):
+                if event["event"] == "rows":
+                    by_window[event["data"]["window"]] = event["data"]["rows"]
+            rows = [row for i in sorted(by_window) for row in by_window[i]]
+            return self._format_response(rows)
+        except Exception as e:
+            self.logger.error(f"Error in compare pages: {e}")
+            raise DocumentPortalException(
+                "An error occured while comparing documents.", sys
+            )
+
     def _format_response(self, response_parsed: list[dict]) -> pd.DataFrame:
         """
         Formats the response from the LLM into a structured format
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+_WS = re.compile(r"\s+")
+
+EQUAL = "equal"
+CHANGED = "changed"
+INSERTED = "inserted"
+DELETED = "deleted"
+
+
+def normalize_page(text: str) -> str:
+    """Whitespace-insensitive form of a page used for hashing and diffing."""
+    return _WS.sub(" ", text).strip()
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(normalize_page(text).encode("utf-8")).hexdigest()
+
+
+def _lines(text: str) -> List[str]:
+    return [ln for ln in (_WS.sub(" ", line).strip() for line in text.splitlines()) if ln]
+
+
+@dataclass
+class PagePair:
+    """One aligned position: 1-based page numbers (None when absent) and status."""
+
+    ref_page: Optional[int]
+    act_page: Optional[int]
+    status: str
+    diff: str = ""
+
+    @property
+    def label(self) -> str:
+        if self.status == DELETED:
+            return f"{self.ref_page} (removed from actual)"
+        if self.status == INSERTED:
+            return f"{self.act_page} (new in actual)"
+        if self.ref_page == self.act_page:
+            return str(self.act_page)
+        return f"{self.act_page} (reference page {self.ref_page})"
+
+
+def line_diff(ref_text: str, act_text: str, context: int = 2, max_chars: int = 6000) -> str:
+    """Unified line diff of two pages, truncated to max_chars."""
+    lines = list(difflib.unified_diff(_lines(ref_text), _lines(act_text), n=context, lineterm=""))
+    diff = "\n".join(lines[2:])  # drop the ---/+++ file header
+    if len(diff) > max_chars:
+        diff = diff[:max_chars] + "\n... (diff truncated)"
+    return diff
+
+
+def align_pages(
+    ref_pages: List[str],
+    act_pages: List[str],
+    context: int = 2,
+    max_diff_chars: int = 6000,
+) -> List[PagePair]:
+    """
+    Align two page sequences by normalized page hash so an inserted or
+    deleted page does not shift every later page, then diff the pairs that
+    differ. Pages inside a replaced block are paired positionally; leftovers
+    become inserted / deleted pages.
+    """
+    ref_hashes = [page_hash(p) for p in ref_pages]
+    act_hashes = [page_hash(p) for p in act_pages]
+    matcher = difflib.SequenceMatcher(a=ref_hashes, b=act_hashes, autojunk=False)
+
+    pairs: List[PagePair] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs.extend(PagePair(i + 1, j + 1, EQUAL) for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        common = min(i2 - i1, j2 - j1)
+        for k in range(common):
+            i, j = i1 + k, j1 + k
+            pairs.append(
+                PagePair(
+                    i + 1,
+                    j + 1,
+                    CHANGED,
+                    line_diff(ref_pages[i], act_pages[j], context, max_diff_chars),
+                )
+            )
+        for i in range(i1 + common, i2):
+            pairs.append(
+                PagePair(i + 1, None, DELETED, line_diff(ref_pages[i], "", context, max_diff_chars))
+            )
+        for j in range(j1 + common, j2):
+            pairs.append(
+                PagePair(None, j + 1, INSERTED, line_diff("", act_pages[j], context, max_diff_chars))
+            )
+    return pairs
+
+
+def render_changed_pages(pairs: List[PagePair]) -> str:
+    """Prompt text holding only the changed page pairs and their diffs."""
+    blocks = []
+    for p in pairs:
+        if p.status == EQUAL:
+            continue
+        blocks.append(f"Page: {p.label}\nStatus: {p.status}\nDiff:\n{p.diff or '(whitespace only)'}")
+    return "\n\n".join(blocks)
@@ -2,16 +2,17 @@ from __future__ import annotations
 import os
 import sys
 import json
+import threading
 
 # import uuid
 import hashlib
-import shutil
 from pathlib import Path
 
 # from datetime import datetime, timezone
-from typing import Iterable, List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, Set, Tuple
 
 import fitz  # PyMuPDF
+import numpy as np
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -20,10 +21,46 @@ from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
-from exception.custom_exception import DocumentPortalException
-
-from utils.file_io import _session_id, save_uploaded_files
+from exception.custom_exception import DocumentPortalException, UploadTooLargeError
+
+from utils.file_io import (
+    _session_id,
+    stream_uploaded_files,
+    stream_to_file,
+    SavedFile,
+    UploadBudget,
+)
 from utils.document_ops import load_documents
+from src.document_ingestion.embedding_pipeline import EmbeddingPipeline
+from src.document_chat.cache import get_chat_cache
+from utils.index_factory import IndexSettings, build_index, migrate_index, tune_index
+from utils.concurrency import get_executor
+from utils.metrics import timed
+from utils.faiss_store import (
+    SegmentSettings,
+    SqliteDocstore,
+    append_segment,
+    compact_store,
+    docstore_path,
+    is_legacy,
+    load_store,
+    new_store,
+    read_manifest,
+    save_store,
+    store_exists,
+    store_lock,
+)
+from utils.bm25_index import (
+    BM25Index,
+    HybridSettings,
+    bm25_files,
+    bm25_path,
+    bm25_rows,
+    bm25_segment_path,
+    compact_bm25,
+)
+from src.document_ingestion.jobs import ProgressReporter
+from src.document_ingestion.sessions import COMPARE, get_session_catalog
 
 # from utils.file_io import _session_id, save_uploaded_files
 # from utils.document_ops import (
@@ -34,6 +71,10 @@ from utils.document_ops import load_documents
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
+# Index directories with a compaction queued or running in this process
+_compacting: Set[str] = set()
+_compacting_lock = threading.Lock()
+
 
 # FAISS Manager (load-or-create)
 class FaissManager:
@@ -41,79 +82,246 @@ class FaissManager:
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents=True, exist_ok=True)
 
+        # Pre-segment stores kept fingerprints here; they move to the docstore on the next ingest
         self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta: Dict[str, Any] = {"rows": {}}
+        self._legacy_keys: Set[str] = set()
 
         if self.meta_path.exists():
             try:
-                self._meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {
-                    "rows": {}
-                }
+                meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {}
+                self._legacy_keys = set(meta.get("rows", {}))
             except Exception:
-                self._meta = {"rows": {}}
+                self._legacy_keys = set()
 
+        self.log = CustomLogger().get_logger(__name__)
         self.model_loader = model_loader or ModelLoader()
         self.emb = self.model_loader.load_embeddings()
+        self.index_settings = IndexSettings.from_config(self.model_loader.config)
+        self.allow_legacy_pickle = bool(
+            (self.model_loader.config.get("faiss_db", {}) or {}).get("allow_legacy_pickle", False)
+        )
+        self.hybrid = HybridSettings.from_config(self.model_loader.config)
+        self.segments = SegmentSettings.from_config(self.model_loader.config)
         self.vs: Optional[FAISS] = None
 
     def _exists(self) -> bool:
-        return (self.index_dir / "index.faiss").exists() and (
-            self.index_dir / "index.pkl"
-        ).exists()
+        return store_exists(self.index_dir)
 
     @staticmethod
     def _fingerprint(text: str, md: Dict[str, Any]) -> str:
-        src = md.get("source") or md.get("file_path")
-        rid = md.get("row_id")
-        if src is not None:
-            return f"{src}::{'' if rid is None else rid}"
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
-
-    def _save_meta(self):
-        self.meta_path.write_text(
-            json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8"
-        )
-
-    def add_documents(self, docs: List[Document]):
-        if self.vs is None:
-            raise RuntimeError(
-                "Call load_or_create() before add_documents_idempotent()."
-            )
-
+        """
+        Chunk identity: the uploaded file's content hash (saved paths are
+        unique per upload, so they would never match a re-upload), page,
+        chunk offset and the chunk's own hash, scoped to the tenant/session
+        in shared collections. Distinct chunks of one file never collide.
+        """
+        src = md.get("file_sha256") or md.get("source") or md.get("file_path") or ""
+        scope = "/".join(str(md[k]) for k in ("tenant_id", "session_id") if md.get(k))
+        page = md.get("page", "")
+        start = md.get("start_index", "")
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{scope}::{src}::{page}::{start}::{digest}"
+
+    def _docstore(self) -> SqliteDocstore:
+        return SqliteDocstore(docstore_path(self.index_dir))
+
+    def _known(self, keys: List[str]) -> Set[str]:
+        """Fingerprints among keys that the index already holds."""
+        known = set(self._legacy_keys)
+        if self._exists():
+            docstore = self._docstore()
+            try:
+                known |= docstore.known_fingerprints(keys)
+            finally:
+                docstore.close()
+        return known
+
+    def _dedupe(self, docs: List[Document]) -> Tuple[List[Document], List[str]]:
+        """Drop chunks already in the index and duplicates within this batch."""
+        keys = [self._fingerprint(d.page_content, d.metadata or {}) for d in docs]
+        known = self._known(keys)
         new_docs: List[Document] = []
-
-        for d in docs:
-            key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
+        new_keys: List[str] = []
+        for key, d in zip(keys, docs):
+            if key in known:
                 continue
-            self._meta["rows"][key] = True
+            known.add(key)
             new_docs.append(d)
+            new_keys.append(key)
+        return new_docs, new_keys
+
+    def _record_fingerprints(self, keys: List[str]):
+        """Insert only this batch's fingerprints (plus any legacy JSON, once)."""
+        docstore = self._docstore()
+        try:
+            docstore.add_fingerprints([*self._legacy_keys, *keys])
+        finally:
+            docstore.close()
+        if self._legacy_keys:
+            self.meta_path.unlink(missing_ok=True)
+            self._legacy_keys = set()
+
+    def add_documents(
+        self, docs: List[Document], reporter: Optional[ProgressReporter] = None
+    ) -> Dict[str, int]:
+        """
+        Embed each unique, not-yet-indexed chunk exactly once. Creates the
+        index on first use; later batches become append-only segments
+        (compacted in the background), so their cost tracks the batch size
+        rather than the index size. Returns embedded/skipped counts.
+        """
+        reporter = reporter or ProgressReporter()
+        if is_legacy(self.index_dir) or (
+            self.vs is None and self._exists() and not self.segments.enabled
+        ):
+            self.load_or_create()
+
+        new_docs, keys = self._dedupe(docs)
+        stats = {"embedded": len(new_docs), "skipped": len(docs) - len(new_docs)}
 
         if new_docs:
-            self.vs.add_documents(new_docs)
-            self.vs.save_local(str(self.index_dir))
-            self._save_meta()
-        return len(new_docs)
+            texts = [d.page_content for d in new_docs]
+            metadatas = [d.metadata for d in new_docs]
+            reporter.stage("embedding", to_embed=len(texts), skipped=stats["skipped"], embedded=0)
+            vectors = EmbeddingPipeline.from_config(
+                self.emb, self.model_loader.config
+            ).embed(texts, on_progress=lambda n: reporter.progress(embedded=n))
+            reporter.stage("indexing", embedded=len(texts))
+            matrix = np.asarray(vectors, dtype=np.float32)
+            with store_lock(self.index_dir):
+                # Another job may have indexed the same chunks while these were embedding
+                known = self._known(keys)
+                fresh = [i for i, key in enumerate(keys) if key not in known]
+                if len(fresh) < len(keys):
+                    texts = [texts[i] for i in fresh]
+                    metadatas = [metadatas[i] for i in fresh]
+                    keys = [keys[i] for i in fresh]
+                    matrix = matrix[fresh]
+                    stats = {"embedded": len(fresh), "skipped": len(docs) - len(fresh)}
+                if texts:
+                    if self.segments.enabled and self._exists():
+                        first_row = append_segment(self.index_dir, texts, metadatas, matrix)
+                        self.vs = load_store(self.index_dir, self.emb, mmap=True)
+                        tune_index(self.vs.index, self.index_settings)
+                    else:
+                        if self.vs is None and self._exists():
+                            self.load_or_create()  # created by another job meanwhile
+                        first_row = self._save_full(texts, metadatas, matrix)
+                    if self.hybrid.enabled:
+                        self._update_bm25(texts, first_row)
+                    self._record_fingerprints(keys)
+            if texts:
+                get_chat_cache().invalidate(self.index_dir)
+                if self.segments.enabled and self.segments.needs_compaction(
+                    read_manifest(self.index_dir)
+                ):
+                    self.compact_in_background()
+        if self.vs is None and self._exists():
+            # Every chunk was already indexed: still open the store for the caller
+            self.vs = load_store(self.index_dir, self.emb, mmap=True)
+            tune_index(self.vs.index, self.index_settings)
+
+        self.log.info("Chunks ingested", index_dir=str(self.index_dir), **stats)
+        return stats
+
+    def _save_full(self, texts: List[str], metadatas: List[dict], matrix: np.ndarray) -> int:
+        """Create the store, or append in memory and rewrite it (segments disabled)."""
+        if self.vs is None:
+            self.vs = new_store(
+                self.emb, build_index(matrix, self.index_settings), self.index_dir
+            )
+        else:
+            replacement = migrate_index(self.vs.index, matrix, self.index_settings)
+            if replacement is not None:
+                self.vs.index = replacement
+        first_row = self.vs.index.ntotal
+        self.vs.add_embeddings(list(zip(texts, matrix.tolist())), metadatas=metadatas)
+        save_store(self.vs, self.index_dir)
+        return first_row
+
+    def _update_bm25(self, texts: List[str], first_row: int):
+        """
+        Write the new chunks' lexical rows as a segment next to the FAISS
+        files. Rows must line up with FAISS positions, so an index that is
+        missing or out of step (e.g. a store built before hybrid search) is
+        rebuilt from the docstore instead.
+        """
+        bm25 = BM25Index(k1=self.hybrid.k1, b=self.hybrid.b)
+        if bm25_rows(self.index_dir) == first_row:
+            bm25.add(texts)
+            if first_row:
+                bm25.save(bm25_segment_path(self.index_dir, first_row))
+            else:
+                bm25.save(bm25_path(self.index_dir))
+            return
+
+        stale = bm25_files(self.index_dir)
+        if first_row:
+            docstore = self._docstore()
+            try:
+                ids = docstore.index_map()
+                bm25.add(
+                    getattr(docstore.search(ids[i]), "page_content", "")
+                    for i in range(first_row)
+                )
+            finally:
+                docstore.close()
+            self.log.info("BM25 index rebuilt", index_dir=str(self.index_dir), rows=first_row)
+        bm25.add(texts)
+        bm25.save(bm25_path(self.index_dir))
+        for row, path in stale:
+            if row:
+                path.unlink(missing_ok=True)
+
+    def compact(self) -> bool:
+        """Merge the FAISS and BM25 segments into their base files."""
+        done = compact_store(self.index_dir, self.index_settings)
+        if self.hybrid.enabled:
+            with store_lock(self.index_dir):
+                done = compact_bm25(self.index_dir) or done
+        return done
+
+    def compact_in_background(self):
+        """Queue compact() on the ingest executor unless one is already pending for this index."""
+        key = str(self.index_dir.resolve())
+        with _compacting_lock:
+            if key in _compacting:
+                return
+            _compacting.add(key)
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                self.log.error("Segment compaction failed", index_dir=key, error=str(e))
+            finally:
+                with _compacting_lock:
+                    _compacting.discard(key)
+
+        get_executor("ingest").submit(run)
 
     def load_or_create(
         self, texts: Optional[List[str]] = None, metadatas: Optional[List[dict]] = None
     ):
         if self._exists():
-            self.vs = FAISS.load_local(
-                str(self.index_dir),
-                embeddings=self.emb,
-                allow_dangerous_deserialization=True,
+            # Writable (non-mmap) load: ingestion appends to this index
+            self.vs = load_store(
+                self.index_dir,
+                self.emb,
+                mmap=False,
+                allow_legacy_pickle=self.allow_legacy_pickle,
             )
+            tune_index(self.vs.index, self.index_settings)
             return self.vs
         if not texts:
             raise DocumentPortalException(
                 "No existing FAISS index and no data to create one", sys
             )
 
-        self.vs = FAISS.from_texts(
-            texts=texts, embedding=self.emb, metadatas=metadatas or []
+        metadatas = metadatas or [{} for _ in texts]
+        self.add_documents(
+            [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
         )
-        self.vs.save_local(str(self.index_dir))
         return self.vs
 
 
@@ -131,6 +339,8 @@ class ChatIngestor:
 
             self.use_session = use_session_dirs
             self.session_id = session_id or _session_id()
+            self.ingest_stats: Dict[str, int] = {}
+            self.saved_files: List[SavedFile] = []
 
             self.temp_base = Path(temp_base)
             self.temp_base.mkdir(parents=True, exist_ok=True)
@@ -160,11 +370,12 @@ class ChatIngestor:
             return d
         return base
 
+    @timed("split")
     def _split(
         self, docs: List[Document], chunk_size=1000, chunk_overlap=200
     ) -> List[Document]:
         splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
         )
         chunks = splitter.split_documents(docs)
         self.log.info(
@@ -175,42 +386,95 @@ class ChatIngestor:
         )
         return chunks
 
+    def save_files(self, uploaded_files: Iterable) -> List[SavedFile]:
+        """Stream uploads into the session's temp dir (the part that needs the request)."""
+        self.saved_files = stream_uploaded_files(uploaded_files, self.temp_dir)
+        return self.saved_files
+
+    def _load_chunks(
+        self, chunk_size: int, chunk_overlap: int, reporter: ProgressReporter
+    ) -> List[Document]:
+        reporter.stage("loading", files=len(self.saved_files))
+        docs = load_documents([s.path for s in self.saved_files])
+        if not docs:
+            raise ValueError("No valid documents loaded")
+        # Chunks inherit the upload's content hash, which ingest dedupes on
+        hashes = {str(s.path): s.sha256 for s in self.saved_files}
+        for d in docs:
+            sha256 = hashes.get(str(d.metadata.get("source")))
+            if sha256:
+                d.metadata["file_sha256"] = sha256
+        reporter.stage("splitting", documents=len(docs))
+        chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        reporter.progress(chunks=len(chunks))
+        return chunks
+
     def built_retriver(
         self,
-        uploaded_files: Iterable,
+        uploaded_files: Optional[Iterable],
         *,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         k: int = 5,
+        reporter: Optional[ProgressReporter] = None,
     ):
+        """
+        Index uploads into this session's FAISS store and return a retriever.
+        uploaded_files=None indexes the files already stored by save_files()
+        (background jobs save during the request and index later).
+        """
+        reporter = reporter or ProgressReporter()
         try:
-            paths = save_uploaded_files(uploaded_files, self.temp_dir)
-            docs = load_documents(paths)
-            if not docs:
-                raise ValueError("No valid documents loaded")
-
-            chunks = self._split(
-                docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap
-            )
+            if uploaded_files is not None:
+                self.save_files(uploaded_files)
+            chunks = self._load_chunks(chunk_size, chunk_overlap, reporter)
             fm = FaissManager(self.faiss_dir, self.model_loader)
 
-            texts = [c.page_content for c in chunks]
-            metas = [c.metadata for c in chunks]
-
-            try:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            except Exception:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-
-            added = fm.add_documents(chunks)
-            self.log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
+            # Single pass: create-or-append embeds each unique chunk once
+            self.ingest_stats = fm.add_documents(chunks, reporter)
+            self.log.info(
+                "FAISS index updated", index=str(self.faiss_dir), **self.ingest_stats
+            )
 
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            return fm.vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
 
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             self.log.error("Failed to build retriever", error=str(e))
             raise DocumentPortalException("Failed to build retriever", e) from e
 
+    def ingest_to_collection(
+        self,
+        uploaded_files: Optional[Iterable],
+        collection,
+        *,
+        tenant_id: str = "default",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        reporter: Optional[ProgressReporter] = None,
+    ) -> Dict[str, int]:
+        """
+        Save, parse and split like built_retriver, but append the chunks to a
+        ShardedCollection (tagged with this session) instead of a per-session index.
+        """
+        reporter = reporter or ProgressReporter()
+        try:
+            if uploaded_files is not None:
+                self.save_files(uploaded_files)
+            chunks = self._load_chunks(chunk_size, chunk_overlap, reporter)
+            reporter.stage("embedding", to_embed=len(chunks))
+            self.ingest_stats = collection.add_documents(
+                chunks, session_id=self.session_id, tenant_id=tenant_id
+            )
+            return self.ingest_stats
+
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            self.log.error("Failed to ingest into collection", error=str(e))
+            raise DocumentPortalException("Failed to ingest into collection", e) from e
+
 
 class DocHandler:
     """
@@ -227,6 +491,7 @@ class DocHandler:
         self.session_id = session_id or _session_id("session")
         self.session_path = os.path.join(self.data_dir, self.session_id)
         os.makedirs(self.session_path, exist_ok=True)
+        self.saved_file: Optional[SavedFile] = None
         self.log.info(
             "DocHandler initialized",
             session_id=self.session_id,
@@ -239,18 +504,20 @@ class DocHandler:
             if not filename.lower().endswith(".pdf"):
                 raise ValueError("Invalid file type. Only PDFs are allowed.")
             save_path = os.path.join(self.session_path, filename)
-            with open(save_path, "wb") as f:
-                if hasattr(uploaded_file, "read"):
-                    f.write(uploaded_file.read())
-                else:
-                    f.write(uploaded_file.getbuffer())
+            self.saved_file = stream_to_file(
+                uploaded_file, Path(save_path), UploadBudget.from_config()
+            )
             self.log.info(
                 "PDF saved successfully",
                 file=filename,
                 save_path=save_path,
                 session_id=self.session_id,
+                bytes=self.saved_file.size,
+                sha256=self.saved_file.sha256,
             )
             return save_path
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             self.log.error(
                 "Failed to save PDF", error=str(e), session_id=self.session_id
@@ -297,6 +564,7 @@ class DocumentComparator:
         self.session_id = session_id or _session_id()
         self.session_path = self.base_dir / self.session_id
         self.session_path.mkdir(parents=True, exist_ok=True)
+        self.saved_files: List[SavedFile] = []
         self.log.info(
             "DocumentComparator initialized", session_path=str(self.session_path)
         )
@@ -305,14 +573,14 @@ class DocumentComparator:
         try:
             ref_path = self.session_path / reference_file.name
             act_path = self.session_path / actual_file.name
-            for fobj, out in ((reference_file, ref_path), (actual_file, act_path)):
+            budget = UploadBudget.from_config()
+            for fobj in (reference_file, actual_file):
                 if not fobj.name.lower().endswith(".pdf"):
                     raise ValueError("Only PDF files are allowed.")
-                with open(out, "wb") as f:
-                    if hasattr(fobj, "read"):
-                        f.write(fobj.read())
-                    else:
-                        f.write(fobj.getbuffer())
+            self.saved_files = [
+                stream_to_file(fobj, out, budget)
+                for fobj, out in ((reference_file, ref_path), (actual_file, act_path))
+            ]
             self.log.info(
                 "Files saved",
                 reference=str(ref_path),
@@ -320,6 +588,8 @@ class DocumentComparator:
                 session=self.session_id,
             )
             return ref_path, act_path
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             self.log.error(
                 "Error saving PDF files", error=str(e), session=self.session_id
@@ -343,6 +613,19 @@ class DocumentComparator:
             self.log.error("Error reading PDF", file=str(pdf_path), error=str(e))
             raise DocumentPortalException("Error reading PDF", e) from e
 
+    def read_pages(self, pdf_path: Path) -> List[str]:
+        """Text of every page, blank pages included, so page numbers line up."""
+        try:
+            with fitz.open(pdf_path) as doc:
+                if doc.is_encrypted:
+                    raise ValueError(f"PDF is encrypted: {pdf_path.name}")
+                pages = [doc.load_page(i).get_text() for i in range(doc.page_count)]  # type: ignore
+            self.log.info("PDF pages read", file=str(pdf_path), pages=len(pages))
+            return pages
+        except Exception as e:
+            self.log.error("Error reading PDF", file=str(pdf_path), error=str(e))
+            raise DocumentPortalException("Error reading PDF", e) from e
+
     def combine_documents(self) -> str:
         try:
             doc_parts = []
@@ -362,13 +645,14 @@ class DocumentComparator:
             raise DocumentPortalException("Error combining documents", e) from e
 
     def clean_old_sessions(self, keep_latest: int = 3):
+        """Purge all but the newest keep_latest comparison sessions, via the session catalog."""
         try:
-            sessions = sorted(
-                [f for f in self.base_dir.iterdir() if f.is_dir()], reverse=True
-            )
-            for folder in sessions[keep_latest:]:
-                shutil.rmtree(folder, ignore_errors=True)
-                self.log.info("Old session folder deleted", path=str(folder))
+            catalog = get_session_catalog()
+            sessions = catalog.list(limit=-1, area=COMPARE, order="created")
+            for session in sessions[keep_latest:]:
+                # Other areas of the same session id (uploads, indexes) stay
+                catalog.purge(session["session_id"], area=COMPARE)
+                self.log.info("Old session folder deleted", session_id=session["session_id"])
         except Exception as e:
             self.log.error("Error cleaning old sessions", error=str(e))
             raise DocumentPortalException("Error cleaning old sessions", e) from e
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+from utils.llm_utils import count_tokens
+from utils.metrics import observe_stage
+
+log = CustomLogger().get_logger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+# ----------------------------- #
+# Rate-limit handling           #
+# ----------------------------- #
+def _status_code(e: BaseException) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)  # type: ignore[attr-defined]
+    return status
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    """Seconds to wait from Retry-After / retry-after-ms headers, if present."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _is_retryable(e: BaseException) -> bool:
+    status = _status_code(e)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection errors / timeouts carry no status code
+    return type(e).__name__ in {
+        "APIConnectionError",
+        "APITimeoutError",
+        "ConnectError",
+        "ReadTimeout",
+        "TimeoutError",
+    }
+
+
+class _AdaptiveLimiter:
+    """
+    Concurrency limiter that halves the in-flight limit on a 429 and pauses
+    all workers until Retry-After, then grows back by one slot per full
+    round of successful requests.
+    """
+
+    def __init__(self, limit: int):
+        self.max_limit = max(1, limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        while self._resume_at > loop.time():
+            await asyncio.sleep(self._resume_at - loop.time())
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self.limit < self.max_limit and self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self, delay: float):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + delay)
+
+
+# ----------------------------- #
+# Background event loop         #
+# ----------------------------- #
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    One long-lived loop for all pipeline runs, so the embedding client's
+    async connection pool is always used from the same event loop.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="embedding-pipeline", daemon=True
+                ).start()
+                _loop = loop
+    return _loop
+
+
+# ----------------------------- #
+# Pipeline                      #
+# ----------------------------- #
+class EmbeddingPipeline:
+    """
+    Batched, concurrent, rate-limit-aware embedding stage for ingestion.
+
+    Texts are split into contiguous batches bounded by a token budget and a
+    max batch size, embedded concurrently via aembed_documents under an
+    adaptive in-flight limit, and reassembled in input order.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_tokens: int = 250_000,
+        max_batch_size: int = 512,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    @classmethod
+    def from_config(cls, embeddings: Embeddings, config: Dict[str, Any]) -> "EmbeddingPipeline":
+        cfg = config.get("embedding_pipeline", {}) or {}
+        return cls(
+            embeddings,
+            max_batch_tokens=cfg.get("max_batch_tokens", 250_000),
+            max_batch_size=cfg.get("max_batch_size", 512),
+            max_concurrency=cfg.get("max_concurrency", 4),
+            max_retries=cfg.get("max_retries", 6),
+            base_delay=cfg.get("base_delay", 1.0),
+        )
+
+    def make_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Contiguous [start, end) ranges within the token and size budgets."""
+        batches: List[Tuple[int, int]] = []
+        start, tokens = 0, 0
+        for i, text in enumerate(texts):
+            n = count_tokens(text)
+            if i > start and (
+                tokens + n > self.max_batch_tokens or i - start >= self.max_batch_size
+            ):
+                batches.append((start, i))
+                start, tokens = i, 0
+            tokens += n
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    async def _embed_batch(
+        self, texts: List[str], limiter: _AdaptiveLimiter
+    ) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with limiter:
+                    vectors = await self.embeddings.aembed_documents(texts)
+                limiter.on_success()
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = self.base_delay * (2**attempt) + random.uniform(0, self.base_delay)
+                if _status_code(e) == 429:
+                    limiter.on_throttle(delay)
+                attempt += 1
+                log.warning(
+                    "Embedding batch retry",
+                    attempt=attempt,
+                    status=_status_code(e),
+                    delay=round(delay, 2),
+                    in_flight_limit=limiter.limit,
+                )
+                await asyncio.sleep(delay)
+
+    async def aembed(
+        self, texts: List[str], on_progress: Optional[Callable[[int], None]] = None
+    ) -> List[List[float]]:
+        """on_progress(n) is called with the number of texts embedded so far."""
+        if not texts:
+            return []
+        started = time.perf_counter()
+        batches = self.make_batches(texts)
+        limiter = _AdaptiveLimiter(self.max_concurrency)
+        done = 0
+
+        async def run(start: int, end: int) -> List[List[float]]:
+            nonlocal done
+            vectors = await self._embed_batch(texts[start:end], limiter)
+            done += end - start
+            if on_progress is not None:
+                on_progress(done)
+            return vectors
+
+        results = await asyncio.gather(*(run(s, e) for s, e in batches))
+        vectors = [v for batch in results for v in batch]
+        if len(vectors) != len(texts):
+            raise ValueError(
+                f"Embedding count mismatch: {len(vectors)} vectors for {len(texts)} texts"
+            )
+        seconds = time.perf_counter() - started
+        observe_stage("embed_documents", seconds)
+        log.info(
+            "Embedding pipeline finished",
+            texts=len(texts),
+            batches=len(batches),
+            max_concurrency=self.max_concurrency,
+            seconds=round(seconds, 3),
+        )
+        return vectors
+
+    def embed(
+        self, texts: List[str], on_progress: Optional[Callable[[int], None]] = None
+    ) -> List[List[float]]:
+        """Blocking entry point for synchronous ingestion code."""
+        future = asyncio.run_coroutine_threadsafe(
+            self.aembed(texts, on_progress), _background_loop()
+        )
+        return future.result()
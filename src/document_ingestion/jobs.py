@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from utils.model_loader import get_model_registry
+from utils.concurrency import get_executor
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import IngestionQueueFullError
+
+log = CustomLogger().get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Progress-only updates (e.g. embedded chunk counts) are written at most this often
+_PROGRESS_INTERVAL_S = 1.0
+
+
+class ProgressReporter:
+    """
+    Receives ingestion progress. The base class ignores everything, so
+    synchronous callers pass nothing; background jobs get a JobReporter.
+    """
+
+    def stage(self, name: str, **counts: Any) -> None:
+        pass
+
+    def progress(self, **counts: Any) -> None:
+        pass
+
+
+class JobStore:
+    """
+    Ingestion jobs in SQLite, so any API worker process can report on a job
+    and a restart leaves an honest "failed" record instead of a lost job.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                session_id TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                counts TEXT NOT NULL DEFAULT '{}',
+                timings TEXT NOT NULL DEFAULT '{}',
+                params TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT,
+                pid INTEGER,
+                owner TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            )
+            """
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self.db.commit()
+
+    def create(self, job_id: str, kind: str, session_id: Optional[str], params: Dict[str, Any]):
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT INTO jobs(job_id, kind, session_id, status, stage, params, pid, owner, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id, kind, session_id, QUEUED, QUEUED, json.dumps(params),
+                    os.getpid(), _own_token(), time.time(),
+                ),
+            )
+            self.db.commit()
+
+    def update(self, job_id: str, **fields: Any):
+        for key in ("counts", "timings", "result"):
+            if key in fields and not isinstance(fields[key], str):
+                fields[key] = json.dumps(fields[key], default=str)
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.lock:
+            self.db.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+            )
+            self.db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        for key in ("counts", "timings", "params", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def fail_orphans(self) -> int:
+        """Mark queued/running jobs whose worker process is gone as failed."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT job_id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        orphans = [job_id for job_id, owner in rows if not _owner_alive(owner)]
+        for job_id in orphans:
+            self.update(
+                job_id,
+                status=FAILED,
+                error="interrupted: worker process exited before the job finished",
+                finished=time.time(),
+            )
+        return len(orphans)
+
+    def active_sessions(self) -> Set[str]:
+        """
+        Sessions with a queued or running job of a live worker (never
+        evicted underneath it); jobs of dead workers do not pin sessions.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT session_id, owner FROM jobs "
+                "WHERE status IN (?, ?) AND session_id IS NOT NULL",
+                (QUEUED, RUNNING),
+            ).fetchall()
+        alive: Dict[Optional[str], bool] = {}
+        for _, owner in rows:
+            if owner not in alive:
+                alive[owner] = _owner_alive(owner)
+        return {session_id for session_id, owner in rows if alive[owner]}
+
+    def prune(self, max_age_s: float) -> int:
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                (SUCCEEDED, FAILED, time.time() - max_age_s),
+            )
+            self.db.commit()
+        return cursor.rowcount
+
+
+def _process_token(pid: int) -> Optional[str]:
+    """
+    "pid:start_time" of one process incarnation, from /proc. A restarted
+    worker that reuses the PID (common in containers) gets a new start
+    time. None when the process is gone or there is no procfs.
+    """
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    # Field 22 (starttime); fields are counted after the parenthesized comm
+    return f"{pid}:{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+_own_tokens: Dict[int, str] = {}
+
+
+def _own_token() -> str:
+    """This process's job owner token (recomputed after fork)."""
+    pid = os.getpid()
+    token = _own_tokens.get(pid)
+    if token is None:
+        token = _process_token(pid) or f"{pid}:{uuid.uuid4().hex}"
+        _own_tokens[pid] = token
+    return token
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """Whether the process that created a job is still the one running."""
+    if not owner:
+        return False  # rows written before owner tokens existed
+    if owner == _own_token():
+        return True
+    pid = int(owner.split(":", 1)[0])
+    if pid == os.getpid():
+        return False  # our PID, an earlier incarnation
+    current = _process_token(pid)
+    if current is not None:
+        return current == owner
+    return _pid_alive(pid)  # no procfs: PID liveness is the best available
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobReporter(ProgressReporter):
+    """Writes stage changes (with per-stage timings) and throttled counts to the job row."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self.counts: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._stage_started = time.perf_counter()
+        self._last_write = 0.0
+
+    def _close_stage(self):
+        if self._stage is not None:
+            self.timings[self._stage] = round(time.perf_counter() - self._stage_started, 3)
+
+    def stage(self, name: str, **counts: Any) -> None:
+        self._close_stage()
+        self._stage, self._stage_started = name, time.perf_counter()
+        self.counts.update(counts)
+        self.store.update(self.job_id, stage=name, counts=self.counts, timings=self.timings)
+        self._last_write = time.monotonic()
+
+    def progress(self, **counts: Any) -> None:
+        self.counts.update(counts)
+        now = time.monotonic()
+        if now - self._last_write >= _PROGRESS_INTERVAL_S:
+            self.store.update(self.job_id, counts=self.counts)
+            self._last_write = now
+
+    def finish(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self._close_stage()
+        self.timings["total"] = round(sum(v for k, v in self.timings.items() if k != "total"), 3)
+        self.store.update(
+            self.job_id,
+            status=status,
+            stage="done" if status == SUCCEEDED else (self._stage or QUEUED),
+            counts=self.counts,
+            timings=self.timings,
+            result=result,
+            error=error,
+            finished=time.time(),
+        )
+
+
+class IngestionJobs:
+    """
+    Runs ingestion work on the bounded "ingest" executor and tracks it in a
+    JobStore. At most ingest_workers jobs run at once and at most max_queue
+    more wait; submit() beyond that raises IngestionQueueFullError so
+    uploads back off instead of piling up behind query traffic.
+    """
+
+    def __init__(self, store: JobStore, max_queue: int = 16, workers: int = 2):
+        self.log = CustomLogger().get_logger(__name__)
+        self.store = store
+        self.max_queue = max_queue
+        self.workers = workers
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        session_id: Optional[str],
+        work: Callable[[ProgressReporter], Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Queue work(reporter) and return its job id; work returns the job result."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise IngestionQueueFullError(
+                    f"Ingestion queue is full ({self._pending} jobs pending); retry later"
+                )
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, kind, session_id, params or {})
+            get_executor("ingest").submit(self._run, job_id, work)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self.log.info("Ingestion job queued", job_id=job_id, kind=kind, session_id=session_id)
+        return job_id
+
+    def _run(self, job_id: str, work: Callable[[ProgressReporter], Dict[str, Any]]):
+        reporter = JobReporter(self.store, job_id)
+        try:
+            self.store.update(job_id, status=RUNNING, started=time.time())
+            result = work(reporter)
+            reporter.finish(SUCCEEDED, result=result)
+            self.log.info("Ingestion job finished", job_id=job_id, timings=reporter.timings)
+        except Exception as e:
+            message = getattr(e, "error_message", None) or str(e)
+            if e.__cause__ is not None:
+                message = f"{message}: {e.__cause__}"
+            reporter.finish(FAILED, error=message)
+            self.log.error("Ingestion job failed", job_id=job_id, error=message)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def active_sessions(self) -> Set[str]:
+        return self.store.active_sessions()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+        return {"pending": pending, "workers": self.workers, "max_queue": self.max_queue}
+
+
+_jobs: Optional[IngestionJobs] = None
+_jobs_lock = threading.Lock()
+
+
+def get_ingestion_jobs() -> IngestionJobs:
+    """Process-wide IngestionJobs configured from the ingestion_jobs config section."""
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                config = get_model_registry().config
+                cfg = config.get("ingestion_jobs", {}) or {}
+                store = JobStore(cfg.get("path", "data/jobs/ingestion_jobs.sqlite"))
+                orphans = store.fail_orphans()
+                pruned = store.prune(cfg.get("retention_hours", 168) * 3600)
+                workers = (config.get("concurrency", {}) or {}).get("ingest_workers") or 2
+                _jobs = IngestionJobs(store, max_queue=cfg.get("max_queue", 16), workers=workers)
+                log.info("Ingestion jobs ready", orphans_failed=orphans, pruned=pruned)
+    return _jobs
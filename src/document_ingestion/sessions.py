@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from utils.model_loader import get_model_registry
+from utils.concurrency import run_blocking
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# Where a session keeps files; one session id may own a directory in several
+UPLOADS = "uploads"  # chat uploads, {UPLOAD_BASE}/{session_id}
+CHAT_INDEX = "chat_index"  # per-session FAISS store, {FAISS_BASE}/{session_id}
+ANALYSIS = "analysis"  # DocHandler, data/document_analysis/{session_id}
+COMPARE = "compare"  # DocumentComparator, data/document_compare/{session_id}
+COLLECTION = "collection"  # chunks in a shared collection, {FAISS_BASE}/_collections/{name}
+AREAS = (UPLOADS, CHAT_INDEX, ANALYSIS, COMPARE, COLLECTION)
+
+# Areas whose path is shared by many sessions: purge leaves the directory to on_delete
+_SHARED_AREAS = {COLLECTION}
+
+# Directories under the area roots that are not sessions (backfill skips them):
+# the other areas and the caches / stores that config places under data/
+_RESERVED = {
+    "document_analysis",
+    "document_compare",
+    "embedding_cache",
+    "result_cache",
+    "jobs",
+    "sessions",
+    "_collections",
+}
+
+
+def default_roots() -> Dict[str, Path]:
+    """Area roots, from the same environment variables the API and DocHandler read."""
+    upload_base = os.getenv("UPLOAD_BASE", "data")
+    return {
+        UPLOADS: Path(upload_base),
+        CHAT_INDEX: Path(os.getenv("FAISS_BASE", "faiss_index")),
+        ANALYSIS: Path(
+            os.getenv("DATA_STORAGE_PATH", os.path.join(os.getcwd(), "data", "document_analysis"))
+        ),
+        COMPARE: Path("data/document_compare"),
+    }
+
+
+def dir_bytes(path: str | Path) -> int:
+    """Size of one session directory (its files only, symlinks not followed)."""
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+@dataclass
+class SessionPolicy:
+    """
+    Eviction rules from the sessions config section. A session (all of its
+    areas together) is evicted when it has been idle for ttl_hours, when
+    there are more than max_sessions, or, least recently used first, while
+    the catalog's total size exceeds max_total_mb. Sessions used within
+    grace_minutes are never evicted for count or quota. 0 disables a rule.
+    """
+
+    ttl_hours: float = 168
+    max_sessions: int = 0
+    max_total_mb: float = 5120
+    grace_minutes: float = 10
+    sweep_interval_s: float = 600
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "SessionPolicy":
+        cfg = config.get("sessions", {}) or {}
+        return cls(
+            ttl_hours=float(cfg.get("ttl_hours", 168)),
+            max_sessions=int(cfg.get("max_sessions", 0)),
+            max_total_mb=float(cfg.get("max_total_mb", 5120)),
+            grace_minutes=float(cfg.get("grace_minutes", 10)),
+            sweep_interval_s=float(cfg.get("sweep_interval_s", 600)),
+        )
+
+
+class SessionCatalog:
+    """
+    Every session directory in SQLite with its size, creation time and
+    last access, so listing, quotas and eviction never walk the data
+    directories. Writers record a directory after they change it; readers
+    touch the session, at most once per touch_interval_s per process.
+    """
+
+    def __init__(self, path: str | Path, touch_interval_s: float = 60.0):
+        self.log = CustomLogger().get_logger(__name__)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.created_new = not self.path.exists()  # existing directories still need a backfill
+        self.touch_interval_s = touch_interval_s
+        self.lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self.db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT NOT NULL,
+                area TEXT NOT NULL,
+                path TEXT NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (session_id, area)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions(last_access);
+            """
+        )
+        self.db.commit()
+
+    # ---------- Writes ----------
+
+    def record(self, area: str, session_id: str, path: str | Path, nbytes: Optional[int] = None):
+        """
+        Register or refresh a session directory after it was written:
+        size is re-measured (only this directory) and last access set to now.
+        """
+        path = Path(path).resolve()
+        nbytes = dir_bytes(path) if nbytes is None else nbytes
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT INTO sessions(session_id, area, path, bytes, created, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(session_id, area)
+                DO UPDATE SET path = excluded.path, bytes = excluded.bytes, last_access = excluded.last_access
+                """,
+                (session_id, area, str(path), nbytes, now, now),
+            )
+            self.db.commit()
+            self._touched[session_id] = now
+
+    def touch(self, session_id: str) -> bool:
+        """Mark a session as used (e.g. queried); throttled, so cheap on hot paths."""
+        now = time.time()
+        with self.lock:
+            if now - self._touched.get(session_id, 0.0) < self.touch_interval_s:
+                return False
+            self._touched[session_id] = now
+            cursor = self.db.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+            )
+            self.db.commit()
+        return cursor.rowcount > 0
+
+    def forget(self, session_id: str, area: Optional[str] = None):
+        """Drop a session's catalog rows, or only its row for one area."""
+        with self.lock:
+            if area is None:
+                self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            else:
+                self.db.execute(
+                    "DELETE FROM sessions WHERE session_id = ? AND area = ?", (session_id, area)
+                )
+            self.db.commit()
+            self._touched.pop(session_id, None)
+
+    # ---------- Reads ----------
+
+    def list(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        area: Optional[str] = None,
+        order: str = "last_access",
+    ) -> List[Dict[str, Any]]:
+        """Sessions aggregated over their areas, most recently used (or largest) first."""
+        order_by = {
+            "last_access": "last_access DESC",
+            "created": "created DESC",
+            "bytes": "bytes DESC",
+        }.get(order, "last_access DESC")
+        having = "HAVING SUM(area = ?) > 0" if area else ""
+        params: List[Any] = [area] if area else []
+        with self.lock:
+            rows = self.db.execute(
+                f"""
+                SELECT session_id, GROUP_CONCAT(area), SUM(bytes) AS bytes,
+                       MIN(created) AS created, MAX(last_access) AS last_access
+                FROM sessions GROUP BY session_id {having}
+                ORDER BY {order_by} LIMIT ? OFFSET ?
+                """,
+                (*params, limit, offset),
+            ).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "areas": sorted(areas.split(",")),
+                "bytes": nbytes,
+                "created": created,
+                "last_access": last_access,
+            }
+            for session_id, areas, nbytes, created, last_access in rows
+        ]
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        """Per-area rows of one session (paths included)."""
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT * FROM sessions WHERE session_id = ? ORDER BY area", (session_id,)
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def totals(self) -> Dict[str, Any]:
+        with self.lock:
+            sessions, nbytes = self.db.execute(
+                "SELECT COUNT(DISTINCT session_id), COALESCE(SUM(bytes), 0) FROM sessions"
+            ).fetchone()
+            by_area = self.db.execute(
+                "SELECT area, COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions GROUP BY area"
+            ).fetchall()
+        return {
+            "sessions": sessions,
+            "bytes": nbytes,
+            "areas": {a: {"sessions": n, "bytes": b} for a, n, b in by_area},
+        }
+
+    # ---------- Eviction ----------
+
+    def purge(
+        self,
+        session_id: str,
+        on_delete: Optional[Callable[[str, str, Path], None]] = None,
+        area: Optional[str] = None,
+    ) -> int:
+        """
+        Delete every directory of a session (or only its directory in area)
+        and the matching catalog rows; returns bytes freed.
+        on_delete(area, session_id, path) runs first for each area, and is
+        the only cleanup for shared areas (e.g. the session's chunks in a
+        collection), whose directory is never removed.
+        """
+        freed = 0
+        for row in self.get(session_id):
+            if area is not None and row["area"] != area:
+                continue
+            path = Path(row["path"])
+            if on_delete is not None:
+                on_delete(row["area"], session_id, path)
+            if row["area"] not in _SHARED_AREAS:
+                shutil.rmtree(path, ignore_errors=True)
+            freed += row["bytes"]
+        self.forget(session_id, area)
+        self.log.info("Session purged", session_id=session_id, area=area, bytes=freed)
+        return freed
+
+    def plan_eviction(self, policy: SessionPolicy, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Sessions the policy would evict, each with the rule that selected it."""
+        now = time.time() if now is None else now
+        with self.lock:
+            rows = self.db.execute(
+                """
+                SELECT session_id, SUM(bytes), MAX(last_access) AS last_access
+                FROM sessions GROUP BY session_id ORDER BY last_access
+                """
+            ).fetchall()
+
+        evict: List[Dict[str, Any]] = []
+        kept = []
+        for session_id, nbytes, last_access in rows:
+            if policy.ttl_hours and now - last_access > policy.ttl_hours * 3600:
+                evict.append({"session_id": session_id, "bytes": nbytes, "reason": "ttl"})
+            else:
+                kept.append((session_id, nbytes, last_access))
+
+        # kept is least recently used first
+        grace = policy.grace_minutes * 60
+        total = sum(nbytes for _, nbytes, _ in kept)
+        quota = policy.max_total_mb * 1024 * 1024
+        count = len(kept)
+        for session_id, nbytes, last_access in kept:
+            if now - last_access < grace:
+                break
+            if policy.max_sessions and count > policy.max_sessions:
+                reason = "lru"
+            elif policy.max_total_mb and total > quota:
+                reason = "quota"
+            else:
+                break
+            evict.append({"session_id": session_id, "bytes": nbytes, "reason": reason})
+            count -= 1
+            total -= nbytes
+        return evict
+
+    def sweep(
+        self,
+        policy: SessionPolicy,
+        busy: Iterable[str] = (),
+        on_delete: Optional[Callable[[str, str, Path], None]] = None,
+        dry_run: bool = False,
+    ) -> Dict[str, Any]:
+        """Evict by TTL, count (LRU) and disk quota; sessions in busy are left alone."""
+        started = time.perf_counter()
+        busy_ids: Set[str] = set(busy)
+        planned = [e for e in self.plan_eviction(policy) if e["session_id"] not in busy_ids]
+        freed = 0
+        if not dry_run:
+            for entry in planned:
+                freed += self.purge(entry["session_id"], on_delete)
+        result = {
+            "evicted": planned,
+            "bytes_freed": freed,
+            "dry_run": dry_run,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if planned:
+            self.log.info(
+                "Session sweep",
+                evicted=len(planned),
+                bytes_freed=freed,
+                dry_run=dry_run,
+                ms=result["ms"],
+            )
+        return result
+
+    def backfill(self, roots: Dict[str, Path]) -> int:
+        """
+        One-time import of session directories that predate the catalog
+        (walks the area roots once; never on the listing path).
+        """
+        added = 0
+        for area, root in roots.items():
+            root = Path(root)
+            if not root.is_dir():
+                continue
+            for entry in root.iterdir():
+                if not entry.is_dir() or entry.name in _RESERVED or entry.name.startswith("."):
+                    continue
+                if self.get_area(entry.name, area) is not None:
+                    continue
+                stat = entry.stat()
+                with self.lock:
+                    self.db.execute(
+                        """
+                        INSERT OR IGNORE INTO sessions(session_id, area, path, bytes, created, last_access)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (entry.name, area, str(entry.resolve()), dir_bytes(entry), stat.st_ctime, stat.st_mtime),
+                    )
+                    self.db.commit()
+                added += 1
+        if added:
+            self.log.info("Session catalog backfilled", sessions=added)
+        return added
+
+    def get_area(self, session_id: str, area: str) -> Optional[Dict[str, Any]]:
+        return next((row for row in self.get(session_id) if row["area"] == area), None)
+
+
+async def sweep_forever(
+    catalog: SessionCatalog,
+    policy: SessionPolicy,
+    busy: Callable[[], Iterable[str]],
+    on_delete: Optional[Callable[[str, str, Path], None]] = None,
+):
+    """Background sweeper: run catalog.sweep every policy.sweep_interval_s until cancelled."""
+    while True:
+        await asyncio.sleep(policy.sweep_interval_s)
+        try:
+            await run_blocking(
+                "io", lambda: catalog.sweep(policy, busy=busy(), on_delete=on_delete)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("Session sweep failed", error=str(e))
+
+
+_catalog: Optional[SessionCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_session_catalog() -> SessionCatalog:
+    """Process-wide SessionCatalog at sessions.catalog_path."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                cfg = get_model_registry().config.get("sessions", {}) or {}
+                path = Path(cfg.get("catalog_path", "data/sessions/catalog.sqlite"))
+                _catalog = SessionCatalog(
+                    path, touch_interval_s=float(cfg.get("touch_interval_s", 60))
+                )
+    return _catalog
+
+
+if __name__ == "__main__":
+    # python -m src.document_ingestion.sessions backfill   (import existing directories)
+    # python -m src.document_ingestion.sessions sweep [--dry-run]
+    import json
+    import sys
+
+    catalog = get_session_catalog()
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "backfill":
+        print(catalog.backfill(default_roots()), "sessions added")
+    elif command == "sweep":
+        policy = SessionPolicy.from_config(get_model_registry().config)
+        print(json.dumps(catalog.sweep(policy, dry_run="--dry-run" in sys.argv), indent=2))
+    else:
+        print(json.dumps({**catalog.totals(), "recent": catalog.list(limit=20)}, indent=2))
@@ -0,0 +1,456 @@
+from __future__ import annotations
+
+import heapq
+import sqlite3
+import threading
+import time
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from utils.model_loader import ModelLoader
+from utils.concurrency import get_executor
+from utils.faiss_store import (
+    SqliteDocstore,
+    docstore_path,
+    is_legacy,
+    load_store,
+    migrate_legacy,
+    read_manifest,
+    store_exists,
+    store_lock,
+)
+from utils.index_factory import IndexSettings, search_subset, tune_index
+from utils.vectorstore_cache import get_vectorstore_cache
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.data_ingestion import FaissManager
+
+
+class ShardedCollection:
+    """
+    One logical vector collection split into size-bounded FAISS shards.
+
+    Layout under {base_dir}/_collections/{name}/:
+        catalog.sqlite   shards, which (tenant, session) owns vectors in each
+                         and the FAISS row ranges those vectors occupy
+        catalog.lock     flock serializing writers across worker processes
+        shard_00000/     a regular FaissManager index directory
+        shard_00001/     ...
+
+    New chunks go to the newest shard until it holds max_shard_vectors, then
+    a new shard is opened. Every chunk carries tenant_id / session_id in its
+    metadata; queries fan out over the shards that hold the selected
+    tenant/sessions in parallel and merge the per-shard top-k by distance.
+    In shards shared with other tenants/sessions the search is restricted
+    to the selection's rows, so a small tenant still gets its full top-k.
+    Removing a session deletes its chunk texts and catalog rows; its
+    vectors stay in the shard files, unreferenced, so that shard is
+    searched as shared from then on.
+    """
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        base_dir: str | Path = "faiss_index",
+        max_shard_vectors: Optional[int] = None,
+        model_loader: Optional[ModelLoader] = None,
+    ):
+        self.log = CustomLogger().get_logger(__name__)
+        self.model_loader = model_loader or ModelLoader()
+        cfg = self.model_loader.config.get("faiss_db", {}) or {}
+        self.name = name or cfg.get("collection_name", "document_portal")
+        self.max_shard_vectors = max_shard_vectors or cfg.get("shard_max_vectors", 200_000)
+        self.root = Path(base_dir) / "_collections" / self.name
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_settings = IndexSettings.from_config(self.model_loader.config)
+        self.allow_legacy_pickle = bool(cfg.get("allow_legacy_pickle", False))
+        self.mmap = bool(cfg.get("mmap", True))
+        self._db_lock = threading.RLock()
+
+        self._db = sqlite3.connect(
+            str(self.root / "catalog.sqlite"), timeout=30, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS shards (
+                shard_id INTEGER PRIMARY KEY,
+                n_vectors INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                shard_id INTEGER NOT NULL,
+                tenant_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                n_vectors INTEGER NOT NULL,
+                PRIMARY KEY (shard_id, tenant_id, session_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_members_session ON members(tenant_id, session_id);
+            CREATE TABLE IF NOT EXISTS member_rows (
+                shard_id INTEGER NOT NULL,
+                tenant_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                n_vectors INTEGER NOT NULL,
+                PRIMARY KEY (shard_id, start)
+            );
+            """
+        )
+        self._db.commit()
+
+    # ---------- Catalog ----------
+
+    def shard_dir(self, shard_id: int) -> Path:
+        return self.root / f"shard_{shard_id:05d}"
+
+    def _writer(self):
+        """Writer lock shared by every thread and worker process using this collection."""
+        return store_lock(self.root, "catalog")
+
+    def _open_shard(self) -> Tuple[int, int]:
+        """(shard_id, n_vectors) of the shard currently accepting writes."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT shard_id, n_vectors FROM shards ORDER BY shard_id DESC LIMIT 1"
+            ).fetchone()
+            if row is not None and row[1] < self.max_shard_vectors:
+                return row[0], row[1]
+            shard_id = 0 if row is None else row[0] + 1
+            self._db.execute(
+                "INSERT INTO shards(shard_id, n_vectors, created) VALUES (?, 0, ?)",
+                (shard_id, time.time()),
+            )
+            self._db.commit()
+            return shard_id, 0
+
+    def _record(
+        self, shard_id: int, tenant_id: str, session_id: str, added: int, start: Optional[int]
+    ):
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE shards SET n_vectors = n_vectors + ? WHERE shard_id = ?",
+                (added, shard_id),
+            )
+            self._db.execute(
+                """
+                INSERT INTO members(shard_id, tenant_id, session_id, n_vectors) VALUES (?, ?, ?, ?)
+                ON CONFLICT(shard_id, tenant_id, session_id)
+                DO UPDATE SET n_vectors = n_vectors + excluded.n_vectors
+                """,
+                (shard_id, tenant_id, session_id, added),
+            )
+            if added and start is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO member_rows VALUES (?, ?, ?, ?, ?)",
+                    (shard_id, tenant_id, session_id, start, added),
+                )
+            self._db.commit()
+
+    def _selection_rows(
+        self, shard_id: int, tenant_id: Optional[str], session_ids: Optional[Sequence[str]]
+    ) -> Optional[List[int]]:
+        """
+        FAISS positions of the selection in a shard; None when some of its
+        vectors predate row tracking (the caller then filters by metadata).
+        """
+        where, params = ["shard_id = ?"], [shard_id]
+        if tenant_id is not None:
+            where.append("tenant_id = ?")
+            params.append(tenant_id)
+        if session_ids:
+            where.append(f"session_id IN ({','.join('?' * len(session_ids))})")
+            params.extend(session_ids)
+        clause = " AND ".join(where)
+        with self._db_lock:
+            ranges = self._db.execute(
+                f"SELECT start, n_vectors FROM member_rows WHERE {clause}", params
+            ).fetchall()
+            expected = self._db.execute(
+                f"SELECT COALESCE(SUM(n_vectors), 0) FROM members WHERE {clause}", params
+            ).fetchone()[0]
+        if sum(n for _, n in ranges) != expected:
+            return None
+        return [row for start, n in ranges for row in range(start, start + n)]
+
+    def select_shards(
+        self, tenant_id: Optional[str] = None, session_ids: Optional[Sequence[str]] = None
+    ) -> List[Tuple[int, bool]]:
+        """
+        Shards holding vectors of the selection, with a flag telling whether
+        the shard holds anything else (and so needs a metadata filter).
+        """
+        where, params = [], []
+        if tenant_id is not None:
+            where.append("tenant_id = ?")
+            params.append(tenant_id)
+        if session_ids:
+            where.append(f"session_id IN ({','.join('?' * len(session_ids))})")
+            params.extend(session_ids)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._db_lock:
+            matching = dict(
+                self._db.execute(
+                    f"SELECT shard_id, SUM(n_vectors) FROM members {clause} GROUP BY shard_id",
+                    params,
+                ).fetchall()
+            )
+            # Physical rows, so rows of removed sessions also count as "something else"
+            totals = dict(self._db.execute("SELECT shard_id, n_vectors FROM shards").fetchall())
+        return [(s, totals.get(s, 0) > n) for s, n in sorted(matching.items()) if n > 0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            shards = self._db.execute(
+                "SELECT shard_id, n_vectors FROM shards ORDER BY shard_id"
+            ).fetchall()
+            sessions = self._db.execute(
+                "SELECT COUNT(DISTINCT tenant_id || '/' || session_id) FROM members"
+            ).fetchone()[0]
+        return {
+            "collection": self.name,
+            "shards": [{"shard_id": s, "vectors": n} for s, n in shards],
+            "vectors": sum(n for _, n in shards),
+            "sessions": sessions,
+            "max_shard_vectors": self.max_shard_vectors,
+        }
+
+    # ---------- Ingest ----------
+
+    def add_documents(
+        self, docs: List[Document], session_id: str, tenant_id: str = "default"
+    ) -> Dict[str, int]:
+        """
+        Tag chunks with tenant/session and append them to the open shard,
+        spilling into new shards when max_shard_vectors is reached.
+        """
+        for d in docs:
+            d.metadata = {**(d.metadata or {}), "tenant_id": tenant_id, "session_id": session_id}
+
+        stats = {"embedded": 0, "skipped": 0}
+        with self._writer():
+            remaining = list(docs)
+            while remaining:
+                shard_id, used = self._open_shard()
+                room = self.max_shard_vectors - used
+                batch, remaining = remaining[:room], remaining[room:]
+                # New chunks are appended at the end of the shard, in one contiguous run
+                manifest = read_manifest(self.shard_dir(shard_id))
+                start = int(manifest["ntotal"]) if manifest else None
+                if manifest is None and not store_exists(self.shard_dir(shard_id)):
+                    start = 0
+                fm = FaissManager(self.shard_dir(shard_id), self.model_loader)
+                result = fm.add_documents(batch)
+                self._record(shard_id, tenant_id, session_id, result["embedded"], start)
+                if fm.vs is not None:
+                    get_vectorstore_cache().put(self.shard_dir(shard_id), fm.vs)
+                for key in stats:
+                    stats[key] += result[key]
+        self.log.info(
+            "Collection updated",
+            collection=self.name,
+            tenant_id=tenant_id,
+            session_id=session_id,
+            **stats,
+        )
+        return stats
+
+    def remove_session(self, session_id: str, tenant_id: Optional[str] = None) -> int:
+        """
+        Drop a session's chunks (of every tenant unless tenant_id is given):
+        their texts and fingerprints leave the shard docstores and their
+        catalog rows go, so no search returns them and a re-upload is
+        indexed again. Returns the number of chunks removed.
+        """
+        where, params = ["session_id = ?"], [session_id]
+        if tenant_id is not None:
+            where.append("tenant_id = ?")
+            params.append(tenant_id)
+        clause = " AND ".join(where)
+        removed = 0
+        with self._writer():
+            with self._db_lock:
+                shard_ids = [
+                    row[0]
+                    for row in self._db.execute(
+                        f"SELECT DISTINCT shard_id FROM members WHERE {clause}", params
+                    ).fetchall()
+                ]
+            for shard_id in shard_ids:
+                removed += self._delete_chunks(shard_id, session_id, tenant_id)
+            with self._db_lock:
+                self._db.execute(f"DELETE FROM members WHERE {clause}", params)
+                self._db.execute(f"DELETE FROM member_rows WHERE {clause}", params)
+                self._db.commit()
+        self.log.info(
+            "Session removed from collection",
+            collection=self.name,
+            tenant_id=tenant_id,
+            session_id=session_id,
+            shards=len(shard_ids),
+            chunks=removed,
+        )
+        return removed
+
+    def _delete_chunks(self, shard_id: int, session_id: str, tenant_id: Optional[str]) -> int:
+        shard_dir = self.shard_dir(shard_id)
+        if is_legacy(shard_dir):
+            migrate_legacy(shard_dir, self.model_loader.load_embeddings())
+        if not store_exists(shard_dir):
+            return 0
+        where = {"session_id": session_id}
+        if tenant_id is not None:
+            where["tenant_id"] = tenant_id
+        docstore = SqliteDocstore(docstore_path(shard_dir))
+        try:
+            docs = docstore.search_metadata(**where)
+            docstore.delete(list(docs))
+            docstore.forget_fingerprints(
+                FaissManager._fingerprint(d.page_content, d.metadata) for d in docs.values()
+            )
+        finally:
+            docstore.close()
+        return len(docs)
+
+    # ---------- Query ----------
+
+    def _load_shard(self, shard_id: int):
+        shard_dir = self.shard_dir(shard_id)
+        embeddings = self.model_loader.load_embeddings()
+
+        def load():
+            vs = load_store(
+                shard_dir,
+                embeddings,
+                mmap=self.mmap,
+                allow_legacy_pickle=self.allow_legacy_pickle,
+            )
+            tune_index(vs.index, self.index_settings)
+            return vs
+
+        return get_vectorstore_cache().get(shard_dir, load)
+
+    def _search_shard(
+        self,
+        shard_id: int,
+        embedding: List[float],
+        k: int,
+        rows: Optional[List[int]],
+        filter_fn: Optional[Callable[[Dict[str, Any]], bool]],
+    ) -> List[Tuple[Document, float]]:
+        if not store_exists(self.shard_dir(shard_id)):
+            return []
+        vs = self._load_shard(shard_id)
+        if filter_fn is None:
+            return vs.similarity_search_with_score_by_vector(embedding, k=k)
+        if rows is not None:
+            hits = []
+            for dist, pos in search_subset(vs.index, np.asarray(embedding), k, rows):
+                doc = vs.docstore.search(vs.index_to_docstore_id[pos])
+                if isinstance(doc, Document):
+                    hits.append((doc, dist))
+            return hits
+        # Untracked rows: filter after the search, widening it until k matches are found.
+        # Rows of removed sessions have no document any more and are skipped.
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        fetch_k = max(k * 8, 64)
+        while True:
+            dists, ids = vs.index.search(query, min(fetch_k, vs.index.ntotal))
+            hits = []
+            for dist, pos in zip(dists[0], ids[0]):
+                if pos < 0:
+                    continue
+                doc = vs.docstore.search(vs.index_to_docstore_id[int(pos)])
+                if isinstance(doc, Document) and filter_fn(doc.metadata):
+                    hits.append((doc, float(dist)))
+                    if len(hits) == k:
+                        return hits
+            if fetch_k >= vs.index.ntotal:
+                return hits
+            fetch_k *= 4
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        tenant_id: Optional[str] = None,
+        session_ids: Optional[Sequence[str]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Fan out over the selected shards in parallel and merge the top-k (L2, lower is better)."""
+        started = time.perf_counter()
+        shards = self.select_shards(tenant_id, session_ids)
+        if not shards:
+            return []
+        embedding = self.model_loader.load_embeddings().embed_query(query)
+        wanted = set(session_ids or [])
+
+        def matches(md: Dict[str, Any]) -> bool:
+            if tenant_id is not None and md.get("tenant_id") != tenant_id:
+                return False
+            return not wanted or md.get("session_id") in wanted
+
+        executor = get_executor("cpu")
+        futures = [
+            executor.submit(
+                self._search_shard,
+                shard_id,
+                embedding,
+                k,
+                self._selection_rows(shard_id, tenant_id, session_ids) if mixed else None,
+                matches if mixed else None,
+            )
+            for shard_id, mixed in shards
+        ]
+        wait(futures)
+        hits = heapq.nsmallest(
+            k, (hit for f in futures for hit in f.result()), key=lambda hit: hit[1]
+        )
+        self.log.info(
+            "Collection search",
+            collection=self.name,
+            shards=len(shards),
+            k=k,
+            ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+        return hits
+
+
+class CollectionRetriever(BaseRetriever):
+    """LangChain retriever over a ShardedCollection, for ConversationalRAG(retriever=...)."""
+
+    collection: Any
+    k: int = 5
+    tenant_id: Optional[str] = None
+    session_ids: Optional[List[str]] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [
+            doc
+            for doc, _ in self.collection.search(
+                query, k=self.k, tenant_id=self.tenant_id, session_ids=self.session_ids
+            )
+        ]
+
+
+_collections: Dict[Tuple[str, str], ShardedCollection] = {}
+_collections_lock = threading.Lock()
+
+
+def get_collection(base_dir: str | Path = "faiss_index", name: Optional[str] = None) -> ShardedCollection:
+    """Process-wide ShardedCollection per (base dir, name); defaults to faiss_db.collection_name."""
+    key = (str(Path(base_dir).resolve()), name or "")
+    collection = _collections.get(key)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(key)
+            if collection is None:
+                collection = ShardedCollection(name=name, base_dir=base_dir)
+                _collections[key] = collection
+    return collection
@@ -0,0 +1,36 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def pytest_configure(config):
+    # The app resolves config/, data/ and logs/ against the working directory
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    workdir = Path(tempfile.mkdtemp(prefix="document-portal-tests-"))
+    shutil.copytree(ROOT / "config", workdir / "config")
+    os.chdir(workdir)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh ModelRegistry whose embedding client is a deterministic fake."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import utils.model_loader as model_loader
+
+    reg = model_loader.ModelRegistry()
+    reg.config["embedding_cache"]["enabled"] = False
+    emb = reg.config["embedding_model"]
+    reg._embeddings[(emb.get("provider", "openai"), emb["model_name"], False)] = (
+        DeterministicFakeEmbedding(size=32)
+    )
+    monkeypatch.setattr(model_loader, "_registry", reg)
+    return reg
@@ -0,0 +1,36 @@
+from utils.bm25_index import BM25Index, rrf_fuse, tokenize
+
+CHUNKS = [
+    "Torque the flange bolts to spec ab-1234.",
+    "The pump seal must be replaced yearly.",
+    "Section 4.2.1 covers the pressure relief valve.",
+    "Valve and pump maintenance schedule.",
+]
+
+
+def test_tokenize_keeps_codes_whole_and_split():
+    assert tokenize("See AB-1234 and 4.2.1") == ["see", "ab-1234", "ab", "1234", "and", "4.2.1", "4", "2", "1"]
+
+
+def test_search_ranks_exact_terms_and_codes_first():
+    index = BM25Index().add(CHUNKS)
+    assert index.search("ab-1234")[0][0] == 0
+    assert index.search("section 4.2.1")[0][0] == 2
+    assert [row for row, _ in index.search("pump seal")][:2] == [1, 3]
+    assert index.search("unrelated words") == []
+
+
+def test_extend_and_save_round_trip_match_a_single_build(tmp_path):
+    whole = BM25Index().add(CHUNKS)
+    parts = BM25Index().add(CHUNKS[:2]).extend(BM25Index().add(CHUNKS[2:]))
+    parts.save(tmp_path / "index.bm25.npz")
+    loaded = BM25Index.load(tmp_path / "index.bm25.npz")
+
+    for query in ("pump", "valve maintenance", "ab-1234"):
+        assert loaded.search(query) == whole.search(query) == parts.search(query)
+
+
+def test_rrf_fuse_weights_rankings():
+    vector, lexical = ["a", "b", "c"], ["c", "d"]
+    assert rrf_fuse([vector, lexical], [0.5, 0.5])[0] == "c"  # in both lists
+    assert rrf_fuse([vector, lexical], [0.9, 0.1], k=1) == ["a", "b", "c", "d"]
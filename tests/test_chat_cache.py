@@ -0,0 +1,50 @@
+import time
+
+from src.document_chat.cache import ChatCache, TTLCache, normalize_question
+
+PARAMS = ("similarity", 5)
+
+
+def test_answers_are_scoped_by_index_version_and_params(tmp_path):
+    cache = ChatCache()
+    cache.put_answer(tmp_path, (1,), None, "What is FAISS?", "an index", [], PARAMS)
+    assert cache.get_answer(tmp_path, (1,), None, "  what is faiss ", PARAMS)["answer"] == "an index"
+    assert cache.get_answer(tmp_path, (2,), None, "What is FAISS?", PARAMS) is None
+    assert cache.get_answer(tmp_path, (1,), None, "What is FAISS?", ("mmr", 5)) is None
+    assert normalize_question("Hello   World?!") == "hello world"
+
+
+def test_invalidate_drops_only_that_index(tmp_path):
+    cache = ChatCache()
+    a, b = tmp_path / "a", tmp_path / "b"
+    cache.put_answer(a, (1,), None, "q", "A", [])
+    cache.put_answer(b, (1,), None, "q", "B", [])
+    cache.put_retrieval(a, (1,), PARAMS, "q", [1.0, 0.0], ["x"])
+    assert cache.invalidate(a) == 2
+    assert cache.get_answer(a, (1,), None, "q") is None
+    assert cache.get_answer(b, (1,), None, "q")["answer"] == "B"
+
+
+def test_near_duplicate_retrieval_counts_one_hit(tmp_path):
+    cache = ChatCache(similarity_threshold=0.95)
+    cache.put_retrieval(tmp_path, (1,), PARAMS, "what is faiss", [1.0, 0.0], ["a", "b"])
+
+    assert cache.get_retrieval(tmp_path, (1,), PARAMS, "what's faiss", [0.99, 0.05]) == ["a", "b"]
+    stats = cache.stats()["retrievals"]
+    assert (stats["hits"], stats["misses"], stats["similar_hits"]) == (1, 0, 1)
+
+    assert cache.get_retrieval(tmp_path, (1,), PARAMS, "unrelated", [0.0, 1.0]) is None
+    stats = cache.stats()["retrievals"]
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    cache = TTLCache(max_entries=2, ttl=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] >= 1
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+
+from utils.concurrency import get_executor, run_blocking, shutdown_executors
+
+
+def test_blocking_calls_leave_the_event_loop_free():
+    ticks = []
+
+    def blocking():
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        tick = asyncio.create_task(ticker())
+        names = await asyncio.gather(run_blocking("io", blocking), run_blocking("cpu", blocking))
+        tick.cancel()
+        return names
+
+    started = time.perf_counter()
+    io_thread, cpu_thread = asyncio.run(main())
+
+    assert io_thread.startswith("dp-io") and cpu_thread.startswith("dp-cpu")
+    assert time.perf_counter() - started < 0.35  # ran side by side
+    assert len(ticks) >= 10  # the loop kept running meanwhile
+
+
+def test_executor_sizes_come_from_config(registry):
+    shutdown_executors()
+    registry.config["concurrency"] = {"ingest_workers": 3}
+    try:
+        assert get_executor("ingest")._max_workers == 3
+        assert get_executor("ingest") is get_executor("ingest")
+    finally:
+        shutdown_executors()
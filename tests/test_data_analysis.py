@@ -0,0 +1,83 @@
+import asyncio
+import json
+import re
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from src.document_analyzer.data_analysis import DocumentAnalyzer, split_sections
+from utils.llm_utils import count_tokens
+from utils.model_loader import ModelLoader
+
+METADATA = {
+    "Summary": ["A pump manual."],
+    "Title": "Pump manual",
+    "Author": "Not Available",
+    "DateCreated": "Not Available",
+    "LastModifiedDate": "Not Available",
+    "Publisher": "Not Available",
+    "Language": "English",
+    "PageCount": 6,
+    "SentimentTone": "Neutral",
+}
+
+
+def _document(pages, words=60):
+    return "".join(f"\n--- Page {i} ---\n" + f"page {i} text " * words for i in range(1, pages + 1))
+
+
+@pytest.fixture
+def analyzer(registry, monkeypatch):
+    """DocumentAnalyzer on a scripted LLM: section prompts get notes naming the section, others MetaData JSON."""
+    registry.config["result_cache"]["enabled"] = False
+    registry.config["analysis"].update(max_section_tokens=400, max_reduce_tokens=12000, max_concurrency=4)
+    prompts = []
+
+    def respond(prompt):
+        text = prompt.to_string()
+        prompts.append(text)
+        section = re.search(r"one section of a longer document \((.+?)\)", text)
+        return f"- notes on {section.group(1)}" if section else json.dumps(METADATA)
+
+    monkeypatch.setattr(ModelLoader, "load_llm", lambda self, provider_key=None: RunnableLambda(respond))
+    analyzer = DocumentAnalyzer()
+    analyzer.prompts = prompts
+    return analyzer
+
+
+def test_pages_are_packed_into_sections_within_the_budget():
+    sections = split_sections(_document(6), max_tokens=400)
+
+    assert [s["label"] for s in sections] == ["pages 1-2", "pages 3-4", "pages 5-6"]
+    assert all(count_tokens(s["text"]) <= 400 for s in sections)
+
+    # A page over the budget is cut into windows that still cover all of it
+    page = "page 1 text " * 500
+    parts = split_sections(f"--- Page 1 ---\n{page}", max_tokens=400)
+    assert len(parts) > 1
+    assert [s["label"] for s in parts] == [f"page 1, part {i} of {len(parts)}" for i in range(1, len(parts) + 1)]
+    assert "".join(s["text"] for s in parts) == f"\n{page}"
+
+
+def test_auto_maps_each_section_then_reduces_the_notes(analyzer):
+    result = asyncio.run(analyzer.aanalyze_document(_document(6), mode="auto"))
+
+    assert result == METADATA and analyzer.last_mode == "map_reduce"
+    *maps, reduce = analyzer.prompts
+    assert len(maps) == 3
+    assert "(6 pages)" in reduce
+    for label in ("pages 1-2", "pages 3-4", "pages 5-6"):
+        assert f"- notes on {label}" in reduce
+
+
+def test_auto_uses_one_prompt_when_the_document_fits(analyzer):
+    document = _document(1, words=20)
+    assert analyzer.analyze_document(document, mode="auto") == METADATA
+    assert analyzer.last_mode == "single"
+    assert len(analyzer.prompts) == 1 and "page 1 text " * 20 in analyzer.prompts[0]
+
+
+def test_single_mode_sends_at_most_the_section_budget(analyzer):
+    analyzer.analyze_document(_document(6), mode="single")
+    (prompt,) = analyzer.prompts
+    assert "page 1 text" in prompt and "page 6 text" not in prompt
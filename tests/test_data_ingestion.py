@@ -0,0 +1,75 @@
+import io
+
+from langchain_core.documents import Document
+
+from src.document_ingestion.data_ingestion import ChatIngestor, FaissManager
+from utils.model_loader import ModelLoader
+
+
+def _docs(n=5):
+    return [
+        Document(page_content=f"chunk {i} about valves", metadata={"source": "a.txt", "start_index": i * 20})
+        for i in range(n)
+    ]
+
+
+def test_reingesting_known_chunks_still_opens_store(registry, tmp_path):
+    first = FaissManager(tmp_path / "idx", ModelLoader(registry))
+    assert first.add_documents(_docs()) == {"embedded": 5, "skipped": 0}
+
+    again = FaissManager(tmp_path / "idx", ModelLoader(registry))
+    assert again.add_documents(_docs()) == {"embedded": 0, "skipped": 5}
+    assert again.vs is not None
+    assert again.vs.index.ntotal == 5
+    hits = again.vs.as_retriever(search_kwargs={"k": 2}).invoke("chunk 3 about valves")
+    assert len(hits) == 2
+
+
+def test_appended_segment_is_searchable_with_base(registry, tmp_path):
+    fm = FaissManager(tmp_path / "idx", ModelLoader(registry))
+    fm.add_documents(_docs(3))
+    extra = [Document(page_content="pump seal spec", metadata={"source": "b.txt", "start_index": 0})]
+    assert FaissManager(tmp_path / "idx", ModelLoader(registry)).add_documents(extra)["embedded"] == 1
+
+    reopened = FaissManager(tmp_path / "idx", ModelLoader(registry))
+    reopened.add_documents(extra)
+    assert reopened.vs.index.ntotal == 4
+    top = reopened.vs.similarity_search("pump seal spec", k=1)[0]
+    assert top.page_content == "pump seal spec"
+
+
+def test_reuploading_the_same_file_is_deduplicated(registry, tmp_path):
+    def upload(name):
+        f = io.BytesIO(b"Valve specs.\n" * 200)
+        f.name = name
+        return f
+
+    def ingest():
+        ci = ChatIngestor(temp_base=tmp_path / "up", faiss_base=tmp_path / "idx", session_id="s1")
+        ci.built_retriver([upload("specs.txt")], chunk_size=300, chunk_overlap=0)
+        return ci.ingest_stats
+
+    first = ingest()
+    assert first["embedded"] > 0
+    # Saved under a new random name, but the content is the same
+    assert ingest() == {"embedded": 0, "skipped": first["embedded"]}
+
+
+def test_concurrent_ingest_of_the_same_chunks_indexes_them_once(registry, tmp_path, monkeypatch):
+    from src.document_ingestion import data_ingestion
+
+    real_embed = data_ingestion.EmbeddingPipeline.embed
+    racing = []
+
+    def embed(self, texts, on_progress=None):
+        if not racing:
+            # A second job ingests the same upload while this one is embedding
+            racing.append(None)
+            racing[0] = FaissManager(tmp_path / "idx", ModelLoader(registry)).add_documents(_docs())
+        return real_embed(self, texts, on_progress)
+
+    monkeypatch.setattr(data_ingestion.EmbeddingPipeline, "embed", embed)
+    fm = FaissManager(tmp_path / "idx", ModelLoader(registry))
+    assert fm.add_documents(_docs()) == {"embedded": 0, "skipped": 5}
+    assert racing == [{"embedded": 5, "skipped": 0}]
+    assert fm.vs.index.ntotal == 5
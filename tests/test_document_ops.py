@@ -0,0 +1,92 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import pytest
+
+from exception.custom_exception import DocumentPortalException
+from utils import document_ops
+from utils.document_ops import load_documents
+
+
+def _pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(str(path))
+    return path
+
+
+class BrokenPool:
+    """Stands in for a pool whose worker died: every submission fails."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        fut = Future()
+        fut.set_exception(BrokenProcessPool("worker died"))
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def parsing(registry):
+    registry.config["parsing"] = {"max_workers": 2, "pages_per_task": 2, "inline_task_threshold": 1}
+    yield registry.config["parsing"]
+    if document_ops._pool is not None:
+        document_ops._pool.shutdown()
+        document_ops._pool = None
+
+
+def test_page_ranges_are_parsed_in_processes_and_kept_in_order(parsing, tmp_path):
+    big = _pdf(tmp_path / "big.pdf", [f"page {i}" for i in range(5)])
+    notes = tmp_path / "notes.txt"
+    notes.write_text("plain notes", encoding="utf-8")
+
+    docs = load_documents([big, notes])
+
+    assert isinstance(document_ops._pool, document_ops.ProcessPoolExecutor)
+    assert [d.page_content.strip() for d in docs] == [f"page {i}" for i in range(5)] + ["plain notes"]
+    assert [d.metadata.get("page") for d in docs[:5]] == list(range(5))
+    assert docs[0].metadata["total_pages"] == 5
+    assert docs[0].metadata["page_label"] == "1"
+
+
+def test_small_jobs_run_inline(parsing, tmp_path):
+    docs = load_documents([_pdf(tmp_path / "one.pdf", ["only page"])])
+    assert [d.page_content.strip() for d in docs] == ["only page"]
+    assert document_ops._pool is None
+
+
+def test_broken_pool_is_replaced_and_work_retried_once(parsing, tmp_path, monkeypatch):
+    # Fresh pools are thread pools here; the broken one is what a crashed worker leaves
+    monkeypatch.setattr(
+        document_ops, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)
+    )
+    broken = BrokenPool()
+    document_ops._pool = broken
+
+    docs = load_documents([_pdf(tmp_path / "big.pdf", [f"page {i}" for i in range(5)])])
+
+    assert [d.page_content.strip() for d in docs] == [f"page {i}" for i in range(5)]
+    assert broken.submitted == 3 and broken.shut_down
+    assert isinstance(document_ops._pool, ThreadPoolExecutor)
+
+
+def test_pool_that_breaks_again_fails_the_load(parsing, tmp_path, monkeypatch):
+    pools = []
+
+    def new_pool(max_workers, mp_context):
+        pools.append(BrokenPool())
+        return pools[-1]
+
+    monkeypatch.setattr(document_ops, "ProcessPoolExecutor", new_pool)
+
+    with pytest.raises(DocumentPortalException):
+        load_documents([_pdf(tmp_path / "big.pdf", [f"page {i}" for i in range(5)])])
+    assert len(pools) == 2 and all(p.shut_down for p in pools)
@@ -0,0 +1,67 @@
+import asyncio
+import sqlite3
+import threading
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore, embedding_key
+
+
+def test_round_trip(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    key = embedding_key("m", "hello")
+    store.put_many({key: [1.0, 2.0, 3.0]})
+    assert store.get_many([key, embedding_key("m", "other")]) == {key: [1.0, 2.0, 3.0]}
+
+
+def test_slot_recycled_by_another_process_is_a_miss(tmp_path):
+    reader = EmbeddingStore(tmp_path, max_entries=1)
+    writer = EmbeddingStore(tmp_path, max_entries=1)  # stands in for another worker
+    old, new = embedding_key("m", "old"), embedding_key("m", "new")
+    reader.put_many({old: [1.0, 1.0]})
+    stale = reader._slots([old])
+
+    writer.put_many({new: [9.0, 9.0]})  # evicts "old" and reuses its slot
+    assert writer._slots([new]) == {new: stale[old]}
+
+    # The reader resolved the slot before the eviction
+    reader._slots = lambda keys: dict(stale)
+    assert reader.get_many([old]) == {}
+
+
+def test_access_times_are_buffered(tmp_path):
+    store = EmbeddingStore(tmp_path, touch_interval=3600)
+    key = embedding_key("m", "hot")
+    store.put_many({key: [0.5]})
+    store._db.execute("UPDATE vectors SET last_access = 0")
+    store._db.commit()
+    statements = []
+    store._db.set_trace_callback(statements.append)
+    for _ in range(50):
+        assert store.get_many([key])
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+    store.close()
+    db = sqlite3.connect(tmp_path / "index.sqlite")
+    (last_access,) = db.execute("SELECT last_access FROM vectors").fetchone()
+    assert last_access > 0
+
+
+def test_async_lookups_run_off_the_event_loop(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    threads = []
+    for name in ("get_many", "put_many"):
+        method = getattr(store, name)
+
+        def record(*args, _method=method):
+            threads.append(threading.current_thread().name)
+            return _method(*args)
+
+        setattr(store, name, record)
+    cached = CachedEmbeddings(DeterministicFakeEmbedding(size=4), "m", store)
+
+    first = asyncio.run(cached.aembed_documents(["a", "b", "a"]))
+    again = asyncio.run(cached.aembed_documents(["b", "a"]))
+    assert again == [first[1], first[0]]
+    assert (cached.hits, cached.misses) == (2, 2)
+    assert threads and all(name.startswith("dp-io") for name in threads)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from langchain_openai import OpenAIEmbeddings
+
+from src.document_ingestion import embedding_pipeline
+from src.document_ingestion.embedding_pipeline import EmbeddingPipeline
+from utils.llm_utils import count_tokens
+
+
+class StubEmbeddingsAPI:
+    """
+    In-process /v1/embeddings: each text "chunk <n>" embeds to [n, 1].
+    delay(inputs) and fail(call) shape the responses.
+    """
+
+    def __init__(self, delay=lambda inputs: 0.0, fail=lambda call: None):
+        self.delay = delay
+        self.fail = fail
+        self.requests = []
+        self.completed = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith("/embeddings")
+        inputs = json.loads(request.content)["input"]
+        self.requests.append(inputs)
+        failure = self.fail(len(self.requests))
+        if failure is not None:
+            return failure
+        await asyncio.sleep(self.delay(inputs))
+        self.completed.append(inputs[0])
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(text.split()[-1]), 1.0]}
+            for i, text in enumerate(inputs)
+        ]
+        return httpx.Response(
+            200,
+            json={"object": "list", "data": data, "model": "stub", "usage": {"prompt_tokens": 0, "total_tokens": 0}},
+        )
+
+    def embeddings(self) -> OpenAIEmbeddings:
+        return OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            api_key="test-key",
+            check_embedding_ctx_length=False,
+            max_retries=0,  # retries are the pipeline's job
+            http_async_client=httpx.AsyncClient(transport=httpx.MockTransport(self)),
+        )
+
+
+def _texts(n):
+    return [f"chunk {i}" for i in range(n)]
+
+
+def _throttle(retry_after):
+    return httpx.Response(429, headers={"retry-after": str(retry_after)}, json={"error": {"message": "slow down"}})
+
+
+def test_batches_stay_within_token_and_size_budgets():
+    api = StubEmbeddingsAPI()
+    texts = [f"chunk {i} " + "word " * (i % 7) + str(i) for i in range(40)]
+    pipeline = EmbeddingPipeline(api.embeddings(), max_batch_tokens=30, max_batch_size=6)
+
+    vectors = pipeline.embed(texts)
+
+    assert [v[0] for v in vectors] == [float(i) for i in range(40)]
+    assert sum(len(batch) for batch in api.requests) == 40
+    for batch in api.requests:
+        assert len(batch) <= 6
+        assert len(batch) == 1 or sum(count_tokens(t) for t in batch) <= 30
+
+
+def test_order_is_kept_when_batches_finish_out_of_order():
+    # The first batches are the slowest, so they complete last
+    api = StubEmbeddingsAPI(delay=lambda inputs: 0.2 if inputs[0] == "chunk 0" else 0.0)
+    pipeline = EmbeddingPipeline(api.embeddings(), max_batch_size=2, max_concurrency=4)
+    progress = []
+
+    vectors = asyncio.run(pipeline.aembed(_texts(8), on_progress=progress.append))
+
+    assert api.completed[-1] == "chunk 0"
+    assert [v[0] for v in vectors] == [float(i) for i in range(8)]
+    assert progress == [2, 4, 6, 8]
+
+
+def test_429_halves_the_limit_waits_for_retry_after_and_retries(monkeypatch):
+    limiters = []
+
+    class RecordingLimiter(embedding_pipeline._AdaptiveLimiter):
+        def __init__(self, limit):
+            super().__init__(limit)
+            self.throttles = []
+            limiters.append(self)
+
+        def on_throttle(self, delay):
+            super().on_throttle(delay)
+            self.throttles.append((delay, self.limit))
+
+    monkeypatch.setattr(embedding_pipeline, "_AdaptiveLimiter", RecordingLimiter)
+    api = StubEmbeddingsAPI(fail=lambda call: _throttle(0.2) if call == 1 else None)
+    pipeline = EmbeddingPipeline(api.embeddings(), max_concurrency=4, max_retries=2)
+
+    started = time.perf_counter()
+    vectors = pipeline.embed(_texts(3))
+
+    assert time.perf_counter() - started >= 0.2
+    assert limiters[0].throttles == [(0.2, 2)]
+    assert len(api.requests) == 2
+    assert [v[0] for v in vectors] == [0.0, 1.0, 2.0]
+
+
+def test_gives_up_after_max_retries():
+    api = StubEmbeddingsAPI(fail=lambda call: _throttle(0.01))
+    pipeline = EmbeddingPipeline(api.embeddings(), max_retries=2)
+
+    with pytest.raises(Exception) as raised:
+        pipeline.embed(_texts(3))
+
+    assert embedding_pipeline._status_code(raised.value) == 429
+    assert len(api.requests) == 3  # first attempt + max_retries
@@ -0,0 +1,61 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from utils.faiss_store import (
+    SqliteDocstore,
+    is_legacy,
+    legacy_pickle_path,
+    load_store,
+    read_manifest,
+    save_store,
+    store_exists,
+)
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=16)
+
+
+def _store(n=6):
+    docs = [Document(page_content=f"section {i}", metadata={"source": "a.pdf", "page": i}) for i in range(n)]
+    return FAISS.from_documents(docs, EMBEDDINGS)
+
+
+def _top(vs, query, k=3):
+    return [d.page_content for d in vs.similarity_search(query, k=k)]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_saved_store_reloads_with_the_same_results(tmp_path, mmap):
+    vs = _store()
+    save_store(vs, tmp_path)
+
+    assert store_exists(tmp_path) and not legacy_pickle_path(tmp_path).exists()
+    assert read_manifest(tmp_path)["segments"] == []
+    loaded = load_store(tmp_path, EMBEDDINGS, mmap=mmap)
+    assert isinstance(loaded.docstore, SqliteDocstore)
+    assert loaded.index.ntotal == 6
+    assert _top(loaded, "section 4") == _top(vs, "section 4")
+    assert loaded.similarity_search("section 2", k=1)[0].metadata == {"source": "a.pdf", "page": 2}
+
+
+def test_resave_replaces_the_previous_index_file(tmp_path):
+    save_store(_store(3), tmp_path)
+    first = read_manifest(tmp_path)
+    save_store(_store(5), tmp_path)
+    second = read_manifest(tmp_path)
+
+    assert second["base"] != first["base"]
+    assert not (tmp_path / first["base"]).exists()
+    assert load_store(tmp_path, EMBEDDINGS).index.ntotal == 5
+
+
+def test_legacy_pickle_is_only_read_when_allowed(tmp_path):
+    _store(4).save_local(str(tmp_path))
+    assert is_legacy(tmp_path)
+    with pytest.raises(ValueError, match="legacy pickle"):
+        load_store(tmp_path, EMBEDDINGS)
+
+    vs = load_store(tmp_path, EMBEDDINGS, allow_legacy_pickle=True)
+    assert vs.index.ntotal == 4
+    assert not is_legacy(tmp_path) and not legacy_pickle_path(tmp_path).exists()
@@ -0,0 +1,61 @@
+import hashlib
+import io
+
+import pytest
+
+from exception.custom_exception import UploadTooLargeError
+from utils.file_io import UploadBudget, stream_to_file, stream_uploaded_files
+
+
+class Upload(io.BytesIO):
+    """File-like upload with a name and (optionally) a declared size, like FastAPI's."""
+
+    def __init__(self, name, data, size=None):
+        super().__init__(data)
+        self.name = name
+        self.size = size
+
+
+class ChunkCounter(Upload):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def read(self, n=-1):
+        self.reads.append(n)
+        return super().read(n)
+
+
+def test_streams_in_chunks_and_hashes_while_writing(tmp_path):
+    data = b"%PDF" + bytes(range(256)) * 50
+    upload = ChunkCounter("doc.pdf", data)
+    saved = stream_to_file(upload, tmp_path / "out.pdf", UploadBudget(chunk_size=1000))
+
+    assert (tmp_path / "out.pdf").read_bytes() == data
+    assert saved.size == len(data)
+    assert saved.sha256 == hashlib.sha256(data).hexdigest()
+    assert set(upload.reads) == {1000}
+
+
+def test_file_limit_removes_the_partial_file(tmp_path):
+    out = tmp_path / "big.pdf"
+    with pytest.raises(UploadTooLargeError):
+        stream_to_file(Upload("big.pdf", b"x" * 5000), out, UploadBudget(max_file_bytes=3000, chunk_size=1000))
+    assert not out.exists()
+
+
+def test_declared_size_is_rejected_before_copying(tmp_path):
+    upload = ChunkCounter("big.pdf", b"x" * 10, size=10_000)
+    with pytest.raises(UploadTooLargeError):
+        stream_to_file(upload, tmp_path / "big.pdf", UploadBudget(max_file_bytes=100))
+    assert upload.reads == []
+
+
+def test_request_limit_spans_files_and_unsupported_files_are_skipped(tmp_path):
+    budget = UploadBudget(max_request_bytes=1500, chunk_size=512)
+    saved = stream_uploaded_files(
+        [Upload("a.pdf", b"a" * 1000), Upload("notes.exe", b"z" * 1000)], tmp_path, budget
+    )
+    assert [s.original_name for s in saved] == ["a.pdf"]
+    with pytest.raises(UploadTooLargeError):
+        stream_uploaded_files([Upload("b.txt", b"b" * 1000)], tmp_path, budget)
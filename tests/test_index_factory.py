@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.index_factory import (
+    FLAT,
+    HNSW,
+    IVF_FLAT,
+    IndexSettings,
+    all_vectors,
+    build_index,
+    index_type_of,
+    migrate_index,
+)
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, 8)).astype(np.float32)
+
+
+def test_auto_policy_moves_up_as_the_index_grows_keeping_row_order():
+    settings = IndexSettings(auto_flat_max=50, auto_hnsw_max=200)
+    first = _vectors(40)
+    index = build_index(first, settings)
+    index.add(first)
+    assert index_type_of(index) == FLAT
+    assert migrate_index(index, _vectors(5, seed=1), settings) is None
+
+    replacement = migrate_index(index, _vectors(20, seed=1), settings)
+    assert index_type_of(replacement) == HNSW
+    np.testing.assert_array_equal(all_vectors(replacement), first)
+    assert replacement.hnsw.efSearch == settings.hnsw_ef_search
+
+
+def test_ivf_trained_on_a_small_batch_is_retrained_once_it_grows():
+    settings = IndexSettings(type=IVF_FLAT, ivf_nlist=64)
+    first = _vectors(100)
+    index = build_index(first, settings)
+    index.add(first)
+    assert index.nlist == 2  # capped at ~39 points per centroid
+
+    more = _vectors(5000, seed=1)
+    replacement = migrate_index(index, more, settings)
+    assert replacement is not None and replacement.nlist == 64
+    # Existing rows keep their positions
+    np.testing.assert_array_equal(all_vectors(replacement), first)
+
+    replacement.add(more)
+    assert migrate_index(replacement, _vectors(100, seed=2), settings) is None
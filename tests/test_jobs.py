@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+import pytest
+
+from exception.custom_exception import IngestionQueueFullError
+from src.document_ingestion.jobs import FAILED, QUEUED, SUCCEEDED, IngestionJobs, JobStore
+
+
+def _wait(jobs, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_reports_stages_counts_and_result(registry, tmp_path):
+    jobs = IngestionJobs(JobStore(tmp_path / "jobs.sqlite"))
+
+    def work(reporter):
+        reporter.stage("loading", files=2)
+        reporter.stage("embedding", chunks=10)
+        reporter.progress(embedded=10)
+        return {"ingest": {"added": 10}}
+
+    job = _wait(jobs, jobs.submit("chat_index", "s1", work))
+
+    assert job["status"] == SUCCEEDED and job["stage"] == "done"
+    assert job["result"] == {"ingest": {"added": 10}}
+    assert job["counts"] == {"files": 2, "chunks": 10, "embedded": 10}
+    assert set(job["timings"]) == {"loading", "embedding", "total"}
+
+
+def test_failed_job_keeps_its_stage_and_error(registry, tmp_path):
+    jobs = IngestionJobs(JobStore(tmp_path / "jobs.sqlite"))
+
+    def work(reporter):
+        reporter.stage("loading")
+        raise ValueError("No valid documents loaded")
+
+    job = _wait(jobs, jobs.submit("chat_index", "s1", work))
+
+    assert job["status"] == FAILED and job["stage"] == "loading"
+    assert "No valid documents loaded" in job["error"]
+
+
+def test_submit_beyond_workers_and_queue_is_rejected(registry, tmp_path):
+    jobs = IngestionJobs(JobStore(tmp_path / "jobs.sqlite"), max_queue=0, workers=1)
+    release = threading.Event()
+    job_id = jobs.submit("chat_index", "s1", lambda reporter: release.wait(5) and {})
+
+    with pytest.raises(IngestionQueueFullError):
+        jobs.submit("chat_index", "s2", lambda reporter: {})
+    release.set()
+    assert _wait(jobs, job_id)["status"] == SUCCEEDED
+
+
+def test_jobs_of_a_previous_incarnation_with_same_pid_are_orphaned(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.create("live", "chat_index", "s-live", {})
+    store.create("stale", "chat_index", "s-stale", {})
+    # Written by an earlier worker that had our PID (container restart)
+    store.update("stale", owner=f"{os.getpid()}:0")
+
+    assert store.active_sessions() == {"s-live"}
+    assert store.fail_orphans() == 1
+    assert store.get("stale")["status"] == FAILED
+    assert store.get("live")["status"] == QUEUED
+
+
+def test_jobs_without_owner_token_are_orphaned(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.create("old", "chat_index", "s-old", {})
+    store.update("old", owner=None)
+
+    assert store.active_sessions() == set()
+    assert store.fail_orphans() == 1
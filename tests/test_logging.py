@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CONFIG = """
+logging:
+  level: "WARNING"
+  queue: {queue}
+  levels: {{"chatty": "DEBUG"}}
+  sample: {{"Hot event": 0.0}}
+"""
+
+SCRIPT = """
+import logging, sys
+sys.path.insert(0, {root!r})
+from logger.custom_logger import CustomLogger, _QueueHandler, _state
+
+app = CustomLogger().get_logger("app")
+chatty = CustomLogger().get_logger("chatty")
+app.info("below level")
+app.warning("kept", n=1)
+chatty.debug("debug override")
+chatty.info("Hot event")
+app.warning("Hot event")
+queued = any(isinstance(h, _QueueHandler) for h in logging.getLogger().handlers)
+if _state["listener"] is not None:
+    _state["listener"].stop()
+print(queued)
+"""
+
+
+def _run(tmp_path, queue):
+    (tmp_path / "config").mkdir()
+    (tmp_path / "config" / "config.yaml").write_text(CONFIG.format(queue=queue))
+    script = tmp_path / "emit.py"
+    script.write_text(SCRIPT.format(root=str(ROOT)))
+    env = {k: v for k, v in os.environ.items() if k != "LOG_LEVEL"}
+    out = subprocess.run(
+        [sys.executable, str(script)], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    (log_file,) = (tmp_path / "logs").iterdir()
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    return out.stdout.strip() == "True", records
+
+
+def test_levels_overrides_and_sampling_through_the_queue(tmp_path):
+    queued, records = _run(tmp_path, "true")
+
+    assert queued
+    assert [(r["event"], r["level"]) for r in records] == [
+        ("kept", "warning"),
+        ("debug override", "debug"),
+        ("Hot event", "warning"),  # sampling never drops warnings
+    ]
+    assert records[0]["n"] == 1 and records[0]["timestamp"].endswith("Z")
+
+
+def test_inline_mode_writes_the_same_records(tmp_path):
+    queued, records = _run(tmp_path, "false")
+
+    assert not queued
+    assert [r["event"] for r in records] == ["kept", "debug override", "Hot event"]
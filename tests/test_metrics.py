@@ -0,0 +1,45 @@
+import pytest
+
+from utils.metrics import MetricsRegistry, STAGE_ERRORS, STAGE_SECONDS, timed
+
+
+def test_render_histograms_counters_and_collectors():
+    metrics = MetricsRegistry()
+    latency = metrics.histogram("demo_seconds", "Demo latency.", ["stage"], buckets=(0.1, 1.0))
+    latency.labels("split").observe(0.05)
+    latency.labels("split").observe(0.5)
+    metrics.counter("demo_total", "Demo count.").labels().inc(3)
+    metrics.register_collector("demo", lambda: [("demo_entries", "gauge", "Entries.", [({"cache": "x"}, 7)])])
+
+    text = metrics.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="split",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="split",le="+Inf"} 2' in text
+    assert 'demo_seconds_count{stage="split"} 2' in text
+    assert "demo_total 3" in text
+    assert 'demo_entries{cache="x"} 7' in text
+
+
+def test_timed_records_failed_stages_as_errors():
+    @timed("test-stage")
+    def fail():
+        raise ValueError("boom")
+
+    errors = STAGE_ERRORS.labels("test-stage").value
+    with pytest.raises(ValueError):
+        fail()
+    assert STAGE_ERRORS.labels("test-stage").value == errors + 1
+    counts, _ = STAGE_SECONDS.labels("test-stage").snapshot()
+    assert sum(counts) >= 1
+
+
+def test_cache_metrics_do_not_build_an_embedding_client(monkeypatch):
+    import utils.model_loader as model_loader
+    from api.main import _cache_metrics
+
+    registry = model_loader.ModelRegistry()
+    monkeypatch.setattr(model_loader, "_registry", registry)
+
+    families = {name: samples for name, _, _, samples in _cache_metrics()}
+    assert registry._embeddings == {}
+    assert "embeddings" not in {labels["cache"] for labels, _ in families["document_portal_cache_hits_total"]}
@@ -0,0 +1,55 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore
+from utils.model_loader import ModelRegistry
+
+
+def test_reload_keeps_clients_held_elsewhere_usable(tmp_path):
+    registry = ModelRegistry()
+    http_client = registry._get_http_client()
+    store = EmbeddingStore(tmp_path / "cache")
+    held = CachedEmbeddings(DeterministicFakeEmbedding(size=8), model_name="m", store=store)
+    registry._embeddings[("openai", "m", True)] = held
+    vector = held.embed_query("warm")
+
+    registry.reload()
+
+    # Still referenced by e.g. a cached vectorstore: must not be closed under it
+    assert not http_client.is_closed
+    assert registry._get_http_client() is not http_client
+    # The dropped cache is closed and degrades to the underlying model
+    assert len(store) == 0
+    assert held.embed_query("warm") == vector
+
+
+def test_built_embeddings_never_creates_a_client():
+    registry = ModelRegistry()
+    assert registry.built_embeddings() is None
+    assert registry._embeddings == {}
+
+    embeddings = registry.get_embeddings(cached=False)
+    assert registry.built_embeddings(cached=False) is embeddings
+
+
+def test_clients_share_one_async_pool_per_event_loop():
+    import asyncio
+
+    registry = ModelRegistry()
+    embeddings = registry.get_embeddings(cached=False)
+    llm = registry.get_llm()
+    shared = registry._get_async_http_client()
+    assert embeddings.http_async_client is shared
+    assert llm.http_async_client is shared
+
+    transport = shared._transport
+
+    async def pool():
+        return transport._pool()
+
+    async def twice():
+        return await pool(), await pool()
+
+    first, again = asyncio.run(twice())
+    other = asyncio.run(pool())
+    assert first is again
+    assert other is not first
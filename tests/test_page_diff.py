@@ -0,0 +1,141 @@
+import asyncio
+import re
+
+import structlog
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from src.document_compare import document_comparator
+from src.document_compare.document_comparator import DocumentComparatorLLM
+from src.document_compare.page_diff import CHANGED, DELETED, EQUAL, INSERTED, align_pages
+
+
+def _statuses(pairs):
+    return [(p.ref_page, p.act_page, p.status) for p in pairs]
+
+
+def test_inserted_page_does_not_shift_later_pages():
+    ref = ["intro", "terms", "pricing"]
+    act = ["intro", "new annex", "terms", "pricing"]
+    assert _statuses(align_pages(ref, act)) == [
+        (1, 1, EQUAL),
+        (None, 2, INSERTED),
+        (2, 3, EQUAL),
+        (3, 4, EQUAL),
+    ]
+
+
+def test_whitespace_only_changes_are_equal():
+    assert _statuses(align_pages(["a  b\nc"], ["a b c "])) == [(1, 1, EQUAL)]
+
+
+def test_replaced_block_pairs_positionally_then_deletes_leftovers():
+    ref = ["same", "old one", "old two", "end"]
+    act = ["same", "new one", "end"]
+    pairs = align_pages(ref, act)
+    assert _statuses(pairs) == [(1, 1, EQUAL), (2, 2, CHANGED), (3, None, DELETED), (4, 3, EQUAL)]
+    assert "-old one" in pairs[1].diff and "+new one" in pairs[1].diff
+
+
+def test_window_rows_keep_page_order_and_drop_unmatched_summaries():
+    comparator = DocumentComparatorLLM.__new__(DocumentComparatorLLM)
+    comparator.logger = structlog.get_logger("test")
+    pairs = align_pages(["same", "old"], ["same", "new"])
+    rows = comparator._window_rows(
+        pairs, [{"Page": "2", "Changes": "old -> new"}, {"Page": "7", "Changes": "invented"}]
+    )
+    assert rows == [
+        {"Page": "1", "Changes": "NO CHANGE"},
+        {"Page": "2", "Changes": "old -> new"},
+    ]
+
+
+def _comparator(monkeypatch, window_pages=20, window_chars=40000, delays=None):
+    """A comparator whose diff chain echoes each window's pages, slowest first if delays say so."""
+    monkeypatch.setattr(document_comparator, "get_result_cache", lambda: None)
+    comparator = DocumentComparatorLLM.__new__(DocumentComparatorLLM)
+    comparator.logger = structlog.get_logger("test")
+    comparator.parser = JsonOutputParser()
+    comparator.diff_prompt = None
+    comparator._cache_key = lambda *args: None
+    comparator.diff_context_lines, comparator.max_diff_chars = 2, 6000
+    comparator.window_pages, comparator.window_chars = window_pages, window_chars
+    comparator.max_concurrency = 4
+    comparator.last_diff_stats = {}
+    comparator.calls = []
+
+    async def summarize(inputs):
+        pages = re.findall(r"^Page: (\d+)", inputs["page_diffs"], re.M)
+        comparator.calls.append(pages)
+        await asyncio.sleep((delays or {}).get(pages[0], 0))
+        return [{"Page": page, "Changes": f"page {page} changed"} for page in pages]
+
+    comparator.diff_chain = RunnableLambda(lambda inputs: None, afunc=summarize)
+    return comparator
+
+
+def test_windows_are_bounded_by_changed_pages_and_chars(monkeypatch):
+    ref = [f"page {i}" for i in range(1, 8)]
+    act = [f"page {i}" + (" edited" if i % 2 else "") for i in range(1, 8)]
+    comparator = _comparator(monkeypatch, window_pages=2)
+    windows = comparator._windows(comparator._align(ref, act))
+    assert [sum(p.status != EQUAL for p in w) for w in windows] == [2, 2]
+    assert sum(len(w) for w in windows) == 7  # unchanged pages ride along
+
+    comparator.window_chars = 1
+    windows = comparator._windows(comparator._align(ref, act))
+    assert [sum(p.status != EQUAL for p in w) for w in windows] == [1, 1, 1, 1]
+
+
+def test_windows_stream_as_they_finish_and_merge_in_page_order(monkeypatch):
+    ref = ["one", "two", "three", "four"]
+    act = ["one!", "two!", "three", "four!"]
+    comparator = _comparator(monkeypatch, window_pages=1, delays={"1": 0.2})
+
+    async def collect():
+        return [event async for event in comparator.astream_pages(ref, act)]
+
+    events = asyncio.run(collect())
+    assert events[0]["event"] == "plan" and events[0]["data"]["changed_pages"] == 3
+    windows = [e["data"]["window"] for e in events if e["event"] == "rows"]
+    assert windows[-1] == 0 and sorted(windows) == list(range(len(windows)))
+    assert events[-1]["event"] == "done"
+
+    df = asyncio.run(_comparator(monkeypatch, window_pages=1, delays={"1": 0.2}).acompare_pages(ref, act))
+    assert df.to_dict("records") == [
+        {"Page": "1", "Changes": "page 1 changed"},
+        {"Page": "2", "Changes": "page 2 changed"},
+        {"Page": "3", "Changes": "NO CHANGE"},
+        {"Page": "4", "Changes": "page 4 changed"},
+    ]
+
+
+def test_compare_stream_endpoint_writes_ndjson_lines(monkeypatch, registry):
+    import json
+
+    import fitz
+    from fastapi.testclient import TestClient
+
+    import api.main as main
+
+    def pdf(pages):
+        doc = fitz.open()
+        for text in pages:
+            doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+    comparator = _comparator(monkeypatch, window_pages=1)
+    monkeypatch.setattr(main, "DocumentComparatorLLM", lambda: comparator)
+    response = TestClient(main.app).post(
+        "/compare/stream",
+        files={
+            "reference": ("ref.pdf", pdf(["alpha", "beta"]), "application/pdf"),
+            "actual": ("act.pdf", pdf(["alpha", "gamma"]), "application/pdf"),
+        },
+    )
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["event"] for line in lines] == ["session", "plan", "rows", "done"]
+    rows = {r["Page"]: r["Changes"] for line in lines if line["event"] == "rows" for r in line["data"]["rows"]}
+    assert rows == {"1": "NO CHANGE", "2": "page 2 changed"}
@@ -0,0 +1,37 @@
+import numpy as np
+
+from src.document_chat.rerank import MMR, THRESHOLD, RerankSettings, adaptive_cut, mmr_select
+
+QUERY = np.array([1.0, 0.0, 0.0])
+CANDIDATES = np.array(
+    [
+        [1.0, 0.1, 0.0],  # most relevant
+        [1.0, 0.12, 0.0],  # near-duplicate of it
+        [0.7, 0.0, 0.7],  # less relevant, different
+    ]
+)
+
+
+def test_mmr_trades_relevance_for_diversity():
+    assert mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=0.5) == [0, 2]
+    assert mmr_select(QUERY, CANDIDATES, k=5) == [0, 2, 1]
+    assert mmr_select(QUERY, CANDIDATES[:0], k=2) == []
+
+
+def test_adaptive_cut_keeps_hits_near_the_best():
+    scores = np.array([0.9, 0.85, 0.6, 0.55])
+    assert adaptive_cut(scores, k=4, max_drop=0.15) == [0, 1]
+    assert adaptive_cut(scores, k=1, max_drop=0.5) == [0]
+    assert adaptive_cut(scores, k=4, score_threshold=0.95, min_k=2) == [0, 1]
+
+
+def test_resolve_fills_only_missing_knobs():
+    settings = RerankSettings(fetch_k=30, lambda_mult=0.4)
+    assert settings.resolve(MMR, {"k": 5, "lambda_mult": 0.8, "fetch_k": None}) == {
+        "k": 5,
+        "fetch_k": 30,
+        "lambda_mult": 0.8,
+    }
+    assert set(settings.resolve(THRESHOLD, {"k": 5})) == {"k", "fetch_k", "score_threshold", "max_drop", "min_k"}
+    assert settings.resolve("similarity", {"k": 5}) == {"k": 5}
@@ -0,0 +1,37 @@
+from utils.result_cache import ResultCache, result_key
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = ResultCache(tmp_path / "results.sqlite")
+    key = result_key("analysis", "document text", "prompt", {"model": "m"})
+    assert cache.get(key) is None
+    cache.put(key, "analysis", {"Summary": ["ok"]})
+    assert cache.get(key) == {"Summary": ["ok"]}
+    # Another worker's connection sees the same entry
+    assert ResultCache(tmp_path / "results.sqlite").get(key) == {"Summary": ["ok"]}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_key_changes_with_prompt_and_model():
+    base = result_key("analysis", "text", "prompt v1", {"model": "a"})
+    assert base != result_key("analysis", "text", "prompt v2", {"model": "a"})
+    assert base != result_key("analysis", "text", "prompt v1", {"model": "b"})
+    assert base == result_key("analysis", "text", "prompt v1", {"model": "a"})
+
+
+def test_hits_do_not_write_until_the_next_put(tmp_path):
+    cache = ResultCache(tmp_path / "results.sqlite", max_entries=2, touch_interval=3600)
+    cache.put("old", "k", 1)
+    cache.put("new", "k", 2)
+    cache._db.execute("UPDATE results SET last_access = CASE key WHEN 'old' THEN 1 ELSE 2 END")
+    cache._db.commit()
+
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for _ in range(20):
+        assert cache.get("old") == 1
+    assert not [s for s in statements if s.startswith("UPDATE")]
+
+    # The buffered hit is flushed before eviction, so "new" is now the LRU entry
+    cache.put("third", "k", 3)
+    assert cache.get("old") == 1 and cache.get("new") is None
@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.data_ingestion import FaissManager
+from utils.model_loader import ModelLoader
+
+ANSWER = "Close the inlet valve first."
+TOPICS = ["inlet valve", "pump seal", "pressure gauge", "drain plug", "outlet valve", "filter housing"]
+
+
+@pytest.fixture
+def index_dir(registry, tmp_path):
+    docs = [
+        Document(page_content=f"{topic} maintenance step {i}", metadata={"source": "manual.txt", "start_index": i})
+        for i, topic in enumerate(TOPICS)
+    ]
+    FaissManager(tmp_path / "idx", ModelLoader(registry)).add_documents(docs)
+    return str(tmp_path / "idx")
+
+
+@pytest.fixture
+def make_rag(index_dir, monkeypatch):
+    monkeypatch.setattr(
+        ConversationalRAG,
+        "_load_llm",
+        lambda self: GenericFakeChatModel(messages=itertools.repeat(AIMessage(ANSWER))),
+    )
+
+    def make(search_type="similarity", k=2, **search_kwargs):
+        rag = ConversationalRAG(session_id="s1")
+        rag.load_retriever_from_faiss(index_dir, k=k, search_type=search_type, search_kwargs=search_kwargs)
+        return rag
+
+    return make
+
+
+async def _events(rag, question):
+    return [event async for event in rag.astream(question, chat_history=[])]
+
+
+def test_astream_yields_sources_then_tokens_then_done(make_rag):
+    events = asyncio.run(_events(make_rag(), "inlet valve maintenance step 0"))
+
+    kinds = [e["event"] for e in events]
+    assert kinds[0] == "sources" and kinds[-1] == "done"
+    assert set(kinds[1:-1]) == {"token"} and len(kinds) > 3  # streamed, not one chunk
+    assert len(events[0]["data"]) == 2 and events[0]["data"][0]["source"] == "manual.txt"
+    assert "".join(e["data"] for e in events[1:-1]) == ANSWER
+    assert events[-1]["data"]["cache_hit"] is False
+
+
+def test_repeated_question_streams_the_cached_answer(make_rag):
+    asyncio.run(_events(make_rag(), "pump seal maintenance"))
+    events = asyncio.run(_events(make_rag(), "pump seal maintenance"))
+
+    assert [e["event"] for e in events] == ["sources", "token", "done"]
+    assert events[1]["data"] == ANSWER and events[-1]["data"]["cache_hit"] is True
+
+
+def test_stream_endpoint_emits_server_sent_events(make_rag, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api.main as main
+
+    rag = make_rag()
+
+    async def build_rag(*args):
+        return rag
+
+    monkeypatch.setattr(main, "_build_rag", build_rag)
+    response = TestClient(main.app).post("/chat/query/stream", data={"question": "drain plug"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in response.text.split("\n\n") if f]
+    assert frames[0].startswith("event: sources\ndata: [")
+    assert frames[1].startswith("event: token\n")
+    assert frames[-1].startswith("event: done\n")
+
+
+def test_hybrid_search_surfaces_exact_term_matches(make_rag, registry):
+    # Fake embeddings rank chunks arbitrarily: the lexical side must find it
+    registry.config["retriever"]["hybrid"].update(enabled=True, lexical_weight=0.9)
+    rag = make_rag(k=1)
+
+    assert rag.bm25 is not None and len(rag.bm25) == len(TOPICS)
+    for topic in ("drain plug", "filter housing"):
+        assert rag._search(topic)[0].page_content.startswith(topic)
+
+
+def test_mmr_and_threshold_modes_select_from_candidates(make_rag):
+    mmr = make_rag("mmr", k=3, fetch_k=6)
+    picked = mmr._search("pump seal maintenance")
+    assert len({d.page_content for d in picked}) == 3
+
+    # max_drop=0 keeps only the best-scoring chunk
+    threshold = make_rag("threshold", k=4, max_drop=0.0)
+    assert len(threshold._search("pump seal maintenance")) == 1
+
+
+def test_unknown_search_type_is_rejected(registry):
+    from fastapi.testclient import TestClient
+
+    import api.main as main
+
+    response = TestClient(main.app).post(
+        "/chat/query", data={"question": "q", "session_id": "s1", "search_type": "fuzzy"}
+    )
+    assert response.status_code == 400
+
+
+HISTORY = [HumanMessage("How do I service the pump?"), AIMessage("Start with the pump seal.")]
+
+
+@pytest.fixture
+def retrieve(make_rag, registry, monkeypatch):
+    """Run retrieval with chat history, the LLM rewriting the question to `rewrite`; records embedded queries."""
+    embeddings = registry.get_embeddings()
+    embedded = []
+    embed_query = type(embeddings).embed_query
+
+    def spy(self, text):
+        embedded.append(text)
+        return embed_query(self, text)
+
+    monkeypatch.setattr(type(embeddings), "embed_query", spy)
+
+    def retrieve(question, rewrite=None, history=HISTORY):
+        # No reply is queued on the first turn, so a rewrite call would fail
+        replies = iter([AIMessage(rewrite)] if history else [])
+        monkeypatch.setattr(ConversationalRAG, "_load_llm", lambda self: GenericFakeChatModel(messages=replies))
+        rag = make_rag()
+        embedded.clear()
+        docs = rag.retrieve_chain.invoke({"input": question, "chat_history": history})
+        return rag, docs, list(embedded)
+
+    return retrieve
+
+
+def test_first_turn_skips_the_rewrite(retrieve):
+    rag, docs, embedded = retrieve("inlet valve maintenance step 0", history=[])
+    assert rag.last_retrieval["strategy"] == "direct"
+    assert docs[0].page_content == "inlet valve maintenance step 0"
+    assert set(embedded) == {"inlet valve maintenance step 0"}
+
+
+def test_rewrite_restating_the_question_runs_no_second_search(retrieve):
+    rag, _, embedded = retrieve("pump seal maintenance?", rewrite="Pump seal maintenance")
+    assert rag.last_retrieval["strategy"] == "speculative_same_query"
+    assert set(embedded) == {"pump seal maintenance?"}
+
+    rag, _, embedded = retrieve("pump seal maintenance steps", rewrite="pump seal maintenance steps please")
+    assert rag.last_retrieval["strategy"] == "speculative_hit"
+    assert rag.last_retrieval["similarity"] == 0.8
+    assert "pump seal maintenance steps please" not in embedded
+
+
+def test_different_rewrite_is_searched_and_used(retrieve):
+    rag, docs, embedded = retrieve("and the one after that?", rewrite="drain plug maintenance step 3")
+    assert rag.last_retrieval["strategy"] == "rewritten"
+    assert "drain plug maintenance step 3" in embedded
+    assert docs[0].page_content == "drain plug maintenance step 3"
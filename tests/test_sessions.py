@@ -0,0 +1,94 @@
+from src.document_ingestion.sessions import (
+    CHAT_INDEX,
+    COLLECTION,
+    COMPARE,
+    UPLOADS,
+    SessionCatalog,
+    SessionPolicy,
+)
+
+MB = 1024 * 1024
+NOW = 1_000_000.0
+
+
+def _catalog(tmp_path, sessions):
+    """sessions: (session_id, bytes, seconds since last access)"""
+    catalog = SessionCatalog(tmp_path / "sessions.sqlite")
+    for session_id, nbytes, idle in sessions:
+        catalog.record(UPLOADS, session_id, tmp_path / session_id, nbytes=nbytes)
+        catalog.db.execute(
+            "UPDATE sessions SET last_access = ? WHERE session_id = ?", (NOW - idle, session_id)
+        )
+    catalog.db.commit()
+    return catalog
+
+
+def _plan(catalog, **policy):
+    return [(e["session_id"], e["reason"]) for e in catalog.plan_eviction(SessionPolicy(**policy), now=NOW)]
+
+
+def test_ttl_evicts_idle_sessions_regardless_of_grace(tmp_path):
+    catalog = _catalog(tmp_path, [("old", MB, 3 * 3600), ("new", MB, 60)])
+    assert _plan(catalog, ttl_hours=2, max_total_mb=0, grace_minutes=600) == [("old", "ttl")]
+
+
+def test_lru_evicts_oldest_first_down_to_max_sessions(tmp_path):
+    catalog = _catalog(tmp_path, [("a", MB, 4000), ("b", MB, 3000), ("c", MB, 2000), ("d", MB, 1000)])
+    assert _plan(catalog, ttl_hours=0, max_sessions=2, max_total_mb=0, grace_minutes=0) == [
+        ("a", "lru"),
+        ("b", "lru"),
+    ]
+
+
+def test_quota_stops_once_under_and_grace_protects_recent(tmp_path):
+    catalog = _catalog(tmp_path, [("a", 3 * MB, 4000), ("b", 3 * MB, 3000), ("c", 3 * MB, 60)])
+    assert _plan(catalog, ttl_hours=0, max_total_mb=5, grace_minutes=0) == [
+        ("a", "quota"),
+        ("b", "quota"),
+    ]
+    # "b" is within the grace period: the sweep stops there even though still over quota
+    assert _plan(catalog, ttl_hours=0, max_total_mb=1, grace_minutes=60) == [("a", "quota")]
+
+
+def test_disabled_rules_evict_nothing(tmp_path):
+    catalog = _catalog(tmp_path, [("a", 100 * MB, 10 * 3600)])
+    assert _plan(catalog, ttl_hours=0, max_sessions=0, max_total_mb=0, grace_minutes=0) == []
+
+
+def test_purge_leaves_shared_areas_to_on_delete(tmp_path):
+    catalog = SessionCatalog(tmp_path / "sessions.sqlite")
+    own, shared = tmp_path / "own", tmp_path / "shared"
+    own.mkdir()
+    shared.mkdir()
+    catalog.record(CHAT_INDEX, "s1", own)
+    catalog.record(COLLECTION, "s1", shared, nbytes=0)
+
+    deleted = []
+    catalog.purge("s1", on_delete=lambda area, session_id, path: deleted.append((area, session_id)))
+
+    assert sorted(deleted) == [(CHAT_INDEX, "s1"), (COLLECTION, "s1")]
+    assert not own.exists() and shared.exists()
+    assert catalog.get("s1") == []
+
+
+def test_compare_cleanup_purges_only_the_compare_area(tmp_path, monkeypatch):
+    from src.document_ingestion import data_ingestion
+
+    catalog = SessionCatalog(tmp_path / "sessions.sqlite")
+    monkeypatch.setattr(data_ingestion, "get_session_catalog", lambda: catalog)
+    dirs = {}
+    for i, session_id in enumerate(["old", "new"]):
+        for area in (COMPARE, UPLOADS):
+            path = dirs[session_id, area] = tmp_path / area / session_id
+            path.mkdir(parents=True)
+            catalog.record(area, session_id, path, nbytes=1)
+            catalog.db.execute(
+                "UPDATE sessions SET created = ? WHERE session_id = ?", (NOW + i, session_id)
+            )
+    catalog.db.commit()
+
+    data_ingestion.DocumentComparator(str(tmp_path / "compare"), "current").clean_old_sessions(keep_latest=1)
+
+    assert not dirs["old", COMPARE].exists()
+    assert dirs["old", UPLOADS].exists() and dirs["new", COMPARE].exists()
+    assert [row["area"] for row in catalog.get("old")] == [UPLOADS]
@@ -0,0 +1,75 @@
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from src.document_ingestion.sharded_index import ShardedCollection
+from utils.index_factory import search_subset
+from utils.model_loader import ModelLoader
+
+
+def _docs(prefix, n):
+    return [
+        Document(page_content=f"{prefix} chunk {i}", metadata={"source": f"{prefix}.txt", "start_index": i})
+        for i in range(n)
+    ]
+
+
+def test_small_tenant_in_shared_shard_gets_full_top_k(registry, tmp_path):
+    collection = ShardedCollection("c", base_dir=tmp_path, model_loader=ModelLoader(registry))
+    collection.add_documents(_docs("big", 400), session_id="s-big", tenant_id="big")
+    collection.add_documents(_docs("small", 5), session_id="s-small", tenant_id="small")
+    assert len(collection.stats()["shards"]) == 1
+
+    hits = collection.search("big chunk 7", k=3, tenant_id="small")
+    assert len(hits) == 3
+    assert {d.metadata["tenant_id"] for d, _ in hits} == {"small"}
+
+    by_session = collection.search("anything", k=10, session_ids=["s-small"])
+    assert sorted(d.page_content for d, _ in by_session) == sorted(d.page_content for d in _docs("small", 5))
+
+
+def test_untracked_rows_fall_back_to_widened_filter(registry, tmp_path):
+    collection = ShardedCollection("c", base_dir=tmp_path, model_loader=ModelLoader(registry))
+    collection.add_documents(_docs("big", 400), session_id="s-big", tenant_id="big")
+    collection.add_documents(_docs("small", 5), session_id="s-small", tenant_id="small")
+    # A catalog written before row tracking existed
+    collection._db.execute("DELETE FROM member_rows")
+    collection._db.commit()
+
+    hits = collection.search("big chunk 7", k=3, tenant_id="small")
+    assert len(hits) == 3
+    assert {d.metadata["tenant_id"] for d, _ in hits} == {"small"}
+
+
+def test_search_subset_matches_brute_force():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3000, 16)).astype(np.float32)
+    index = faiss.IndexFlatL2(16)
+    index.add(data)
+    subset = rng.choice(3000, 500, replace=False)
+    query = rng.normal(size=16).astype(np.float32)
+
+    expected = sorted(subset, key=lambda i: float(((data[i] - query) ** 2).sum()))[:5]
+    for exact_max in (0, 10_000):  # IDSelector path and exact scan
+        found = search_subset(index, query, 5, subset, exact_max=exact_max)
+        assert [pos for _, pos in found] == [int(i) for i in expected]
+
+
+def test_removed_session_is_never_returned_and_can_be_reindexed(registry, tmp_path):
+    collection = ShardedCollection("c", base_dir=tmp_path, model_loader=ModelLoader(registry))
+    collection.add_documents(_docs("keep", 20), session_id="s-keep", tenant_id="t")
+    collection.add_documents(_docs("gone", 20), session_id="s-gone", tenant_id="t")
+
+    assert collection.remove_session("s-gone") == 20
+    assert collection.select_shards(session_ids=["s-gone"]) == []
+    # Whole-tenant and unfiltered searches skip the removed rows, tracked or not
+    for untracked in (False, True):
+        if untracked:
+            collection._db.execute("DELETE FROM member_rows")
+            collection._db.commit()
+        hits = collection.search("gone chunk 3", k=25, tenant_id="t")
+        assert len(hits) == 20
+        assert {d.metadata["session_id"] for d, _ in hits} == {"s-keep"}
+
+    # Fingerprints went with the texts, so the same upload is indexed again
+    assert collection.add_documents(_docs("gone", 20), session_id="s-gone", tenant_id="t")["embedded"] == 20
@@ -0,0 +1,58 @@
+import os
+
+from utils.vectorstore_cache import VectorStoreCache
+
+
+def _fake_index(index_dir, nbytes=100):
+    """A legacy-layout index: enough for the cache's version stamp and size."""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    (index_dir / "index.faiss").write_bytes(b"f" * nbytes)
+    (index_dir / "index.pkl").write_bytes(b"p")
+    return index_dir
+
+
+def test_hit_until_the_index_is_rewritten(tmp_path):
+    cache = VectorStoreCache()
+    index_dir = _fake_index(tmp_path / "a")
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return object()
+
+    first = cache.get(index_dir, loader)
+    assert cache.get(index_dir, loader) is first
+    assert len(loads) == 1
+
+    faiss_file = index_dir / "index.faiss"
+    faiss_file.write_bytes(b"g" * 120)
+    os.utime(faiss_file, ns=(1, 1))
+    assert cache.get(index_dir, loader) is not first
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = VectorStoreCache(max_bytes=250)
+    a, b, c = (_fake_index(tmp_path / n) for n in "abc")
+    cache.get(a, object)
+    cache.get(b, object)
+    cache.get(a, object)
+    cache.get(c, object)
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    misses = stats["misses"]
+    cache.get(a, object)
+    assert cache.stats()["misses"] == misses  # a was used recently, b went
+
+
+def test_config_reload_drops_cached_stores(tmp_path, registry, monkeypatch):
+    import api.main as main
+
+    cache = VectorStoreCache()
+    monkeypatch.setattr(main, "get_vectorstore_cache", lambda: cache)
+    index_dir = _fake_index(tmp_path / "a")
+    stale = cache.get(index_dir, object)
+
+    assert main.reload_config()["vectorstores_dropped"] == 1
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    assert cache.get(index_dir, object) is not stale
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# Words, numbers and compound codes such as "4.2.1", "ab-1234" or "iso/iec"
+_TOKEN = re.compile(r"[0-9a-z]+(?:[._\-/:][0-9a-z]+)*")
+_PARTS = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound codes are kept whole and also split into parts."""
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(_PARTS.findall(token))
+    return tokens
+
+
+def bm25_path(index_dir: Union[str, Path], index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.bm25.npz"
+
+
+def bm25_segment_path(
+    index_dir: Union[str, Path], first_row: int, index_name: str = "index"
+) -> Path:
+    return Path(index_dir) / f"{index_name}.bm25.{first_row:010d}.npz"
+
+
+def bm25_files(index_dir: Union[str, Path], index_name: str = "index") -> List[Tuple[int, Path]]:
+    """
+    (first row, path) of the lexical index files in row order: the base
+    file (row 0) and the segments appended after it, which mirror the
+    FAISS segments so an ingest never rewrites the whole BM25 index.
+    """
+    files: List[Tuple[int, Path]] = []
+    base = bm25_path(index_dir, index_name)
+    if base.exists():
+        files.append((0, base))
+    for path in Path(index_dir).glob(f"{index_name}.bm25.*.npz"):
+        first_row = path.name[len(index_name) + len(".bm25.") : -len(".npz")]
+        if first_row.isdigit():
+            files.append((int(first_row), path))
+    return sorted(files)
+
+
+def bm25_rows(index_dir: Union[str, Path], index_name: str = "index") -> int:
+    """
+    Rows covered by the lexical index files up to the first gap in the
+    sequence; only each file's doc lengths are read.
+    """
+    rows = 0
+    for first_row, path in bm25_files(index_dir, index_name):
+        if first_row != rows:
+            break
+        with np.load(path, allow_pickle=False) as data:
+            rows += len(data["doc_len"])
+    return rows
+
+
+@dataclass
+class HybridSettings:
+    """Hybrid (BM25 + vector) retrieval knobs from the retriever.hybrid config section."""
+
+    enabled: bool = True
+    lexical_weight: float = 0.5  # RRF weight of the BM25 ranking; vectors get 1 - this
+    rrf_k: int = 60
+    candidates: int = 20  # hits taken from each ranking before fusion
+    k1: float = 1.2
+    b: float = 0.75
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HybridSettings":
+        cfg = (config.get("retriever", {}) or {}).get("hybrid", {}) or {}
+        return cls(
+            enabled=bool(cfg.get("enabled", True)),
+            lexical_weight=float(cfg.get("lexical_weight", 0.5)),
+            rrf_k=int(cfg.get("rrf_k", 60)),
+            candidates=int(cfg.get("candidates", 20)),
+            k1=float(cfg.get("k1", 1.2)),
+            b=float(cfg.get("b", 0.75)),
+        )
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one FAISS store. Row i is the chunk at
+    FAISS position i, so hits map to docstore ids through index_to_docstore_id.
+
+    Postings are kept term-major in flat NumPy arrays (CSC layout):
+    term t occupies postings[term_ptr[t]:term_ptr[t + 1]]. A query gathers
+    the slices of its terms and scores every matching row in one bincount.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.term_ptr = np.zeros(1, dtype=np.int64)
+        self.post_rows = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.vocab)
+
+    def add(self, texts: Iterable[str]) -> "BM25Index":
+        """Append rows for texts (in FAISS insertion order)."""
+        first_row = len(self.doc_len)
+        terms, rows, tfs, lengths = [], [], [], []
+        for offset, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                term = self.vocab.setdefault(token, len(self.vocab))
+                terms.append(term)
+                rows.append(first_row + offset)
+                tfs.append(tf)
+        if lengths:
+            self._append(
+                np.asarray(terms, dtype=np.int32),
+                np.asarray(rows, dtype=np.int32),
+                np.asarray(tfs, dtype=np.float32),
+                np.asarray(lengths, dtype=np.float32),
+            )
+        return self
+
+    def extend(self, other: "BM25Index") -> "BM25Index":
+        """Append the rows of another index (e.g. a segment) after this one's."""
+        if not len(other):
+            return self
+        terms = sorted(other.vocab, key=other.vocab.__getitem__)
+        remap = np.asarray(
+            [self.vocab.setdefault(t, len(self.vocab)) for t in terms], dtype=np.int32
+        )
+        other_terms = np.repeat(
+            np.arange(len(other.term_ptr) - 1, dtype=np.int32), np.diff(other.term_ptr)
+        )
+        self._append(
+            remap[other_terms],
+            (other.post_rows + len(self.doc_len)).astype(np.int32),
+            other.post_tf,
+            other.doc_len,
+        )
+        return self
+
+    def _append(
+        self, terms: np.ndarray, rows: np.ndarray, tfs: np.ndarray, lengths: np.ndarray
+    ) -> None:
+        # Existing postings are term-major with ascending rows; new rows are
+        # larger, so a stable sort by term keeps every posting list sorted.
+        old_terms = np.repeat(
+            np.arange(len(self.term_ptr) - 1, dtype=np.int32), np.diff(self.term_ptr)
+        )
+        all_terms = np.concatenate([old_terms, terms])
+        order = np.argsort(all_terms, kind="stable")
+        self.post_rows = np.concatenate([self.post_rows, rows])[order]
+        self.post_tf = np.concatenate([self.post_tf, tfs])[order]
+        counts = np.bincount(all_terms, minlength=len(self.vocab))
+        self.term_ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.doc_len = np.concatenate([self.doc_len, lengths])
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """Top-k (row, score) pairs, best first; rows without any query term are skipped."""
+        n = len(self.doc_len)
+        term_ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+        if not n or not term_ids or k <= 0:
+            return []
+
+        starts = self.term_ptr[term_ids]
+        ends = self.term_ptr[np.asarray(term_ids) + 1]
+        df = (ends - starts).astype(np.float32)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+
+        take = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        rows = self.post_rows[take]
+        tf = self.post_tf[take]
+        weights = np.repeat(idf, (ends - starts))
+
+        avgdl = float(self.doc_len.mean()) or 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[rows] / avgdl)
+        scores = np.bincount(
+            rows, weights=weights * tf * (self.k1 + 1.0) / (tf + norm), minlength=n
+        )
+
+        hit_rows = np.flatnonzero(scores)
+        if len(hit_rows) > k:
+            hit_rows = hit_rows[np.argpartition(-scores[hit_rows], k - 1)[:k]]
+        hit_rows = hit_rows[np.argsort(-scores[hit_rows], kind="stable")]
+        return [(int(r), float(scores[r])) for r in hit_rows]
+
+    # ---------- Persistence ----------
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write atomically as a plain .npz (no pickled objects)."""
+        path = Path(path)
+        terms = sorted(self.vocab, key=self.vocab.__getitem__)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            term_ptr=self.term_ptr,
+            post_rows=self.post_rows,
+            post_tf=self.post_tf,
+            doc_len=self.doc_len,
+            params=np.asarray([self.k1, self.b], dtype=np.float64),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = (float(x) for x in data["params"])
+            index = cls(k1=k1, b=b)
+            raw = data["terms"].tobytes().decode("utf-8")
+            index.vocab = {t: i for i, t in enumerate(raw.split("\n"))} if raw else {}
+            index.term_ptr = data["term_ptr"]
+            index.post_rows = data["post_rows"]
+            index.post_tf = data["post_tf"]
+            index.doc_len = data["doc_len"]
+        return index
+
+
+def rrf_fuse(
+    rankings: Sequence[Sequence[str]], weights: Sequence[float], k: int = 60
+) -> List[str]:
+    """Weighted reciprocal rank fusion of id rankings (best first)."""
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=lambda d: -scores[d])
+
+
+# ----------------------------- #
+# Process-wide cache            #
+# ----------------------------- #
+_MAX_CACHED = 64
+_cache: "OrderedDict[str, Tuple[Tuple[Tuple[str, int, int], ...], BM25Index]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def read_bm25(index_dir: Union[str, Path], index_name: str = "index") -> Optional[BM25Index]:
+    """Base + segment files merged into one index; None when there are none."""
+    index: Optional[BM25Index] = None
+    for first_row, path in bm25_files(index_dir, index_name):
+        if first_row != (len(index) if index is not None else 0):
+            log.warning("BM25 segment out of sequence", path=str(path), first_row=first_row)
+            break
+        part = BM25Index.load(path)
+        index = part if index is None else index.extend(part)
+    return index
+
+
+def compact_bm25(index_dir: Union[str, Path], index_name: str = "index") -> bool:
+    """
+    Merge the lexical segments into the base file. The caller holds the
+    store's writer lock, so no segment appears or vanishes meanwhile.
+    """
+    files = bm25_files(index_dir, index_name)
+    if not any(first_row for first_row, _ in files):
+        return False
+    index = read_bm25(index_dir, index_name)
+    if index is None:
+        return False
+    index.save(bm25_path(index_dir, index_name))
+    for first_row, path in files:
+        if first_row:
+            path.unlink(missing_ok=True)
+    return True
+
+
+def load_bm25(index_dir: Union[str, Path], index_name: str = "index") -> Optional[BM25Index]:
+    """
+    Cached BM25Index for a store directory, reloaded when its files change.
+    None when the store has no lexical index (e.g. built before hybrid search).
+    """
+    key = str(bm25_path(index_dir, index_name).resolve())
+    for attempt in range(3):
+        try:
+            version = tuple(
+                (path.name, st.st_mtime_ns, st.st_size)
+                for path, st in (
+                    (path, os.stat(path)) for _, path in bm25_files(index_dir, index_name)
+                )
+            )
+            if not version:
+                return None
+            with _cache_lock:
+                entry = _cache.get(key)
+                if entry is not None and entry[0] == version:
+                    _cache.move_to_end(key)
+                    return entry[1]
+            index = read_bm25(index_dir, index_name)
+            break
+        except FileNotFoundError:
+            # Segments merged into the base between listing and reading them
+            if attempt == 2:
+                raise
+    if index is None:
+        return None
+    log.info(
+        "BM25 index loaded",
+        index_dir=str(index_dir),
+        files=len(version),
+        rows=len(index),
+        terms=index.n_terms,
+    )
+    with _cache_lock:
+        _cache[key] = (version, index)
+        _cache.move_to_end(key)
+        while len(_cache) > _MAX_CACHED:
+            _cache.popitem(last=False)
+    return index
+
+
+if __name__ == "__main__":
+    # Lexical latency on a synthetic corpus:
+    #   python -m utils.bm25_index [n_chunks]
+    import sys
+    import tempfile
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(7)
+    words = [f"w{i}" for i in range(50_000)]
+    # Zipf-like word frequencies, ~150 tokens per chunk, plus clause codes
+    probs = 1.0 / np.arange(1, len(words) + 1)
+    probs /= probs.sum()
+    picks = rng.choice(len(words), size=(n, 150), p=probs)
+    chunks = [
+        " ".join(words[j] for j in row) + f" clause {i % 997}.{i % 13}"
+        for i, row in enumerate(picks)
+    ]
+
+    started = time.perf_counter()
+    bm = BM25Index()
+    bm.add(chunks)
+    print(f"build: {n} chunks, {bm.n_terms} terms, {time.perf_counter() - started:.2f}s")
+
+    path = Path(tempfile.mkdtemp()) / "index.bm25.npz"
+    bm.save(path)
+    started = time.perf_counter()
+    BM25Index.load(path)
+    print(
+        f"load: {(time.perf_counter() - started) * 1000:.1f} ms, "
+        f"{path.stat().st_size / 1e6:.1f} MB on disk"
+    )
+
+    queries = [f"{words[rng.integers(0, 5000)]} clause {i % 997}.{i % 13}" for i in range(200)]
+    started = time.perf_counter()
+    for q in queries:
+        bm.search(q, k=20)
+    print(f"search: {(time.perf_counter() - started) * 1000 / len(queries):.2f} ms/query")
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from utils.model_loader import get_model_registry
+
+T = TypeVar("T")
+
+# io:     disk reads/writes, FAISS load/save, sync SDK calls
+# cpu:    PDF text extraction, FAISS search
+# ingest: whole ingestion runs, kept separate so they can't starve queries
+_DEFAULT_WORKERS = {
+    "io": 32,
+    "cpu": os.cpu_count() or 4,
+    "ingest": 2,
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    """Bounded, named executor; sizes come from the concurrency section of config."""
+    executor = _executors.get(kind)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                cfg = get_model_registry().config.get("concurrency", {}) or {}
+                workers = cfg.get(f"{kind}_workers") or _DEFAULT_WORKERS[kind]
+                executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix=f"dp-{kind}"
+                )
+                _executors[kind] = executor
+    return executor
+
+
+async def run_blocking(kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking call on the named bounded executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(kind), functools.partial(fn, *args, **kwargs)
+    )
+
+
+def shutdown_executors(wait: bool = False):
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        _executors.clear()
+
+
+if __name__ == "__main__":
+    # Concurrency benchmark against a running API:
+    #   python -m utils.concurrency http://localhost:8000 <session_id> "question"
+    # Prints throughput per client count; on a non-blocking server req/s
+    # should grow with clients instead of staying flat.
+    import sys
+    import time
+
+    import httpx
+
+    base_url, session_id = sys.argv[1], sys.argv[2]
+    question = sys.argv[3] if len(sys.argv) > 3 else "What is this document about?"
+    requests_per_client = 5
+
+    async def client(http: httpx.AsyncClient) -> int:
+        ok = 0
+        for _ in range(requests_per_client):
+            r = await http.post(
+                f"{base_url}/chat/query",
+                data={"question": question, "session_id": session_id},
+            )
+            ok += r.status_code == 200
+        return ok
+
+    async def bench(clients: int) -> Optional[float]:
+        async with httpx.AsyncClient(timeout=300) as http:
+            started = time.perf_counter()
+            done = await asyncio.gather(*(client(http) for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+        ok = sum(done)
+        print(f"clients={clients:3d} ok={ok:4d} elapsed={elapsed:7.2f}s rps={ok / elapsed:6.2f}")
+        return ok / elapsed
+
+    for n in (1, 2, 4, 8, 16):
+        asyncio.run(bench(n))
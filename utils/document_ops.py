@@ -1,51 +1,186 @@
 from __future__ import annotations
 
-# import os
+import os
+
 # import sys
 # import json
 # import uuid
 # import hashlib
 # import shutil
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
 # from datetime import datetime, timezone
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-# import fitz  # PyMuPDF
+import fitz  # PyMuPDF
 from langchain.schema import Document
 
 # from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
 
 # from langchain_community.vectorstores import FAISS
 
 # from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
+from utils.metrics import timed
 
 log = CustomLogger().get_logger(__name__)
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
-SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+# PDF document-info keys carried into page metadata, as PyPDFLoader does
+_PDF_META_KEYS = {
+    "producer": "producer",
+    "creator": "creator",
+    "creationDate": "creationdate",
+    "modDate": "moddate",
+    "title": "title",
+    "author": "author",
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# ----------------------------- #
+# Worker functions (picklable)  #
+# ----------------------------- #
+def _parse_pdf_pages(path: str, start: int, end: int) -> List[Tuple[int, Document]]:
+    """Extract pages [start, end) of a PDF with PyMuPDF, one Document per page."""
+    out: List[Tuple[int, Document]] = []
+    with fitz.open(path) as doc:
+        base_md: Dict[str, Any] = {
+            dst: doc.metadata[src]
+            for src, dst in _PDF_META_KEYS.items()
+            if doc.metadata and doc.metadata.get(src)
+        }
+        for i in range(start, min(end, doc.page_count)):
+            page = doc.load_page(i)
+            md = dict(base_md)
+            md.update(
+                {
+                    "source": path,
+                    "total_pages": doc.page_count,
+                    "page": i,
+                    "page_label": page.get_label() or str(i + 1),
+                }
+            )
+            out.append((i, Document(page_content=page.get_text(), metadata=md)))  # type: ignore
+    return out
+
+
+def _parse_whole_file(path: str) -> List[Tuple[int, Document]]:
+    ext = Path(path).suffix.lower()
+    if ext == ".docx":
+        loader = Docx2txtLoader(path)
+    else:
+        loader = TextLoader(path, encoding="utf-8")
+    return list(enumerate(loader.load()))
+
+
+# ----------------------------- #
+# Engine                        #
+# ----------------------------- #
+def _parsing_config() -> Dict[str, Any]:
+    from utils.model_loader import get_model_registry
+
+    return get_model_registry().config.get("parsing", {}) or {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Shared process pool; spawn keeps workers clear of the parent's threads/locks."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = _parsing_config().get("max_workers") or os.cpu_count() or 1
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died, so the next _get_pool() starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _plan_tasks(paths: List[Path], pages_per_task: int) -> List[Tuple[int, str, Tuple]]:
+    """(file index, kind, args) work items: page ranges for PDFs, whole files otherwise."""
+    tasks: List[Tuple[int, str, Tuple]] = []
+    for idx, p in enumerate(paths):
+        ext = p.suffix.lower()
+        if ext == ".pdf":
+            with fitz.open(str(p)) as doc:
+                count = doc.page_count
+            for start in range(0, count, pages_per_task):
+                tasks.append((idx, "pdf", (str(p), start, start + pages_per_task)))
+        elif ext in (".docx", ".txt"):
+            tasks.append((idx, "file", (str(p),)))
+        else:
+            log.warning("Unsupported extension skipped", path=str(p))
+    return tasks
+
+
+def iter_documents(paths: Iterable[Path]) -> Iterator[Tuple[int, int, Document]]:
+    """
+    Parse files in parallel and yield (file index, page, Document) as each
+    work item completes. Large PDFs are split into page ranges so a single
+    big file also spreads over the process pool; small jobs run inline.
+    """
+    cfg = _parsing_config()
+    pages_per_task = int(cfg.get("pages_per_task", 16))
+    inline_threshold = int(cfg.get("inline_task_threshold", 1))
+    tasks = _plan_tasks(list(paths), pages_per_task)
+
+    if len(tasks) <= inline_threshold:
+        for idx, kind, args in tasks:
+            fn = _parse_pdf_pages if kind == "pdf" else _parse_whole_file
+            for page, doc in fn(*args):
+                yield idx, page, doc
+        return
+
+    # A crashed worker breaks the whole pool: replace it and retry the unfinished items once
+    pending = list(range(len(tasks)))
+    for attempt in range(2):
+        pool = _get_pool()
+        futures: Dict[Future, int] = {}
+        try:
+            for t in pending:
+                idx, kind, args = tasks[t]
+                fn = _parse_pdf_pages if kind == "pdf" else _parse_whole_file
+                futures[pool.submit(fn, *args)] = t
+            for fut in as_completed(futures):
+                results = fut.result()
+                pending.remove(futures[fut])
+                for page, doc in results:
+                    yield tasks[futures[fut]][0], page, doc
+            return
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            if attempt:
+                raise
+            log.warning("Parsing pool broke; retrying on a new pool", unfinished=len(pending))
 
 
+@timed("load_documents")
 def load_documents(paths: Iterable[Path]) -> List[Document]:
-    """Load docs using appropriate loader based on extension."""
-    docs: List[Document] = []
+    """Load docs using the parallel parsing engine, in file then page order."""
     try:
-        for p in paths:
-            ext = p.suffix.lower()
-            if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
-            elif ext == ".docx":
-                loader = Docx2txtLoader(str(p))
-            elif ext == ".txt":
-                loader = TextLoader(str(p), encoding="utf-8")
-            else:
-                log.warning("Unsupported extension skipped", path=str(p))
-                continue
-            docs.extend(loader.load())
-        log.info("Documents loaded", count=len(docs))
+        paths = list(paths)
+        results = sorted(iter_documents(paths), key=lambda r: (r[0], r[1]))
+        docs = [doc for _, _, doc in results]
+        log.info("Documents loaded", count=len(docs), files=len(paths))
         return docs
     except Exception as e:
         log.error("Failed loading documents", error=str(e))
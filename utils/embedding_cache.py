@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+INITIAL_CAPACITY = 1024
+_TAG_BYTES = 32  # sha256 digest of the key stored with each row
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    """Content address of one embedding: sha256(model name + text)."""
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _tag(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    On-disk vector store for cached embeddings.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32); a SQLite
+    index maps each content key to its row ("slot") and last access time.
+    When max_entries is reached the least recently used rows are evicted
+    and their slots reused. Safe to share between threads and processes:
+    each row's key digest is kept in keys.bin and checked around the read,
+    so a slot recycled by another process mid-lookup is a miss rather than
+    another text's vector. Access times are buffered and written at most
+    every touch_interval seconds.
+    After close() lookups miss and writes are skipped, so holders of a
+    closed store fall through to the underlying model.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int = 200_000, touch_interval: float = 30.0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.matrix_path = self.path / "vectors.f32"
+        self.tags_path = self.path / "keys.bin"
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            str(self.path / "index.sqlite"), timeout=30, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_vectors_access ON vectors(last_access);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+            """
+        )
+        if not self.tags_path.exists():
+            # Rows written without key digests can't be verified: start over
+            self._db.execute("DELETE FROM vectors")
+            self._db.execute("DELETE FROM meta WHERE name = 'next_slot'")
+            self.tags_path.touch()
+        self._db.commit()
+        self._mm: Optional[np.memmap] = None
+        self._tags: Optional[np.memmap] = None
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_touches()
+            self._closed = True
+            for mm in (self._mm, self._tags):
+                if mm is not None:
+                    mm.flush()
+            self._mm = self._tags = None
+            self._db.close()
+
+    # ---------- Matrix ----------
+
+    def _meta(self, name: str) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else int(row[0])
+
+    def _matrix(self, min_rows: int = 0) -> Optional[np.memmap]:
+        """Map the vector and key-digest files, growing them (doubling) to hold min_rows rows."""
+        dim = self._meta("dim")
+        if dim is None:
+            return None
+        rows = self.matrix_path.stat().st_size // (4 * dim) if self.matrix_path.exists() else 0
+        if rows < min_rows:
+            new_rows = max(INITIAL_CAPACITY, rows)
+            while new_rows < min_rows:
+                new_rows *= 2
+            new_rows = min(max(new_rows, min_rows), max(self.max_entries, min_rows))
+            with open(self.tags_path, "ab") as f:
+                f.truncate(new_rows * _TAG_BYTES)
+            with open(self.matrix_path, "ab") as f:
+                f.truncate(new_rows * dim * 4)
+            rows = new_rows
+        if self._mm is None or self._mm.shape[0] != rows:
+            for mm in (self._mm, self._tags):
+                if mm is not None:
+                    mm.flush()
+            if self.tags_path.stat().st_size < rows * _TAG_BYTES:
+                with open(self.tags_path, "ab") as f:
+                    f.truncate(rows * _TAG_BYTES)
+            self._mm = (
+                np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(rows, dim))
+                if rows
+                else None
+            )
+            self._tags = (
+                np.memmap(self.tags_path, dtype=np.uint8, mode="r+", shape=(rows, _TAG_BYTES))
+                if rows
+                else None
+            )
+        return self._mm
+
+    def _slots(self, keys: Sequence[str]) -> Dict[str, int]:
+        found: Dict[str, int] = {}
+        for i in range(0, len(keys), 500):
+            batch = list(keys[i : i + 500])
+            marks = ",".join("?" * len(batch))
+            for key, slot in self._db.execute(
+                f"SELECT key, slot FROM vectors WHERE key IN ({marks})", batch
+            ):
+                found[key] = slot
+        return found
+
+    def _flush_touches(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE vectors SET last_access = ? WHERE key = ?",
+                [(t, k) for k, t in self._touched.items()],
+            )
+            self._db.commit()
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    # ---------- Public API ----------
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        with self._lock:
+            if self._closed:
+                return {}
+            found = self._slots(keys)
+            if not found:
+                return {}
+            mm = self._matrix(max(found.values()) + 1)
+            if mm is None:
+                return {}
+            tags = self._tags
+            out: Dict[str, List[float]] = {}
+            for k, slot in found.items():
+                # Digest checked before and after the copy: a writer clears it
+                # before overwriting a recycled slot and sets it afterwards
+                digest = np.frombuffer(_tag(k), dtype=np.uint8)
+                if not np.array_equal(tags[slot], digest):
+                    continue
+                vector = mm[slot].tolist()
+                if np.array_equal(tags[slot], digest):
+                    out[k] = vector
+            now = time.time()
+            self._touched.update((k, now) for k in out)
+            if time.monotonic() - self._last_flush >= self.touch_interval:
+                self._flush_touches()
+            return out
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            dim = len(next(iter(items.values())))
+            # Pending access times first, so eviction sees this process's recent hits
+            self._flush_touches()
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                stored_dim = self._meta("dim")
+                if stored_dim is None:
+                    self._db.execute("INSERT INTO meta(name, value) VALUES ('dim', ?)", (dim,))
+                elif stored_dim != dim:
+                    raise ValueError(
+                        f"Embedding dimension {dim} does not match cache dimension {stored_dim}"
+                    )
+
+                existing = self._slots(list(items))
+                new_keys = [k for k in items if k not in existing][: self.max_entries]
+                if not new_keys:
+                    self._db.commit()
+                    return
+
+                count = self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+                free_slots: List[int] = []
+                overflow = count + len(new_keys) - self.max_entries
+                if overflow > 0:
+                    # Evict least recently used rows and recycle their slots
+                    victims = self._db.execute(
+                        "SELECT key, slot FROM vectors ORDER BY last_access LIMIT ?",
+                        (overflow,),
+                    ).fetchall()
+                    self._db.executemany(
+                        "DELETE FROM vectors WHERE key = ?", [(k,) for k, _ in victims]
+                    )
+                    free_slots = [s for _, s in victims]
+                    log.info("Embedding cache evicted entries", evicted=len(victims))
+
+                next_slot = self._meta("next_slot") or 0
+                slots: List[int] = []
+                for _ in new_keys:
+                    if free_slots:
+                        slots.append(free_slots.pop())
+                    else:
+                        slots.append(next_slot)
+                        next_slot += 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta(name, value) VALUES ('next_slot', ?)",
+                    (next_slot,),
+                )
+
+                mm = self._matrix(max(slots) + 1)
+                assert mm is not None and self._tags is not None
+                rows = np.asarray(slots)
+                self._tags[rows] = 0
+                self._tags.flush()
+                mm[rows] = np.asarray([items[k] for k in new_keys], dtype=np.float32)
+                mm.flush()
+                self._tags[rows] = np.frombuffer(
+                    b"".join(_tag(k) for k in new_keys), dtype=np.uint8
+                ).reshape(len(new_keys), _TAG_BYTES)
+                self._tags.flush()
+
+                now = time.time()
+                self._db.executemany(
+                    "INSERT INTO vectors(key, slot, last_access) VALUES (?, ?, ?)",
+                    [(k, s, now) for k, s in zip(new_keys, slots)],
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._closed:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from an EmbeddingStore and
+    only sends cache misses to the underlying model. Used for both document
+    chunks and queries.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, store: EmbeddingStore):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, texts: List[str]):
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        cached = self.store.get_many(list(dict.fromkeys(keys)))
+        # Unique missing texts, in first-seen order
+        missing: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in cached and k not in missing:
+                missing[k] = t
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+        return keys, cached, missing
+
+    def _assemble(self, keys, cached, missing, vectors) -> List[List[float]]:
+        # Round through float32 so fresh and cached results are identical
+        fresh = {
+            k: np.asarray(v, dtype=np.float32).tolist()
+            for k, v in zip(missing.keys(), vectors)
+        }
+        if fresh:
+            try:
+                self.store.put_many(fresh)
+            except Exception as e:
+                log.warning("Failed to persist embeddings to cache", error=str(e))
+        cached.update(fresh)
+        return [cached[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        vectors = self.underlying.embed_documents(list(missing.values())) if missing else []
+        log.info("Embedding cache lookup", texts=len(texts), embedded=len(missing))
+        return self._assemble(keys, cached, missing, vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        from utils.concurrency import run_blocking  # imports the model registry
+
+        # Store reads/writes hit SQLite and the memmap: keep them off the event loop
+        keys, cached, missing = await run_blocking("io", self._lookup, texts)
+        vectors = (
+            await self.underlying.aembed_documents(list(missing.values())) if missing else []
+        )
+        log.info("Embedding cache lookup", texts=len(texts), embedded=len(missing))
+        return await run_blocking("io", self._assemble, keys, cached, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, cached, missing = self._lookup([text])
+        vectors = [self.underlying.embed_query(text)] if missing else []
+        return self._assemble(keys, cached, missing, vectors)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        from utils.concurrency import run_blocking
+
+        # Queries go through the pooled sync client in a thread, which keeps
+        # the underlying async client bound to the ingestion event loop only.
+        return await run_blocking("io", self.embed_query, text)
+
+
+def store_dir_for(base: str | Path, model_name: str) -> Path:
+    """One store per model, since vector dimensions differ between models."""
+    return Path(base) / re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
@@ -0,0 +1,755 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from logger.custom_logger import CustomLogger
+from utils.index_factory import IndexSettings, all_vectors, migrate_index
+from utils.metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: in-process locking only
+    fcntl = None  # type: ignore[assignment]
+
+log = CustomLogger().get_logger(__name__)
+
+STORE_FORMAT = "faiss+sqlite/1"
+
+_READ_ONLY = getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+
+
+def mmap_flags(index_class: str) -> int:
+    """
+    Read-only mmap flags for an index class: IVF maps its inverted lists
+    (IO_FLAG_MMAP); Flat / HNSW map their flat codes zero-copy
+    (IO_FLAG_MMAP_IFC, faiss >= 1.8). The two cannot be combined.
+    """
+    if "IVF" in index_class:
+        return getattr(faiss, "IO_FLAG_MMAP", 0) | _READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | _READ_ONLY
+
+
+# ----------------------------- #
+# Layout                        #
+# ----------------------------- #
+def index_path(index_dir: Union[str, Path], index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.faiss"
+
+
+def segment_path(index_dir: Union[str, Path], seq: int, index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.seg{seq:06d}.faiss"
+
+
+def manifest_path(index_dir: Union[str, Path], index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.json"
+
+
+def docstore_path(index_dir: Union[str, Path], index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.docs.sqlite"
+
+
+def legacy_pickle_path(index_dir: Union[str, Path], index_name: str = "index") -> Path:
+    return Path(index_dir) / f"{index_name}.pkl"
+
+
+def is_legacy(index_dir: Union[str, Path], index_name: str = "index") -> bool:
+    return (
+        not manifest_path(index_dir, index_name).exists()
+        and legacy_pickle_path(index_dir, index_name).exists()
+    )
+
+
+def store_exists(index_dir: Union[str, Path], index_name: str = "index") -> bool:
+    if is_legacy(index_dir, index_name):
+        return index_path(index_dir, index_name).exists()
+    # The manifest is written last, so it only exists once the index files do
+    return manifest_path(index_dir, index_name).exists()
+
+
+def read_manifest(index_dir: Union[str, Path], index_name: str = "index") -> Optional[Dict[str, Any]]:
+    """
+    The store manifest with the segment fields filled in for stores saved
+    before segments existed; None when there is no manifest.
+    """
+    try:
+        manifest = json.loads(manifest_path(index_dir, index_name).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    manifest.setdefault("base", index_path(index_dir, index_name).name)
+    manifest.setdefault("segments", [])
+    manifest.setdefault("generation", 0)
+    manifest.setdefault("next_segment", 0)
+    return manifest
+
+
+def _write_manifest(index_dir: Union[str, Path], index_name: str, manifest: Dict[str, Any]) -> None:
+    manifest = {**manifest, "format": STORE_FORMAT, "saved_at": time.time()}
+    _write_atomic(
+        manifest_path(index_dir, index_name),
+        lambda p: Path(p).write_text(json.dumps(manifest, indent=2), encoding="utf-8"),
+    )
+
+
+def _data_files(index_dir: Union[str, Path], manifest: Dict[str, Any]) -> List[Path]:
+    """The base index file followed by the segment files, in position order."""
+    index_dir = Path(index_dir)
+    return [index_dir / manifest["base"]] + [index_dir / s["file"] for s in manifest["segments"]]
+
+
+def store_files(index_dir: Union[str, Path], index_name: str = "index") -> Tuple[Path, ...]:
+    """
+    Files whose (mtime, size) change on every save: the manifest (rewritten
+    by every save, append and compaction) plus the index files it lists, or
+    the FAISS index and pickle for legacy directories. The SQLite docstore
+    is left out because WAL writes do not reliably touch the main file.
+    """
+    if is_legacy(index_dir, index_name):
+        return (index_path(index_dir, index_name), legacy_pickle_path(index_dir, index_name))
+    manifest = read_manifest(index_dir, index_name)
+    if manifest is None:
+        return (index_path(index_dir, index_name), manifest_path(index_dir, index_name))
+    files = [p for p in _data_files(index_dir, manifest) if p.exists()]
+    return (manifest_path(index_dir, index_name), *files)
+
+
+# ----------------------------- #
+# Segments                      #
+# ----------------------------- #
+@dataclass
+class SegmentSettings:
+    """
+    Append-only segments, from faiss_db.segments in config. Each ingest
+    after the first writes its vectors to a small flat segment file instead
+    of rewriting the whole index; queries search base + segments together.
+    A background compaction folds the segments into the base once there
+    are max_segments of them or they hold compact_ratio of the base's size.
+    """
+
+    enabled: bool = True
+    max_segments: int = 8
+    compact_ratio: float = 0.25
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "SegmentSettings":
+        cfg = (config.get("faiss_db", {}) or {}).get("segments", {}) or {}
+        return cls(
+            enabled=bool(cfg.get("enabled", True)),
+            max_segments=int(cfg.get("max_segments", 8)),
+            compact_ratio=float(cfg.get("compact_ratio", 0.25)),
+        )
+
+    def needs_compaction(self, manifest: Optional[Dict[str, Any]]) -> bool:
+        if not manifest or not manifest["segments"]:
+            return False
+        in_segments = sum(s["ntotal"] for s in manifest["segments"])
+        base = manifest["ntotal"] - in_segments
+        return (
+            len(manifest["segments"]) >= self.max_segments
+            or in_segments >= self.compact_ratio * base
+        )
+
+
+class _StoreLock:
+    """
+    Writer lock for one store: re-entrant within a process (threads) and
+    exclusive across processes through flock on {name}.lock.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except Exception:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+_store_locks: Dict[str, _StoreLock] = {}
+_store_locks_guard = threading.Lock()
+
+
+@contextmanager
+def store_lock(index_dir: Union[str, Path], index_name: str = "index"):
+    """Serialize writers (save, append, compaction) of one store."""
+    path = Path(index_dir) / f"{index_name}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = str(path.resolve())
+    with _store_locks_guard:
+        lock = _store_locks.setdefault(key, _StoreLock(path))
+    with lock:
+        yield
+
+
+# ----------------------------- #
+# SQLite docstore               #
+# ----------------------------- #
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    Chunk text + metadata in SQLite, fetched by id only for search hits.
+    The same file holds the FAISS position -> docstore id map (see
+    SqliteIndexMap), so nothing has to be unpickled or loaded up front.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS idmap (
+                pos INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key TEXT PRIMARY KEY
+            );
+            """
+        )
+        self.db.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content, metadata FROM docs WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        rows = [
+            (id_, doc.page_content, json.dumps(doc.metadata or {}, ensure_ascii=False, default=str))
+            for id_, doc in texts.items()
+        ]
+        with self.lock:
+            try:
+                self.db.executemany(
+                    "INSERT INTO docs(id, content, metadata) VALUES (?, ?, ?)", rows
+                )
+                self.db.commit()
+            except sqlite3.IntegrityError as e:
+                self.db.rollback()
+                raise ValueError(f"Tried to add ids that already exist: {e}") from e
+
+    def delete(self, ids: List) -> None:
+        with self.lock:
+            self.db.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in ids])
+            self.db.commit()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search_metadata(self, **where: Any) -> Dict[str, Document]:
+        """Documents whose metadata has the given top-level values (full scan; maintenance only)."""
+        clause = " AND ".join(f"json_extract(metadata, '$.{key}') = ?" for key in where)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT id, content, metadata FROM docs WHERE {clause or '1'}", list(where.values())
+            ).fetchall()
+        return {
+            id_: Document(id=id_, page_content=content, metadata=json.loads(md))
+            for id_, content, md in rows
+        }
+
+    def index_map(self) -> "SqliteIndexMap":
+        return SqliteIndexMap(self)
+
+    # Chunk fingerprints already indexed, for ingest-time dedupe
+
+    def known_fingerprints(self, keys: Iterable[str]) -> Set[str]:
+        keys = list(keys)
+        known: Set[str] = set()
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                known.update(
+                    row[0]
+                    for row in self.db.execute(
+                        f"SELECT key FROM fingerprints WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    )
+                )
+        return known
+
+    def add_fingerprints(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO fingerprints(key) VALUES (?)", [(k,) for k in keys]
+            )
+            self.db.commit()
+
+    def forget_fingerprints(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            self.db.executemany("DELETE FROM fingerprints WHERE key = ?", [(k,) for k in keys])
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SqliteIndexMap(MutableMapping):
+    """Lazy FAISS position -> docstore id mapping backed by the docstore's idmap table."""
+
+    def __init__(self, store: SqliteDocstore):
+        self.store = store
+
+    def __getitem__(self, pos: int) -> str:
+        with self.store.lock:
+            row = self.store.db.execute(
+                "SELECT doc_id FROM idmap WHERE pos = ?", (int(pos),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(pos)
+        return row[0]
+
+    def __setitem__(self, pos: int, doc_id: str):
+        self.update({pos: doc_id})
+
+    def __delitem__(self, pos: int):
+        with self.store.lock:
+            cur = self.store.db.execute("DELETE FROM idmap WHERE pos = ?", (int(pos),))
+            self.store.db.commit()
+        if cur.rowcount == 0:
+            raise KeyError(pos)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([pos for pos, _ in self.items()])
+
+    def __len__(self) -> int:
+        with self.store.lock:
+            return self.store.db.execute("SELECT COUNT(*) FROM idmap").fetchone()[0]
+
+    def items(self) -> List[Tuple[int, str]]:  # type: ignore[override]
+        with self.store.lock:
+            return self.store.db.execute("SELECT pos, doc_id FROM idmap ORDER BY pos").fetchall()
+
+    def values(self) -> List[str]:  # type: ignore[override]
+        return [doc_id for _, doc_id in self.items()]
+
+    def update(self, other=(), **kwargs):  # type: ignore[override]
+        pairs = dict(other, **kwargs)
+        with self.store.lock:
+            self.store.db.executemany(
+                "INSERT OR REPLACE INTO idmap(pos, doc_id) VALUES (?, ?)",
+                [(int(p), d) for p, d in pairs.items()],
+            )
+            self.store.db.commit()
+
+    def replace_all(self, mapping: Dict[int, str]):
+        with self.store.lock:
+            self.store.db.execute("DELETE FROM idmap")
+            self.store.db.executemany(
+                "INSERT INTO idmap(pos, doc_id) VALUES (?, ?)",
+                [(int(p), d) for p, d in mapping.items()],
+            )
+            self.store.db.commit()
+
+    def truncate(self, size: int):
+        """Drop positions >= size, e.g. rows written before a save that never completed."""
+        with self.store.lock:
+            self.store.db.execute("DELETE FROM idmap WHERE pos >= ?", (size,))
+            self.store.db.commit()
+
+
+# ----------------------------- #
+# Save / load                   #
+# ----------------------------- #
+def new_store(
+    embeddings: Any, index: faiss.Index, index_dir: Union[str, Path], index_name: str = "index"
+) -> FAISS:
+    """Empty vectorstore whose docstore writes straight into index_dir."""
+    path = docstore_path(index_dir, index_name)
+    if not manifest_path(index_dir, index_name).exists():
+        # Leftovers from an ingest that never saved
+        for leftover in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+            leftover.unlink(missing_ok=True)
+    docstore = SqliteDocstore(path)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=docstore.index_map(),
+    )
+
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    write(str(tmp))
+    os.replace(tmp, path)
+
+
+def _base_name(index_name: str, generation: int) -> str:
+    # Generation 0 keeps the pre-segment file name
+    return f"{index_name}.faiss" if generation == 0 else f"{index_name}.g{generation:06d}.faiss"
+
+
+def _remove_unlisted(index_dir: Path, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> None:
+    """Delete index files the old manifest listed and the new one does not."""
+    if old is None:
+        return
+    keep = set(_data_files(index_dir, new))
+    for path in _data_files(index_dir, old):
+        if path not in keep:
+            path.unlink(missing_ok=True)
+
+
+@timed("faiss_save")
+def save_store(vs: FAISS, index_dir: Union[str, Path], index_name: str = "index") -> None:
+    """
+    Persist a vectorstore in the faiss+sqlite layout: a base index file,
+    {name}.docs.sqlite and a {name}.json manifest written last. Every save
+    writes a new base file (no segments) and only then drops the files of
+    the previous version, so readers holding an mmap of it are unaffected.
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with store_lock(index_dir, index_name):
+        _save_store(vs, index_dir, index_name)
+
+
+def _save_store(vs: FAISS, index_dir: Path, index_name: str) -> None:
+    target = docstore_path(index_dir, index_name)
+
+    docstore = vs.docstore
+    if not (isinstance(docstore, SqliteDocstore) and docstore.path.resolve() == target.resolve()):
+        # e.g. an in-memory docstore: copy every indexed document across
+        items = list(vs.index_to_docstore_id.items())
+        fresh = SqliteDocstore(target)
+        with fresh.lock:
+            fresh.db.execute("DELETE FROM docs")
+            fresh.db.commit()
+        docs: Dict[str, Document] = {}
+        for _, doc_id in items:
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs[doc_id] = doc
+        fresh.add(docs)
+        index_map = fresh.index_map()
+        index_map.replace_all(dict(items))
+        vs.docstore = fresh
+        vs.index_to_docstore_id = index_map
+    elif not isinstance(vs.index_to_docstore_id, SqliteIndexMap):
+        # FAISS.delete() swaps the map for a plain dict
+        index_map = docstore.index_map()
+        index_map.replace_all(dict(vs.index_to_docstore_id))
+        vs.index_to_docstore_id = index_map
+
+    index = vs.index
+    if isinstance(index, faiss.IndexShards):
+        raise ValueError("Segmented indexes are read-only; load the store with mmap=False to save it")
+    old = read_manifest(index_dir, index_name)
+    generation = old["generation"] + 1 if old else 0
+    base = _base_name(index_name, generation)
+    _write_atomic(index_dir / base, lambda p: faiss.write_index(index, p))
+    manifest = {
+        "ntotal": int(index.ntotal),
+        "dim": int(index.d),
+        "index_class": type(index).__name__,
+        "base": base,
+        "segments": [],
+        "generation": generation,
+        "next_segment": old["next_segment"] if old else 0,
+    }
+    _write_manifest(index_dir, index_name, manifest)
+    _remove_unlisted(index_dir, old, manifest)
+
+
+@timed("faiss_append")
+def append_segment(
+    index_dir: Union[str, Path],
+    texts: List[str],
+    metadatas: List[Dict[str, Any]],
+    vectors: np.ndarray,
+    index_name: str = "index",
+) -> int:
+    """
+    Add chunks to an existing store without touching its index files: the
+    documents go to the docstore and the vectors to a new flat segment
+    file, then the manifest is rewritten to list it. Cost is proportional
+    to the new chunks only. Returns the FAISS position of the first chunk.
+    """
+    index_dir = Path(index_dir)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    with store_lock(index_dir, index_name):
+        manifest = read_manifest(index_dir, index_name)
+        if manifest is None:
+            raise FileNotFoundError(f"No FAISS store '{index_name}' in {index_dir}")
+        start = int(manifest["ntotal"])
+
+        docstore = SqliteDocstore(docstore_path(index_dir, index_name))
+        try:
+            ids = [str(uuid.uuid4()) for _ in texts]
+            docstore.add(
+                {
+                    id_: Document(id=id_, page_content=text, metadata=md or {})
+                    for id_, text, md in zip(ids, texts, metadatas)
+                }
+            )
+            index_map = docstore.index_map()
+            index_map.truncate(start)  # rows of an append that never reached the manifest
+            index_map.update({start + i: id_ for i, id_ in enumerate(ids)})
+        finally:
+            docstore.close()
+
+        segment = faiss.IndexFlatL2(vectors.shape[1])
+        segment.add(vectors)
+        seq = int(manifest["next_segment"])
+        path = segment_path(index_dir, seq, index_name)
+        _write_atomic(path, lambda p: faiss.write_index(segment, p))
+        manifest["segments"].append(
+            {"file": path.name, "start": start, "ntotal": len(vectors)}
+        )
+        manifest["ntotal"] = start + len(vectors)
+        manifest["next_segment"] = seq + 1
+        _write_manifest(index_dir, index_name, manifest)
+    return start
+
+
+@timed("faiss_compact")
+def compact_store(
+    index_dir: Union[str, Path],
+    settings: Optional[IndexSettings] = None,
+    index_name: str = "index",
+) -> bool:
+    """
+    Fold the current segments into a new base index (upgrading the index
+    type when the auto policy calls for it). The merge runs without the
+    writer lock, so appends carry on meanwhile; segments added during the
+    merge stay listed. Returns False when there was nothing to compact or
+    the store changed underneath (e.g. a concurrent compaction).
+    """
+    index_dir = Path(index_dir)
+    settings = settings or IndexSettings()
+    with store_lock(index_dir, index_name):
+        manifest = read_manifest(index_dir, index_name)
+        if manifest is None or not manifest["segments"]:
+            return False
+        files = _data_files(index_dir, manifest)
+        segments = list(manifest["segments"])
+        vectors = np.vstack([all_vectors(faiss.read_index(str(p))) for p in files[1:]])
+        # Pin the base file with a hard link so it can be read after the
+        # lock is released, even if it is replaced meanwhile
+        pinned: Optional[Path] = files[0].with_name(f"{files[0].name}.compact-{os.getpid()}")
+        try:
+            os.link(files[0], pinned)
+        except OSError:
+            pinned, base = None, faiss.read_index(str(files[0]))
+
+    started = time.perf_counter()
+    if pinned is not None:
+        try:
+            base = faiss.read_index(str(pinned))
+        finally:
+            pinned.unlink(missing_ok=True)
+    index = migrate_index(base, vectors, settings) or base
+    index.add(vectors)
+    generation = manifest["generation"] + 1
+    new_base = index_dir / _base_name(index_name, generation)
+    _write_atomic(new_base, lambda p: faiss.write_index(index, p))
+
+    with store_lock(index_dir, index_name):
+        current = read_manifest(index_dir, index_name)
+        if (
+            current is None
+            or current["base"] != manifest["base"]
+            or current["segments"][: len(segments)] != segments
+        ):
+            new_base.unlink(missing_ok=True)
+            return False
+        compacted = {
+            **current,
+            "base": new_base.name,
+            "index_class": type(index).__name__,
+            "segments": current["segments"][len(segments) :],
+            "generation": generation,
+        }
+        _write_manifest(index_dir, index_name, compacted)
+        _remove_unlisted(index_dir, current, compacted)
+    log.info(
+        "FAISS segments compacted",
+        index_dir=str(index_dir),
+        segments=len(segments),
+        vectors=int(index.ntotal),
+        index_class=type(index).__name__,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return True
+
+
+def migrate_legacy(index_dir: Union[str, Path], embeddings: Any, index_name: str = "index") -> None:
+    """Convert a pickle-based save_local() directory to the faiss+sqlite layout."""
+    started = time.perf_counter()
+    vs = FAISS.load_local(
+        str(index_dir),
+        embeddings,
+        index_name=index_name,
+        allow_dangerous_deserialization=True,
+    )
+    save_store(vs, index_dir, index_name)
+    legacy_pickle_path(index_dir, index_name).unlink(missing_ok=True)
+    log.warning(
+        "Legacy pickle index migrated",
+        index_dir=str(index_dir),
+        vectors=int(vs.index.ntotal),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+def _open_index(index_dir: Union[str, Path], index_name: str, mmap: bool) -> faiss.Index:
+    for attempt in range(3):
+        manifest = read_manifest(index_dir, index_name)
+        if manifest is None:
+            raise FileNotFoundError(f"No FAISS store '{index_name}' in {index_dir}")
+        files = _data_files(index_dir, manifest)
+        try:
+            base = faiss.read_index(
+                str(files[0]), mmap_flags(manifest.get("index_class", "")) if mmap else 0
+            )
+            segments = [
+                faiss.read_index(str(p), mmap_flags("IndexFlatL2") if mmap else 0)
+                for p in files[1:]
+            ]
+        except RuntimeError:
+            # A compaction replaced the files between reading the manifest and opening them
+            if attempt < 2 and read_manifest(index_dir, index_name) != manifest:
+                continue
+            raise
+        break
+    if not segments:
+        return base
+    if not mmap:
+        for segment in segments:
+            base.add(all_vectors(segment))
+        return base
+    index = faiss.IndexShards(base.d, False, True)
+    for part in (base, *segments):
+        index.add_shard(part)
+    return index
+
+
+@timed("faiss_load")
+def load_store(
+    index_dir: Union[str, Path],
+    embeddings: Any,
+    index_name: str = "index",
+    mmap: bool = True,
+    allow_legacy_pickle: bool = False,
+) -> FAISS:
+    """
+    Open a saved vectorstore. With mmap=True the index is memory-mapped
+    read-only (query path) and a store with segments comes back as one
+    IndexShards over base + segments; use mmap=False to get a single
+    index that can be appended to. Legacy pickle directories are only
+    read (and migrated in place) when allow_legacy_pickle is set.
+    """
+    if is_legacy(index_dir, index_name):
+        if not allow_legacy_pickle:
+            raise ValueError(
+                f"{index_dir} uses the legacy pickle format; set "
+                "faiss_db.allow_legacy_pickle or run `python -m utils.faiss_store migrate <dir>`"
+            )
+        migrate_legacy(index_dir, embeddings, index_name)
+    if not store_exists(index_dir, index_name):
+        raise FileNotFoundError(f"No FAISS store '{index_name}' in {index_dir}")
+
+    index = _open_index(index_dir, index_name, mmap)
+    docstore = SqliteDocstore(docstore_path(index_dir, index_name))
+    index_map = docstore.index_map()
+    if not mmap:
+        index_map.truncate(index.ntotal)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_map,
+    )
+
+
+if __name__ == "__main__":
+    # python -m utils.faiss_store migrate <index_dir> [...]
+    # python -m utils.faiss_store compact <index_dir> [...]
+    # python -m utils.faiss_store bench <index_dir>   (load time + RSS, mmap vs full read)
+    import subprocess
+    import sys
+
+    from utils.model_loader import get_model_registry
+
+    command, dirs = sys.argv[1], sys.argv[2:]
+    if command == "migrate":
+        embeddings = get_model_registry().get_embeddings()
+        for d in dirs:
+            if is_legacy(d):
+                migrate_legacy(d, embeddings)
+                print(f"migrated {d}")
+            else:
+                print(f"skipped {d} (not a legacy pickle index)")
+    elif command == "compact":
+        settings = IndexSettings.from_config(get_model_registry().config)
+        for d in dirs:
+            manifest = read_manifest(d)
+            n = len(manifest["segments"]) if manifest else 0
+            done = compact_store(d, settings)
+            print(f"{'compacted' if done else 'skipped'} {d} ({n} segments)")
+    elif command == "bench":
+        probe = (
+            "import sys, time, faiss, numpy as np\n"
+            "from utils.faiss_store import load_store\n"
+            "rss = lambda: int(open('/proc/self/statm').read().split()[1]) * 4096 / 1e6\n"
+            "r0 = rss(); t = time.perf_counter()\n"
+            "vs = load_store(sys.argv[1], None, mmap=sys.argv[2] == '1')\n"
+            "ms = (time.perf_counter() - t) * 1000; loaded = rss() - r0\n"
+            "q = np.random.rand(1, vs.index.d).astype('float32')\n"
+            "_, ids = vs.index.search(q, 5)\n"
+            "docs = [vs.docstore.search(vs.index_to_docstore_id[i]) for i in ids[0] if i >= 0]\n"
+            "print(f'mmap={sys.argv[2]} load={ms:.1f}ms rss_after_load={loaded:.1f}MB '\n"
+            "      f'rss_after_search={rss() - r0:.1f}MB hits={len(docs)}')\n"
+        )
+        for flag in ("0", "1"):
+            subprocess.run([sys.executable, "-c", probe, dirs[0], flag], check=True)
+    else:
+        raise SystemExit(f"unknown command {command}")
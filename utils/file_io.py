@@ -5,19 +5,24 @@ from __future__ import annotations
 # import json
 import uuid
 
-# import hashlib
+import hashlib
+
 # import shutil
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import List, Iterable
+from typing import List, Iterable, Optional
 
 # from typing import Iterable, List, Optional, Dict, Any
 # from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
-from exception.custom_exception import DocumentPortalException
+from exception.custom_exception import DocumentPortalException, UploadTooLargeError
+from utils.model_loader import get_model_registry
+from utils.metrics import timed
 
 log = CustomLogger().get_logger(__name__)
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+DEFAULT_CHUNK_SIZE = 1024 * 1024
 
 
 # ----------------------------- #
@@ -27,11 +32,111 @@ def _session_id(prefix: str = "session") -> str:
     return f"{prefix}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
 
-def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
-    """Save uploaded files (Streamlit-like) and return local paths."""
+@dataclass
+class SavedFile:
+    path: Path
+    original_name: str
+    sha256: str
+    size: int
+
+
+class UploadBudget:
+    """
+    Per-file and per-request byte limits for one upload request.
+    Limits come from the uploads section of config (MB); None disables a limit.
+    """
+
+    def __init__(
+        self,
+        max_file_bytes: Optional[int] = None,
+        max_request_bytes: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.chunk_size = chunk_size
+        self.used = 0
+
+    @classmethod
+    def from_config(cls) -> "UploadBudget":
+        cfg = get_model_registry().config.get("uploads", {}) or {}
+        mb = 1024 * 1024
+        return cls(
+            max_file_bytes=int(cfg["max_file_mb"] * mb) if cfg.get("max_file_mb") else None,
+            max_request_bytes=(
+                int(cfg["max_request_mb"] * mb) if cfg.get("max_request_mb") else None
+            ),
+            chunk_size=int(cfg.get("chunk_size_kb", 1024) * 1024),
+        )
+
+    def check(self, name: str, file_bytes: int, request_bytes: int):
+        if self.max_file_bytes is not None and file_bytes > self.max_file_bytes:
+            raise UploadTooLargeError(
+                f"File '{name}' exceeds the {self.max_file_bytes} byte limit", None
+            )
+        if self.max_request_bytes is not None and request_bytes > self.max_request_bytes:
+            raise UploadTooLargeError(
+                f"Upload exceeds the {self.max_request_bytes} byte request limit", None
+            )
+
+    def charge(self, name: str, file_bytes: int, nbytes: int):
+        self.used += nbytes
+        self.check(name, file_bytes, self.used)
+
+
+def _iter_chunks(uf, chunk_size: int):
+    """Yield an uploaded file's bytes in fixed-size chunks."""
+    if hasattr(uf, "read"):
+        if hasattr(uf, "seek"):
+            uf.seek(0)
+        while True:
+            chunk = uf.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        buf = memoryview(uf.getbuffer())  # fallback: already in memory
+        for i in range(0, len(buf), chunk_size):
+            yield buf[i : i + chunk_size]
+
+
+def stream_to_file(uf, out: Path, budget: Optional[UploadBudget] = None) -> SavedFile:
+    """
+    Copy an uploaded file to disk chunk by chunk, hashing while writing.
+    Peak memory is one chunk; size limits are checked as bytes arrive and a
+    partially written file is removed when a limit is hit.
+    """
+    budget = budget or UploadBudget()
+    name = getattr(uf, "name", None) or out.name
+    declared = getattr(uf, "size", None)
+    if declared is not None:
+        # Reject early when the size is known before copying
+        budget.check(name, declared, budget.used + declared)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(out, "wb") as f:
+            for chunk in _iter_chunks(uf, budget.chunk_size):
+                size += len(chunk)
+                budget.charge(name, size, len(chunk))
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        out.unlink(missing_ok=True)
+        raise
+    return SavedFile(path=out, original_name=name, sha256=digest.hexdigest(), size=size)
+
+
+@timed("save_uploads")
+def stream_uploaded_files(
+    uploaded_files: Iterable, target_dir: Path, budget: Optional[UploadBudget] = None
+) -> List[SavedFile]:
+    """Save uploaded files via stream_to_file and return path + content hash for each."""
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
-        saved: List[Path] = []
+        budget = budget or UploadBudget.from_config()
+        saved: List[SavedFile] = []
         for uf in uploaded_files:
             name = getattr(uf, "name", "file")
             ext = Path(name).suffix.lower()
@@ -39,15 +144,23 @@ def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path
                 log.warning("Unsupported file skipped", filename=name)
                 continue
             fname = f"{uuid.uuid4().hex[:8]}{ext}"
-            out = target_dir / fname
-            with open(out, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback
-            saved.append(out)
-            log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
+            record = stream_to_file(uf, target_dir / fname, budget)
+            saved.append(record)
+            log.info(
+                "File saved for ingestion",
+                uploaded=name,
+                saved_as=str(record.path),
+                bytes=record.size,
+                sha256=record.sha256,
+            )
         return saved
+    except UploadTooLargeError:
+        raise
     except Exception as e:
         log.error("Failed to save uploaded files", error=str(e), dir=str(target_dir))
         raise DocumentPortalException("Failed to save uploaded files", e) from e
+
+
+def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
+    """Save uploaded files (Streamlit-like) and return local paths."""
+    return [s.path for s in stream_uploaded_files(uploaded_files, target_dir)]
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+FLAT = "flat"
+IVF_FLAT = "ivf_flat"
+HNSW = "hnsw"
+AUTO = "auto"
+
+# Auto policy only ever migrates "upward" along this order
+_RANK = {FLAT: 0, HNSW: 1, IVF_FLAT: 2}
+
+
+@dataclass
+class IndexSettings:
+    """
+    FAISS index selection and tuning, read from the faiss_db config section.
+
+    type: flat | ivf_flat | hnsw | auto. With auto the index is Flat below
+    auto_flat_max vectors, HNSW below auto_hnsw_max and IVF-Flat above.
+    All types use L2 distance, matching LangChain's default flat index.
+    """
+
+    type: str = AUTO
+    auto_flat_max: int = 20_000
+    auto_hnsw_max: int = 500_000
+    ivf_nlist: Optional[int] = None  # default: ~4 * sqrt(n)
+    ivf_nprobe: int = 16
+    ivf_train_size: int = 100_000
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "IndexSettings":
+        cfg = config.get("faiss_db", {}) or {}
+        ivf = cfg.get("ivf", {}) or {}
+        hnsw = cfg.get("hnsw", {}) or {}
+        return cls(
+            type=str(cfg.get("index_type", AUTO)).lower(),
+            auto_flat_max=cfg.get("auto_flat_max", 20_000),
+            auto_hnsw_max=cfg.get("auto_hnsw_max", 500_000),
+            ivf_nlist=ivf.get("nlist"),
+            ivf_nprobe=ivf.get("nprobe", 16),
+            ivf_train_size=ivf.get("train_size", 100_000),
+            hnsw_m=hnsw.get("m", 32),
+            hnsw_ef_construction=hnsw.get("ef_construction", 200),
+            hnsw_ef_search=hnsw.get("ef_search", 64),
+        )
+
+    def resolve_type(self, n_vectors: int) -> str:
+        if self.type != AUTO:
+            if self.type not in _RANK:
+                raise ValueError(f"Unknown faiss_db.index_type '{self.type}'")
+            return self.type
+        if n_vectors < self.auto_flat_max:
+            return FLAT
+        if n_vectors < self.auto_hnsw_max:
+            return HNSW
+        return IVF_FLAT
+
+    def nlist_for(self, n_vectors: int) -> int:
+        if self.ivf_nlist:
+            nlist = self.ivf_nlist
+        else:
+            nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+        # faiss wants ~39 training points per centroid
+        return max(1, min(nlist, n_vectors // 39 or 1))
+
+
+def sub_indexes(index: faiss.Index) -> List[Tuple[int, faiss.Index]]:
+    """
+    (first position, index) parts of a store: the base index plus its
+    append-only segments when loaded as an IndexShards, else just the index.
+    """
+    if not isinstance(index, faiss.IndexShards):
+        return [(0, index)]
+    parts, offset = [], 0
+    for i in range(index.count()):
+        sub = faiss.downcast_index(index.at(i))
+        parts.append((offset, sub))
+        offset += sub.ntotal
+    return parts
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexShards):
+        return index_type_of(sub_indexes(index)[0][1])
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVF):
+        return IVF_FLAT
+    return FLAT
+
+
+def tune_index(index: faiss.Index, settings: IndexSettings) -> faiss.Index:
+    """Apply search-time knobs (nprobe / efSearch); no-op for flat indexes."""
+    if isinstance(index, faiss.IndexShards):
+        for _, sub in sub_indexes(index):
+            tune_index(sub, settings)
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = settings.ivf_nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.hnsw_ef_search
+    return index
+
+
+def build_index(
+    vectors: np.ndarray, settings: IndexSettings, index_type: Optional[str] = None
+) -> faiss.Index:
+    """
+    Create an empty index for vectors.shape[1] dimensions, trained on a
+    sample of `vectors` when the type needs training (IVF). Vectors are
+    not added.
+    """
+    n, dim = vectors.shape
+    index_type = index_type or settings.resolve_type(n)
+    started = time.perf_counter()
+    if index_type == FLAT:
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == HNSW:
+        index = faiss.IndexHNSWFlat(dim, settings.hnsw_m)
+        index.hnsw.efConstruction = settings.hnsw_ef_construction
+    elif index_type == IVF_FLAT:
+        nlist = settings.nlist_for(n)
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist, faiss.METRIC_L2)
+        sample = vectors
+        if n > settings.ivf_train_size:
+            rows = np.random.default_rng(0).choice(n, settings.ivf_train_size, replace=False)
+            sample = vectors[rows]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'")
+    tune_index(index, settings)
+    log.info(
+        "FAISS index built",
+        index_type=index_type,
+        vectors=n,
+        dim=dim,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return index
+
+
+def all_vectors(index: faiss.Index) -> np.ndarray:
+    """Every stored vector in id order (Flat, HNSW-Flat, IVF-Flat and segmented stores)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexShards):
+        return np.vstack([all_vectors(sub) for _, sub in sub_indexes(index)])
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_positions(index: faiss.Index, positions: Sequence[int]) -> np.ndarray:
+    """Stored vectors for the given positions, in that order."""
+    out = np.zeros((len(positions), index.d), dtype=np.float32)
+    if not len(positions):
+        return out
+    wanted = np.asarray(positions, dtype=np.int64)
+    for offset, sub in sub_indexes(index):
+        mask = (wanted >= offset) & (wanted < offset + sub.ntotal)
+        if not mask.any():
+            continue
+        if isinstance(sub, faiss.IndexIVF) and sub.direct_map.type == faiss.DirectMap.NoMap:
+            sub.make_direct_map()
+        out[mask] = sub.reconstruct_batch(wanted[mask] - offset)
+    return out
+
+
+def _search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    # Per-call params replace the index's own knobs, so carry the tuned ones over
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_subset(
+    index: faiss.Index, query: np.ndarray, k: int, positions: Sequence[int], exact_max: int = 2048
+) -> List[Tuple[float, int]]:
+    """
+    Top-k (L2 distance, position) among the given positions only. Small
+    selections are scanned exactly; larger ones search each base/segment
+    part with an IDSelector, so filtering happens inside FAISS instead of
+    after a global top-k.
+    """
+    wanted = np.unique(np.asarray(positions, dtype=np.int64))
+    query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+    if k <= 0 or not len(wanted):
+        return []
+    if len(wanted) <= exact_max:
+        dists = ((reconstruct_positions(index, wanted) - query) ** 2).sum(axis=1)
+        order = np.argsort(dists, kind="stable")[:k]
+        return [(float(dists[i]), int(wanted[i])) for i in order]
+
+    found: List[Tuple[float, int]] = []
+    for offset, sub in sub_indexes(index):
+        local = wanted[(wanted >= offset) & (wanted < offset + sub.ntotal)] - offset
+        if not len(local):
+            continue
+        selector = faiss.IDSelectorBatch(local)
+        dists, ids = sub.search(query, min(k, len(local)), params=_search_params(sub, selector))
+        found += [(float(d), int(i) + offset) for d, i in zip(dists[0], ids[0]) if i >= 0]
+    found.sort()
+    return found[:k]
+
+
+def _ivf_outgrown(index: faiss.Index, n_vectors: int, settings: IndexSettings) -> bool:
+    """
+    True for an IVF index whose nlist was capped by a small training set
+    (~39 points per centroid) and that now warrants at least twice the lists.
+    """
+    ivf = sub_indexes(index)[0][1]
+    return isinstance(ivf, faiss.IndexIVF) and settings.nlist_for(n_vectors) >= 2 * ivf.nlist
+
+
+def migrate_index(
+    index: faiss.Index, new_vectors: np.ndarray, settings: IndexSettings
+) -> Optional[faiss.Index]:
+    """
+    When the policy calls for a bigger index type once new_vectors are
+    added, or an IVF index has outgrown the lists it was trained with,
+    return a replacement index holding the existing vectors in the same id
+    order (so the docstore mapping stays valid). Otherwise None.
+    """
+    current = index_type_of(index)
+    n_vectors = index.ntotal + len(new_vectors)
+    target = settings.resolve_type(n_vectors)
+    if settings.type == AUTO:
+        needed = _RANK[target] > _RANK[current]
+    else:
+        needed = target != current
+    retrain = not needed and target == IVF_FLAT and _ivf_outgrown(index, n_vectors, settings)
+    if not (needed or retrain):
+        return None
+    existing = all_vectors(index)
+    replacement = build_index(np.vstack([existing, new_vectors]), settings, target)
+    if len(existing):
+        replacement.add(existing)
+    log.info(
+        "FAISS index migrated",
+        from_type=current,
+        to_type=target,
+        retrained=retrain,
+        vectors=len(existing),
+    )
+    return replacement
+
+
+if __name__ == "__main__":
+    # Recall-vs-latency report against the flat baseline on a synthetic corpus:
+    #   python -m utils.index_factory [n_vectors] [dim]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    n_queries, k = 500, 10
+
+    # Clustered data behaves more like real embeddings than uniform noise
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(max(n // 500, 8), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.normal(
+        size=(n, dim)
+    ).astype(np.float32)
+    queries = data[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.normal(
+        size=(n_queries, dim)
+    ).astype(np.float32)
+
+    def run(name: str, index: faiss.Index, build_s: float, truth=None):
+        started = time.perf_counter()
+        _, ids = index.search(queries, k)
+        ms = (time.perf_counter() - started) * 1000 / n_queries
+        recall = (
+            1.0
+            if truth is None
+            else float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, truth)]))
+        )
+        print(f"{name:28s} build={build_s:7.2f}s  {ms:7.3f} ms/query  recall@{k}={recall:.3f}")
+        return ids
+
+    print(f"corpus: {n} x {dim}, {n_queries} queries, k={k}")
+    base = IndexSettings()
+
+    started = time.perf_counter()
+    flat = build_index(data, base, FLAT)
+    flat.add(data)
+    truth = run("flat", flat, time.perf_counter() - started)
+
+    for m in (16, 32):
+        settings = IndexSettings(hnsw_m=m)
+        started = time.perf_counter()
+        hnsw = build_index(data, settings, HNSW)
+        hnsw.add(data)
+        build_s = time.perf_counter() - started
+        for ef in (16, 32, 64, 128, 256):
+            hnsw.hnsw.efSearch = ef
+            run(f"hnsw M={m} efSearch={ef}", hnsw, build_s, truth)
+
+    settings = IndexSettings()
+    started = time.perf_counter()
+    ivf = build_index(data, settings, IVF_FLAT)
+    ivf.add(data)
+    build_s = time.perf_counter() - started
+    for nprobe in (1, 4, 8, 16, 32, 64):
+        ivf.nprobe = nprobe
+        run(f"ivf nlist={ivf.nlist} nprobe={nprobe}", ivf, build_s, truth)
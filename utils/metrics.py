@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from utils.llm_utils import count_tokens
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: sub-millisecond cache hits up to multi-minute ingestion stages
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Runnable metadata key naming an LLM call in metrics (see llm_call)
+LLM_CALL_KEY = "llm_call"
+
+# (labels, value) pairs of one metric family, as returned by collectors
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _HistogramChild:
+    """One label combination: per-bucket counts plus sum, updated under a lock."""
+
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        """The child for these label values (positional, in labelnames order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip((*self.bounds, math.inf), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process metric families plus collectors that read existing stats
+    (e.g. cache hit counters) at scrape time. Values are per worker process,
+    like the stats endpoints.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args: Any, **kwargs: Any):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = cls(name, *args, **kwargs)
+            elif not isinstance(family, cls):
+                raise ValueError(f"Metric {name} already registered as a {family.kind}")
+            return family
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def register_collector(self, key: str, collect: Callable[[], Iterable[Tuple[str, str, str, Samples]]]):
+        """collect() yields (name, type, help, samples); re-registering a key replaces it."""
+        with self._lock:
+            self._collectors[key] = collect
+
+    def render(self) -> str:
+        with self._lock:
+            families = list(self._families.values())
+            collectors = list(self._collectors.values())
+        lines: List[str] = []
+        for family in families:
+            lines += family.render()
+        for collect in collectors:
+            for name, kind, help, samples in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """The process-wide metrics registry served by /metrics."""
+    return _registry
+
+
+STAGE_SECONDS = _registry.histogram(
+    "document_portal_stage_seconds",
+    "Wall time of a pipeline stage (ingestion, FAISS I/O, retrieval).",
+    ["stage"],
+)
+STAGE_ERRORS = _registry.counter(
+    "document_portal_stage_errors_total", "Pipeline stages that raised.", ["stage"]
+)
+LLM_SECONDS = _registry.histogram(
+    "document_portal_llm_seconds", "LLM call latency.", ["model", "call"]
+)
+LLM_TOKENS = _registry.histogram(
+    "document_portal_llm_tokens",
+    "Tokens per LLM call (kind=prompt|completion); provider-reported, else estimated.",
+    ["model", "call", "kind"],
+    buckets=TOKEN_BUCKETS,
+)
+LLM_ERRORS = _registry.counter(
+    "document_portal_llm_errors_total", "LLM calls that raised.", ["model", "call"]
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration the caller already measured."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+class timed:
+    """
+    Time a stage into document_portal_stage_seconds, as a context manager
+    (``with timed("split"): ...``) or a decorator (``@timed("split")``).
+    Failed stages are timed too and also counted in stage_errors_total.
+    """
+
+    __slots__ = ("stage", "_started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started = 0.0
+
+    def __enter__(self) -> "timed":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        STAGE_SECONDS.labels(self.stage).observe(time.perf_counter() - self._started)
+        if exc_type is not None:
+            STAGE_ERRORS.labels(self.stage).inc()
+
+    def __call__(self, fn: Callable) -> Callable:
+        stage = self.stage
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any):
+            # A fresh timer per call, so concurrent calls never share a start time
+            with timed(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+def llm_call(llm: Any, name: str) -> Any:
+    """The LLM bound with a call name, so LLMMetrics can label its calls."""
+    return llm.with_config(metadata={LLM_CALL_KEY: name})
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """
+    Callback attached to each pooled chat client: records call latency and
+    prompt/completion tokens, labelled by model and by the llm_call name
+    from run metadata ("other" when unnamed). Token counts come from the
+    provider's usage report; streamed calls without one are estimated.
+    """
+
+    run_inline = True  # cheap bookkeeping: no executor hop for async runs
+
+    def __init__(self, model: str):
+        self.model = model
+        self._runs: Dict[UUID, Tuple[float, str, Any]] = {}
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]], prompt: Any) -> None:
+        call = str((metadata or {}).get(LLM_CALL_KEY, "other"))
+        self._runs[run_id] = (time.perf_counter(), call, prompt)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, metadata, messages)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, metadata, prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, call, prompt = run
+        LLM_SECONDS.labels(self.model, call).observe(time.perf_counter() - started)
+        prompt_tokens, completion_tokens = _usage(response)
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(_text(prompt))
+        if completion_tokens is None:
+            completion_tokens = count_tokens(
+                "".join(g.text for gens in response.generations for g in gens)
+            )
+        LLM_TOKENS.labels(self.model, call, "prompt").observe(prompt_tokens)
+        LLM_TOKENS.labels(self.model, call, "completion").observe(completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            LLM_SECONDS.labels(self.model, run[1]).observe(time.perf_counter() - run[0])
+            LLM_ERRORS.labels(self.model, run[1]).inc()
+
+
+def _usage(response: LLMResult) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt, completion) tokens reported by the provider, if any."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if "prompt_tokens" in usage:
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    for gens in response.generations:
+        for g in gens:
+            meta = getattr(getattr(g, "message", None), "usage_metadata", None)
+            if meta:
+                return meta.get("input_tokens"), meta.get("output_tokens")
+    return None, None
+
+
+def _text(prompt: Any) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(_text(p) for p in prompt)
+    return str(getattr(prompt, "content", prompt))
+
+
+if __name__ == "__main__":
+    # Per-observation overhead and a sample of the exposition output:
+    #   python -m utils.metrics [n]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    started = time.perf_counter()
+    for i in range(n):
+        observe_stage("bench", (i % 1000) / 1000)
+    print(f"observe_stage: {(time.perf_counter() - started) * 1e6 / n:.2f} us/call")
+
+    @timed("bench_decorated")
+    def noop():
+        pass
+
+    started = time.perf_counter()
+    for _ in range(n):
+        noop()
+    print(f"@timed:        {(time.perf_counter() - started) * 1e6 / n:.2f} us/call")
+
+    started = time.perf_counter()
+    text = get_metrics().render()
+    print(f"render:        {(time.perf_counter() - started) * 1000:.2f} ms, {len(text)} bytes")
+    print("\n".join(text.splitlines()[:8]))
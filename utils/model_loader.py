@@ -1,7 +1,16 @@
+import asyncio
 import os
 import sys
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
 from dotenv import load_dotenv
 from utils.config_loader import load_config
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore, store_dir_for
+from utils.metrics import LLMMetrics
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 
@@ -74,80 +83,346 @@ logger = CustomLogger().get_logger(name=__name__)
 #         return llm
 
 
-class ModelLoader:
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
     """
-    A utility class to load embedding models and LLM models
+    Async transport keeping one connection pool per event loop. Async
+    connections are bound to the loop that opened them, and the shared
+    clients are awaited from more than one loop (request handlers, the
+    embedding pipeline's background loop).
     """
 
-    def __init__(self):
-        load_dotenv()
-        self._validate_env()
-        self.config = load_config()
-        logger.info(
-            f"Configuration loader successfully. Keys: {list(self.config.keys())}"
+    def __init__(self, **pool_kwargs: Any):
+        self._pool_kwargs = pool_kwargs
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (
+            weakref.WeakKeyDictionary()
         )
+        self._lock = threading.Lock()
+
+    def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pool = self._pools.get(loop)
+            if pool is None:
+                pool = self._pools[loop] = httpx.AsyncHTTPTransport(**self._pool_kwargs)
+        return pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # Only the calling loop's pool can be closed here; the rest go with their loops
+        with self._lock:
+            pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.aclose()
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe registry of configuration and model clients.
+
+    The config is parsed once and only re-read through reload(). Embedding and
+    chat clients are created once per provider/config key and share a pooled
+    keep-alive HTTP client, so request handlers never pay client setup.
+    """
 
-    def _validate_env(self):
+    def __init__(self, config_path: str = "config/config.yaml"):
+        self.config_path = config_path
+        self._lock = threading.RLock()
+        self._config: Optional[Dict[str, Any]] = None
+        self._env_validated = False
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self._embeddings: Dict[Tuple, Any] = {}
+        self._llms: Dict[Tuple, Any] = {}
+
+    # ---------- Config ----------
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    load_dotenv()
+                    self._config = load_config(self.config_path)
+                    logger.info(
+                        f"Configuration loaded once. Keys: {list(self._config.keys())}"
+                    )
+        return self._config
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        Re-read .env + config and drop cached clients so they are rebuilt
+        with the new settings on next use.
+        """
+        with self._lock:
+            self._drop_clients()
+            self._config = None
+            self._env_validated = False
+            load_dotenv(override=True)
+            config = self.config
+            self.validate_env()
+            logger.info("Model registry reloaded")
+            return config
+
+    def validate_env(self) -> Dict[str, Optional[str]]:
         """
         Validate necessary environment variables.
         Ensure API keys are present.
         """
         required_vars = ["OPENAI_API_KEY"]
-        self.api_keys = {key: os.getenv(key) for key in required_vars}
-        missing = [k for k, v in self.api_keys.items() if not v]
+        api_keys = {key: os.getenv(key) for key in required_vars}
+        if self._env_validated:
+            return api_keys
+
+        _ = self.config  # make sure .env has been loaded
+        api_keys = {key: os.getenv(key) for key in required_vars}
+        missing = [k for k, v in api_keys.items() if not v]
 
         if missing:
             logger.error(f"Missing environment variables: {missing}")
             raise DocumentPortalException("Missing environment variables", sys)
 
-        available_keys = [k for k in self.api_keys if self.api_keys[k]]
+        available_keys = [k for k in api_keys if api_keys[k]]
         logger.info(
             f"Environment variables validated. Available keys: {available_keys}"
         )
+        self._env_validated = True
+        return api_keys
 
-    def load_embeddings(self):
+    # ---------- Clients ----------
+
+    def _http_limits(self) -> Tuple[httpx.Limits, float]:
+        http_cfg = self.config.get("http_client", {}) or {}
+        limits = httpx.Limits(
+            max_connections=http_cfg.get("max_connections", 100),
+            max_keepalive_connections=http_cfg.get("max_keepalive_connections", 20),
+            keepalive_expiry=http_cfg.get("keepalive_expiry", 60),
+        )
+        return limits, http_cfg.get("timeout", 60)
+
+    def _get_http_client(self) -> httpx.Client:
+        """Shared keep-alive connection pool used by every OpenAI client."""
+        if self._http_client is None:
+            limits, timeout = self._http_limits()
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+        return self._http_client
+
+    def _get_async_http_client(self) -> httpx.AsyncClient:
+        """Async counterpart of _get_http_client, pooled per event loop."""
+        if self._async_http_client is None:
+            limits, timeout = self._http_limits()
+            self._async_http_client = httpx.AsyncClient(
+                transport=_LoopLocalTransport(limits=limits), timeout=timeout
+            )
+        return self._async_http_client
+
+    def _embeddings_key(self, cached: Optional[bool] = None) -> Tuple:
+        emb_config = self.config["embedding_model"]
+        if cached is None:
+            cache_cfg = self.config.get("embedding_cache", {}) or {}
+            cached = bool(cache_cfg.get("enabled", False))
+        return (emb_config.get("provider", "openai"), emb_config["model_name"], cached)
+
+    def built_embeddings(self, cached: Optional[bool] = None):
         """
-        Load and return the embedding model
+        The embedding client get_embeddings() would return if it has already
+        been built, else None. Never creates a client (for metrics scrapes).
         """
-        try:
-            logger.info("Loading embedding model...")
-            model_name = self.config["embedding_model"]["model_name"]
-            return OpenAIEmbeddings(model=model_name)
-        except Exception as e:
-            logger.error(f"Error loading embedding model: {str(e)}")
-            raise DocumentPortalException("Error loading embedding model", sys)
+        return self._embeddings.get(self._embeddings_key(cached))
 
-    def load_llm(self):
+    def get_embeddings(self, cached: Optional[bool] = None):
         """
-        Load and return the LLM model.
-        Load LLM dynamically based on provider in config.
+        Return the shared embedding client for the configured model.
+        With cached=True (default: embedding_cache.enabled in config) the
+        client is wrapped in a persistent content-addressed embedding cache.
+        """
+        emb_config = self.config["embedding_model"]
+        model_name = emb_config["model_name"]
+        cache_cfg = self.config.get("embedding_cache", {}) or {}
+        key = self._embeddings_key(cached)
+        cached = key[-1]
+
+        embeddings = self._embeddings.get(key)
+        if embeddings is not None:
+            return embeddings
+
+        with self._lock:
+            embeddings = self._embeddings.get(key)
+            if embeddings is None:
+                self.validate_env()
+                try:
+                    if cached:
+                        embeddings = CachedEmbeddings(
+                            self.get_embeddings(cached=False),
+                            model_name=model_name,
+                            store=EmbeddingStore(
+                                store_dir_for(
+                                    cache_cfg.get("path", "data/embedding_cache"),
+                                    model_name,
+                                ),
+                                max_entries=cache_cfg.get("max_entries", 200_000),
+                                touch_interval=cache_cfg.get("touch_interval_s", 30),
+                            ),
+                        )
+                    else:
+                        logger.info(f"Creating embedding client - Model: {model_name}")
+                        extra: Dict[str, Any] = {}
+                        if emb_config.get("base_url"):
+                            # e.g. a local stub server for load tests
+                            extra["base_url"] = emb_config["base_url"]
+                        embeddings = OpenAIEmbeddings(
+                            model=model_name,
+                            http_client=self._get_http_client(),
+                            http_async_client=self._get_async_http_client(),
+                            **extra,
+                        )
+                except Exception as e:
+                    logger.error(f"Error loading embedding model: {str(e)}")
+                    raise DocumentPortalException("Error loading embedding model", sys)
+                self._embeddings[key] = embeddings
+        return embeddings
+
+    def llm_config(self, provider_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return the llm config block entry for a provider key
+        (default: LLM_PROVIDER env var, else "openai").
         """
         llm_block = self.config["llm"]
-        provider_key = os.getenv("LLM_PROVIDER", "openai")
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "openai")
 
         if provider_key not in llm_block:
             logger.error(f"LLM Provider '{provider_key}' not found in config.")
             raise ValueError(f"Provider '{provider_key}' not found in config")
 
-        llm_config = llm_block[provider_key]
+        return llm_block[provider_key]
+
+    def get_llm(self, provider_key: Optional[str] = None):
+        """
+        Return the shared chat client for a provider key in the llm config block.
+        """
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "openai")
+        llm_config = self.llm_config(provider_key)
         provider = llm_config.get("provider")
         model_name = llm_config.get("model_name")
         temperature = llm_config.get("temperature", 0.2)
         max_tokens = llm_config.get("max_output_tokens", 2048)
+        key = (provider_key, provider, model_name, temperature, max_tokens)
+
+        llm = self._llms.get(key)
+        if llm is not None:
+            return llm
+
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                self.validate_env()
+                logger.info(
+                    f"Creating LLM client - Provider: {provider}, Model: {model_name}, "
+                    f"Temperature: {temperature}, Max Tokens: {max_tokens}"
+                )
+                extra: Dict[str, Any] = {}
+                if provider == "openai":
+                    extra["http_client"] = self._get_http_client()
+                    extra["http_async_client"] = self._get_async_http_client()
+                llm = init_chat_model(
+                    model_name,
+                    model_provider=provider,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    callbacks=[LLMMetrics(model_name)],
+                    **extra,
+                )
+                self._llms[key] = llm
+        return llm
 
+    def warm_up(self):
+        """
+        Parse config, validate env and build the default clients up front.
+        Set http_client.prewarm_connections to also open the pooled connections.
+        """
+        started = time.perf_counter()
+        self.validate_env()
+        embeddings = self.get_embeddings()
+        self.get_llm()
+        if (self.config.get("http_client", {}) or {}).get("prewarm_connections"):
+            try:
+                embeddings.embed_query("warm-up")
+            except Exception as e:
+                logger.warning(f"Connection pre-warm failed: {e}")
         logger.info(
-            f"Loading LLM - Provider: {provider}, Model: {model_name}, "
-            f"Temperature: {temperature}, Max Tokens: {max_tokens}"
+            f"Model registry warmed up in {time.perf_counter() - started:.3f}s"
         )
 
-        llm = init_chat_model(
-            model_name,
-            model_provider=provider,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+    def _drop_clients(self):
+        """
+        Forget the pooled clients so they are rebuilt on next use. Objects
+        still holding the old ones (cached vectorstores, in-flight requests)
+        keep working: the old HTTP pools are left to garbage collection instead
+        of being closed, and a dropped embedding cache becomes a pass-through.
+        """
+        for embeddings in self._embeddings.values():
+            if isinstance(embeddings, CachedEmbeddings):
+                embeddings.store.close()
+        self._embeddings.clear()
+        self._llms.clear()
+        self._http_client = None
+        self._async_http_client = None
+
+    def close(self):
+        """Shutdown: drop the clients and close the shared HTTP pool."""
+        with self._lock:
+            http_client = self._http_client
+            self._drop_clients()
+            if http_client is not None:
+                http_client.close()
+
+    async def aclose(self):
+        """close(), plus the calling event loop's async pool (app shutdown)."""
+        async_http_client = self._async_http_client
+        self.close()
+        if async_http_client is not None:
+            await async_http_client.aclose()
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide ModelRegistry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
 
-        return llm
+
+class ModelLoader:
+    """
+    A utility class to load embedding models and LLM models.
+    Thin facade over the shared ModelRegistry; constructing it is cheap.
+    """
+
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        self.registry = registry or get_model_registry()
+        self.config = self.registry.config
+        self.api_keys = self.registry.validate_env()
+
+    def load_embeddings(self, cached: Optional[bool] = None):
+        """
+        Load and return the embedding model.
+        cached=True returns the persistent caching wrapper (see utils.embedding_cache).
+        """
+        return self.registry.get_embeddings(cached=cached)
+
+    def load_llm(self, provider_key: Optional[str] = None):
+        """
+        Load and return the LLM model.
+        Load LLM dynamically based on provider in config.
+        """
+        return self.registry.get_llm(provider_key)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.model_loader import get_model_registry
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def prompt_version(prompt: Any) -> str:
+    """
+    Version stamp of a prompt template from PROMPT_REGISTRY: a hash of its
+    serialized form, so any edit to the template text or variables changes it.
+    """
+    try:
+        payload = json.dumps(prompt.to_json(), sort_keys=True, default=str)
+    except Exception:
+        payload = repr(prompt)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def result_key(
+    kind: str,
+    text: str,
+    prompt: Any,
+    model_config: Dict[str, Any],
+    extra: str = "",
+) -> str:
+    """
+    Cache key for one LLM result: task kind + content hash of the input text
+    + prompt version + model config (+ anything else that shapes the output,
+    e.g. format instructions).
+    """
+    parts = [
+        kind,
+        text_hash(text),
+        prompt_version(prompt),
+        json.dumps(model_config, sort_keys=True, default=str),
+        text_hash(extra),
+    ]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent, size-bounded cache of LLM results backed by SQLite (WAL).
+
+    Every uvicorn worker opens its own connection to the same database file,
+    so a result computed by one worker is served by all of them. Entries are
+    JSON values; once max_entries or max_bytes is exceeded the least
+    recently used rows are deleted. Hits never take the write lock: access
+    times are buffered and written on the next put, or every touch_interval
+    seconds.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 10_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        touch_interval: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                nbytes INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_access ON results(last_access);
+            """
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+
+    def _flush_touches(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE results SET last_access = ? WHERE key = ?",
+                [(t, k) for k, t in self._touched.items()],
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if time.monotonic() - self._last_flush >= self.touch_interval:
+                self._flush_touches()
+                self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, kind: str, value: Any):
+        payload = json.dumps(value, default=str)
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._flush_touches()  # so eviction sees recent hits
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results(key, kind, value, nbytes, created, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, kind, payload, len(payload), now, now),
+                )
+                self._evict()
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+    def _evict(self):
+        count, nbytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results"
+        ).fetchone()
+        evicted = 0
+        while count > self.max_entries or (nbytes > self.max_bytes and count > 1):
+            key, size = self._db.execute(
+                "SELECT key, nbytes FROM results ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            count -= 1
+            nbytes -= size
+            evicted += 1
+        if evicted:
+            log.info("Result cache evicted entries", evicted=evicted)
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, nbytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            # hits/misses are per worker; entries/bytes are shared
+            return {
+                "entries": count,
+                "bytes": nbytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Return the process-wide ResultCache configured from the result_cache
+    config section, or None when it is disabled.
+    """
+    global _cache
+    cfg = get_model_registry().config.get("result_cache", {}) or {}
+    if not cfg.get("enabled", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_mb = cfg.get("max_mb", 256)
+                _cache = ResultCache(
+                    cfg.get("path", "data/result_cache/results.sqlite"),
+                    max_entries=cfg.get("max_entries", 10_000),
+                    max_bytes=int(max_mb * 1024 * 1024),
+                    touch_interval=cfg.get("touch_interval_s", 30),
+                )
+    return _cache
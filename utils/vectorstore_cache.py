@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.model_loader import get_model_registry
+from utils.faiss_store import store_files
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def index_files(index_dir: str | Path, index_name: str = "index") -> Tuple[Path, ...]:
+    """On-disk files that change whenever a saved FAISS vectorstore is rewritten."""
+    return store_files(index_dir, index_name)
+
+
+def index_version(index_dir: str | Path, index_name: str = "index") -> Tuple[int, ...]:
+    """
+    Cheap version stamp for a saved index: (mtime_ns, size) of each file.
+    Changes whenever save_store() rewrites the index.
+    """
+    stamp = []
+    for f in index_files(index_dir, index_name):
+        st = os.stat(f)
+        stamp.extend((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def index_nbytes(index_dir: str | Path, index_name: str = "index") -> int:
+    """Approximate resident size of a loaded index from its on-disk size."""
+    return sum(f.stat().st_size for f in index_files(index_dir, index_name))
+
+
+class VectorStoreCache:
+    """
+    In-process LRU cache of loaded FAISS vectorstores.
+
+    Entries are keyed by (index dir, index name) and stamped with the on-disk
+    version, so a rewritten index is reloaded instead of served stale. The
+    total estimated size is bounded by max_bytes; least recently used
+    entries are evicted first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(index_dir: str | Path, index_name: str) -> Tuple[str, str]:
+        return (str(Path(index_dir).resolve()), index_name)
+
+    def get(
+        self,
+        index_dir: str | Path,
+        loader: Callable[[], Any],
+        index_name: str = "index",
+    ):
+        """
+        Return the cached vectorstore for index_dir, calling loader() on a miss
+        or when the index on disk has changed since it was cached.
+        """
+        key = self._key(index_dir, index_name)
+        version = index_version(index_dir, index_name)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["vs"]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["version"] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["vs"]
+                self.misses += 1
+
+            vs = loader()
+            self._store(key, vs, version, index_nbytes(index_dir, index_name))
+            log.info(
+                "Vectorstore cached",
+                index_dir=key[0],
+                index_name=index_name,
+                cached_bytes=self._bytes,
+            )
+            return vs
+
+    def put(self, index_dir: str | Path, vs: Any, index_name: str = "index"):
+        """Insert a freshly built vectorstore that has already been saved to disk."""
+        key = self._key(index_dir, index_name)
+        self._store(
+            key,
+            vs,
+            index_version(index_dir, index_name),
+            index_nbytes(index_dir, index_name),
+        )
+
+    def invalidate(self, index_dir: str | Path, index_name: str = "index"):
+        key = self._key(index_dir, index_name)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry["nbytes"]
+
+    def clear(self) -> int:
+        """Drop every entry (e.g. after a config reload swaps the embedding client)."""
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        return dropped
+
+    def _store(self, key: Tuple[str, str], vs: Any, version: Tuple[int, ...], nbytes: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old["nbytes"]
+            if nbytes > self.max_bytes:
+                log.warning(
+                    "Vectorstore larger than cache budget, not cached",
+                    index_dir=key[0],
+                    nbytes=nbytes,
+                    max_bytes=self.max_bytes,
+                )
+                return
+            self._entries[key] = {"vs": vs, "version": version, "nbytes": nbytes}
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["nbytes"]
+                self.evictions += 1
+                log.info("Vectorstore evicted", index_dir=evicted_key[0])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache: Optional[VectorStoreCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_vectorstore_cache() -> VectorStoreCache:
+    """Return the process-wide VectorStoreCache sized from config."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cfg = get_model_registry().config.get("vectorstore_cache") or {}
+                max_mb = cfg.get("max_memory_mb")
+                max_bytes = int(max_mb * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+                _cache = VectorStoreCache(max_bytes=max_bytes)
+    return _cache